@@ -0,0 +1,122 @@
+import calendar
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from history import MAX_LIMIT, is_iso_date
+
+# Adaptive polling schedule for the scheduled poller.
+#
+# BERA changes prices every few weeks, usually effective around the start of
+# a month, so polling every 15 minutes around the clock is mostly wasted
+# fetches. The poller is still triggered at a fixed rate, but each trigger
+# first asks the schedule whether a poll is due. Polls are due every
+# `base_interval` inside a "hot" window:
+#
+#   - the last/first `boundary_days` days of a month,
+#   - `lead_days` before the next change expected from the history's typical
+#     gap between effective dates, and before days of the month on which
+#     changes have repeatedly taken effect,
+#   - `after_change` seconds after the listing page or the prices changed.
+#
+# Outside them the interval doubles with every poll that finds nothing new,
+# up to `max_interval`, but never skips past the start of the next window.
+#
+# The schedule's state is a plain dict, stored next to the price snapshot. It
+# also keeps the last MAX_CHANGE_DATES effective dates, so the cadence
+# survives a history store that is local to the container.
+
+STATE_KEY = "poll-schedule"
+MAX_CHANGE_DATES = 24
+
+
+def change_dates(store, pages=20):
+    """Distinct effective dates in the history store, oldest first. Only dates
+    read from the announcements count: undated rows are not changes"""
+    dates, cursor = set(), None
+    for _ in range(pages):
+        page = store.query(limit=MAX_LIMIT, cursor=cursor)
+        dates.update(item["effectiveDate"] for item in page["items"]
+                     if item["effectiveDate"] and is_iso_date(item["effectiveDate"]))
+        cursor = page["nextCursor"]
+        if not cursor:
+            break
+    return sorted(dates)
+
+
+class Cadence:
+    """What the history says about when prices change"""
+
+    def __init__(self, dates=()):
+        days = [date.fromisoformat(d) for d in sorted(set(dates))]
+        gaps = sorted((b - a).days for a, b in zip(days, days[1:]))
+        self.last_change = days[-1] if days else None
+        # Median, so one skipped month does not stretch the estimate
+        self.typical_gap = gaps[len(gaps) // 2] if gaps else None
+        # Days of the month that more than one change took effect on
+        self.days_of_month = sorted({d.day for d in days if sum(1 for e in days if e.day == d.day) > 1})
+
+    def expected_change(self):
+        """Date the next change is expected to take effect, or None without enough history"""
+        if self.last_change is None or not self.typical_gap:
+            return None
+        return self.last_change + timedelta(days=self.typical_gap)
+
+
+class AdaptiveSchedule:
+    """Decide when the next poll is due from the cadence and recent poll outcomes"""
+
+    def __init__(self, base_interval=900, max_interval=6 * 3600, backoff=2.0, boundary_days=2,
+                 lead_days=3, after_change=6 * 3600, clock=time.time):
+        self.base_interval = base_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.boundary_days = boundary_days
+        self.lead_days = lead_days
+        self.after_change = after_change
+        self.clock = clock
+
+    def due(self, state):
+        """Whether a poll should run now"""
+        return self.clock() >= (state or {}).get("nextPollAt", 0)
+
+    def hot_reason(self, now, state, cadence):
+        """Why polls are frequent at `now`, or None outside every change window"""
+        changed_at = max((state or {}).get("listingChangedAt") or 0, (state or {}).get("lastChangeAt") or 0)
+        if now - changed_at < self.after_change:
+            return "recent-change"
+        today = datetime.fromtimestamp(now, timezone.utc).date()
+        month_days = calendar.monthrange(today.year, today.month)[1]
+        if today.day <= self.boundary_days or today.day > month_days - self.boundary_days:
+            return "month-boundary"
+        expected = cadence.expected_change()
+        if expected and expected - timedelta(days=self.lead_days) <= today <= expected + timedelta(days=1):
+            return "expected-change"
+        for day in cadence.days_of_month:
+            if 0 <= day - today.day <= self.lead_days:
+                return "usual-day"
+        return None
+
+    def after_poll(self, state, cadence, changed=False, listing_changed=False):
+        """New state after a poll: when it ran, what it found and when the next one is due"""
+        now = self.clock()
+        state = dict(state or {})
+        if changed:
+            state["lastChangeAt"] = now
+        if listing_changed:
+            state["listingChangedAt"] = now
+        state["misses"] = 0 if changed or listing_changed else state.get("misses", 0) + 1
+        state["lastPollAt"] = now
+
+        reason = self.hot_reason(now, state, cadence)
+        if reason:
+            interval = self.base_interval
+        else:
+            interval = min(self.max_interval, self.base_interval * self.backoff ** state["misses"])
+            # Wake up when the next change window opens rather than sleeping through it
+            step = self.base_interval
+            while step < interval and not self.hot_reason(now + step, state, cadence):
+                step += self.base_interval
+            interval = min(interval, step)
+        state["reason"] = reason or "backoff"
+        state["nextPollAt"] = now + interval
+        return state
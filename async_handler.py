@@ -0,0 +1,287 @@
+import asyncio
+import threading
+import time
+
+import handler
+import timing
+from breaker import CLOSED
+
+# asyncio version of the scrape pipeline, on aiohttp.
+#
+# Same caches, parsing and responses as handler.py; only the network waits
+# differ. The speculative fetch of last time's announcement runs as a task
+# next to the listing download instead of on a worker thread. fetch_many()
+# runs any number of fetches with bounded concurrency for the backfill, and
+# the poller runs through scrape_prices_async() when ASYNC_PIPELINE is set.
+#
+# Lambda's Python runtime calls handlers synchronously, so get_prices_aio()
+# runs the coroutine on one event loop kept for the life of the container,
+# which lets warm invocations reuse the aiohttp connection pool.
+#
+# Cache misses are coalesced like in handler.py: concurrent misses on the loop
+# await one scrape task, and that task takes the cross-container scrape lease
+# or waits for the snapshot stored by the container holding it.
+
+RETRY_STATUSES = (502, 503, 504)
+
+_session = None
+_session_loop = None
+_loop = None
+_loop_lock = threading.Lock()
+# (loop, listing url) -> the scrape task concurrent cache misses wait for
+_scrapes = {}
+
+
+def get_prices_aio(event, context):
+    """Lambda entry point running the async pipeline"""
+    with timing.trace("get_prices", handler.METRICS_ENABLED) as trace:
+        response = run(serve_prices_async(event))
+        if trace:
+            trace.properties["statusCode"] = response["statusCode"]
+            trace.properties["cacheStatus"] = response["headers"].get("X-Cache-Status", "none")
+            trace.properties["parseMemo"] = handler.parse_memo.stats()
+            if handler.SERVER_TIMING:
+                response["headers"]["Server-Timing"] = trace.server_timing()
+    return response
+
+
+async def get_prices_async(event, context):
+    """Async entry point for callers that already run an event loop"""
+    return await serve_prices_async(event)
+
+
+def run(coroutine):
+    """Run coroutine on the container's long-lived event loop"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+        return _loop.run_until_complete(coroutine)
+
+
+async def serve_prices_async(event):
+    """Answer a /prices request from the cache or a fresh scrape"""
+    try:
+        snapshot, cache_status = handler.price_cache.lookup_snapshot()
+        if handler.SERVE_FROM_STORE:
+            if snapshot:
+                return handler.snapshot_response(snapshot, cache_status, event)
+            return handler.fallback_response(handler.error_response(503, handler.UNAVAILABLE), event)
+        if cache_status == handler.STALE:
+            handler.refresher.trigger(handler.DEFAULT_KEY, handler.refresh_prices)
+        if snapshot:
+            return handler.snapshot_response(snapshot, cache_status, event)
+
+        snapshot, error = await scrape_snapshot_async()
+        if error:
+            # Shared by every coalesced caller, so each gets its own headers
+            return handler.fallback_response(dict(error, headers=dict(error["headers"])), event)
+
+        return handler.snapshot_response(snapshot, handler.REVALIDATED, event)
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return handler.error_response(500, handler.PARSE_FAILED)
+
+
+async def scrape_snapshot_async(listing_url=None):
+    """handler.scrape_snapshot() on the event loop: one scrape for all
+    concurrent cache misses. Returns (snapshot, error_response)"""
+    listing_url = listing_url or handler.BERA_URL
+    key = (asyncio.get_running_loop(), listing_url)
+    task = _scrapes.get(key)
+    if task is None:
+        task = _scrapes[key] = asyncio.ensure_future(scrape_under_lease_async(listing_url))
+        task.add_done_callback(lambda _: _scrapes.pop(key, None))
+    # A caller that gives up must not cancel the scrape the others wait for
+    return await asyncio.shield(task)
+
+
+async def scrape_under_lease_async(listing_url):
+    """handler.scrape_under_lease() without blocking the loop while waiting"""
+    leases = handler.get_lease_store()
+    deadline = time.monotonic() + handler.SCRAPE_LEASE_WAIT
+    waited = False
+    while not handler.acquire_lease(leases):
+        # Another container is scraping: use its snapshot once it is stored
+        waited = True
+        with timing.span("wait_for_lease"):
+            await asyncio.sleep(handler.LEASE_POLL_INTERVAL)
+            snapshot, cache_status = handler.price_cache.lookup_snapshot()
+        if cache_status == handler.FRESH:
+            return snapshot, None
+        if time.monotonic() >= deadline:
+            return None, handler.error_response(503, handler.UNAVAILABLE)
+
+    try:
+        if waited:
+            # The previous holder may have stored a result just before letting go
+            snapshot, cache_status = handler.price_cache.lookup_snapshot()
+            if cache_status == handler.FRESH:
+                return snapshot, None
+        fuel_data, error = await scrape_prices_async(listing_url)
+        if error:
+            return None, error
+        return handler.price_cache.put(fuel_data), None
+    finally:
+        handler.release_lease(leases)
+
+
+async def scrape_prices_async(listing_url=None):
+    """Scrape the latest announcement from BERA. Returns (fuel_data, error_response)"""
+    listing_url = listing_url or handler.BERA_URL
+    session = await get_session_async()
+
+    # 1 + 3. Fetch the listing and, speculatively, last time's announcement
+    listing = asyncio.ensure_future(fetch_conditional_async(session, listing_url))
+    guess = handler.last_announcement_url if handler.SPECULATIVE_PREFETCH else None
+    if guess and handler.breakers.get(guess).state != CLOSED:
+        guess = None
+    speculative = asyncio.ensure_future(fetch_conditional_async(session, guess)) if guess else None
+    try:
+        with timing.span("fetch_listing"):
+            html, not_modified = await listing
+        if not html:
+            return None, handler.error_response(503, handler.UNAVAILABLE)
+
+        # 2. Find fuel price announcement link
+        with timing.span("find_announcement"):
+            announcement_url = handler.parse_once(listing_url, not_modified,
+                                                  lambda: handler.find_fuel_announcement(html, listing_url))
+        if not announcement_url:
+            return None, handler.error_response(500, handler.PARSE_FAILED)
+
+        # 3. Use the speculative fetch if the guess was right, otherwise fetch the new page
+        with timing.span("fetch_announcement"):
+            if speculative and announcement_url == guess:
+                announcement_html, not_modified = await speculative
+                speculative = None
+            else:
+                announcement_html, not_modified = await fetch_conditional_async(session, announcement_url)
+        if not announcement_html:
+            return None, handler.error_response(503, handler.UNAVAILABLE)
+        handler.last_announcement_url = announcement_url
+    finally:
+        if speculative:
+            # The listing moved on: drop the guess without leaving a pending task behind
+            speculative.cancel()
+            await asyncio.gather(speculative, return_exceptions=True)
+
+    # 4. Extract fuel data
+    with timing.span("extract_prices"):
+        fuel_data = handler.parse_once(announcement_url, not_modified,
+                                       lambda: handler.extract_prices(announcement_html, announcement_url))
+    if not fuel_data:
+        return None, handler.error_response(500, handler.PARSE_FAILED)
+
+    # 5. Append to the price history
+    with timing.span("record_history"):
+        handler.record_history(fuel_data)
+
+    return fuel_data, None
+
+
+async def get_session_async():
+    """Return the aiohttp session for the running loop, creating it on first use"""
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        import aiohttp  # only needed by the async pipeline
+        connector = aiohttp.TCPConnector(limit=handler.HTTP_POOL_MAXSIZE)
+        _session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=handler.TIMEOUT),
+            headers={'User-Agent': 'Mozilla/5.0 (compatible; FuelPriceBot/1.0)'})
+        _session_loop = loop
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def fetch_conditional_async(session, url):
+    """Async fetch_conditional: revalidates the copy from the last fetch, retrying
+    connection errors and 502/503/504. Returns (html, not_modified); html is None on failure"""
+    breaker = handler.breakers.get(url)
+    if not breaker.allow():
+        return None, False
+    healthy = None
+    try:
+        healthy, result = await _fetch_with_retries(session, url)
+        return result
+    finally:
+        if healthy is None:
+            breaker.cancel()  # cancelled, e.g. a speculative fetch that was not needed
+        else:
+            breaker.record(healthy)
+
+
+async def _fetch_with_retries(session, url):
+    # Returns (origin_healthy, (html, not_modified))
+    cached = handler.page_validators.get(url)
+    if cached and cached["body"] is None:
+        cached = None
+    for attempt in range(handler.HTTP_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(handler.HTTP_BACKOFF * 2 ** (attempt - 1))
+        try:
+            async with session.get(url, headers=handler.conditional_headers(cached)) as response:
+                if response.status in RETRY_STATUSES and attempt < handler.HTTP_RETRIES:
+                    continue
+                if response.status == 304 and cached:
+                    return True, (cached["body"], True)
+                if response.status >= 400:
+                    return response.status < 500, (None, False)
+                body = await response.read()
+                timing.add_bytes(len(body))
+                html = body.decode(response.charset or 'utf-8', errors='replace')
+
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+                if etag or last_modified:
+                    handler.page_validators.put(url, {"etag": etag, "lastModified": last_modified, "body": html})
+                else:
+                    handler.page_validators.pop(url)
+                return True, (html, False)
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            # Not retried, like read timeouts in handler.get_session()
+            return False, (None, False)
+        except Exception:
+            if attempt == handler.HTTP_RETRIES:
+                return False, (None, False)
+    return False, (None, False)
+
+
+async def fetch_many(urls, concurrency=None, limiter=None):
+    """Fetch urls concurrently, at most `concurrency` at a time and spaced out per
+    host by limiter if given. Returns the html (or None) for each url, in order"""
+    session = await get_session_async()
+    semaphore = asyncio.Semaphore(concurrency or handler.HTTP_POOL_MAXSIZE)
+
+    async def fetch(url):
+        async with semaphore:
+            if limiter:
+                await asyncio.sleep(limiter.reserve(url))
+            html, _ = await fetch_conditional_async(session, url)
+            return html
+
+    return await asyncio.gather(*(fetch(url) for url in urls))
+
+
+async def fetch_announcements_async(urls, concurrency=None, limiter=None):
+    """Fetch and parse announcements concurrently.
+    Returns [(url, fuel_data or None, error or None)] in the order of urls"""
+    pages = await fetch_many(urls, concurrency, limiter)
+    results = []
+    for url, html in zip(urls, pages):
+        if not html:
+            results.append((url, None, "fetch failed"))
+            continue
+        fuel_data = handler.extract_prices(html, url)
+        results.append((url, fuel_data, None) if fuel_data else (url, None, "no prices found"))
+    return results
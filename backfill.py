@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Backfill the price history with every fuel announcement BERA has published.
+
+Walks the paginated press releases listing, collects every fuel price link,
+then fetches and parses the announcements with a small worker pool. Requests
+to each host are spaced out by a shared rate limiter, results are written to
+the history store in batches, and progress is checkpointed to a JSON file so
+an interrupted run picks up where it stopped.
+
+    python backfill.py                               # crawl BERA_URL
+    python backfill.py --workers 4 --rate 2          # 4 workers, 2 requests/s per host
+    python backfill.py --processes 4                 # parse in 4 worker processes
+    python backfill.py --stub                        # against the bundled fixtures
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+import handler
+from batch import extract_prices_batch
+from history import history_rows
+
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 2.0
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_MAX_PAGES = 500
+DEFAULT_CHECKPOINT = os.path.join(tempfile.gettempdir(), "fuel-price-backfill.json")
+
+
+class RateLimiter:
+    """Space out requests to each host by at least 1/rate seconds, across threads"""
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, url):
+        """Claim the next slot for url's host; returns the seconds to wait for it"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            now = self.clock()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        return slot - now
+
+    def wait(self, url):
+        """Block until a request to url's host may be sent"""
+        delay = self.reserve(url)
+        if delay > 0:
+            self.sleep(delay)
+
+
+class ListingParser(HTMLParser):
+    """Collects every fuel price link on a listing page and its next page link"""
+
+    def __init__(self, keywords, base_url):
+        super().__init__(convert_charrefs=True)
+        self.keywords = keywords
+        self.base_url = base_url
+        self.links = []
+        self.next_url = None
+        self._open = None
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            self._check_open_link()
+            attrs = dict(attrs)
+            if attrs.get('href') is not None:
+                self._open = attrs
+                self._text = []
+        elif tag == 'link':
+            attrs = dict(attrs)
+            if self.next_url is None and 'next' in (attrs.get('rel') or '').split() and attrs.get('href'):
+                self.next_url = urljoin(self.base_url, attrs['href'])
+
+    def handle_data(self, data):
+        if self._open is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._check_open_link()
+
+    def close(self):
+        super().close()
+        self._check_open_link()
+
+    def _check_open_link(self):
+        if self._open is None:
+            return
+        href = urljoin(self.base_url, self._open['href'])
+        text = ''.join(self._text).strip().lower()
+        if any(keyword in text for keyword in self.keywords):
+            if href not in self.links:
+                self.links.append(href)
+        elif self.next_url is None and ('next' in (self._open.get('rel') or '').split() or text.startswith('next')):
+            self.next_url = href
+        self._open = None
+
+
+def parse_listing(html, base_url):
+    """Return (fuel announcement links in page order, next listing page or None)"""
+    parser = ListingParser(handler.FUEL_KEYWORDS, base_url)
+    parser.feed(html)
+    parser.close()
+    return parser.links, parser.next_url
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_checkpoint(path, checkpoint):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Same atomic write as the file cache backend
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def new_checkpoint(listing_url):
+    return {"listingUrl": listing_url, "nextPage": listing_url, "pagesVisited": [],
+            "links": [], "done": [], "failed": {}}
+
+
+def fetch_html(url, limiter):
+    """Fetch one page once the rate limiter allows it; None on failure"""
+    limiter.wait(url)
+    return handler.fetch_page(url)
+
+
+def fetch_announcement(url, limiter):
+    """Fetch and parse one announcement. Returns (url, fuel_data or None, error or None)"""
+    html = fetch_html(url, limiter)
+    if not html:
+        return url, None, "fetch failed"
+    fuel_data = handler.extract_prices(html, url)
+    if not fuel_data:
+        return url, None, "no prices found"
+    return url, fuel_data, None
+
+
+class Backfill:
+    """One backfill run: crawl the listing, then fetch announcements in parallel"""
+
+    def __init__(self, listing_url=None, store=None, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+                 batch_size=DEFAULT_BATCH_SIZE, checkpoint_path=DEFAULT_CHECKPOINT,
+                 max_pages=DEFAULT_MAX_PAGES, limiter=None, use_async=False, processes=0):
+        self.listing_url = listing_url or handler.BERA_URL
+        self.store = store
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path
+        self.max_pages = max_pages
+        self.limiter = limiter or RateLimiter(rate)
+        self.use_async = use_async
+        self.processes = processes
+        self.checkpoint = self._resume()
+
+    def _resume(self):
+        checkpoint = load_checkpoint(self.checkpoint_path)
+        if checkpoint and checkpoint.get("listingUrl") == self.listing_url:
+            return checkpoint
+        return new_checkpoint(self.listing_url)
+
+    def save(self):
+        save_checkpoint(self.checkpoint_path, self.checkpoint)
+
+    def crawl_listing(self):
+        """Follow the listing's next links, adding fuel links to the checkpoint"""
+        checkpoint = self.checkpoint
+        while checkpoint["nextPage"] and len(checkpoint["pagesVisited"]) < self.max_pages:
+            page_url = checkpoint["nextPage"]
+            if page_url in checkpoint["pagesVisited"]:
+                checkpoint["nextPage"] = None  # pager loops back on itself
+                break
+            self.limiter.wait(page_url)
+            html = handler.fetch_page(page_url)
+            if not html:
+                print(f"Listing page failed, resume later: {page_url}")
+                return False
+            links, next_url = parse_listing(html, page_url)
+            checkpoint["links"].extend(link for link in links if link not in checkpoint["links"])
+            checkpoint["pagesVisited"].append(page_url)
+            checkpoint["nextPage"] = next_url
+            self.save()
+        return True
+
+    def fetch_announcements(self):
+        """Fetch every announcement not yet done, writing results in batches"""
+        checkpoint = self.checkpoint
+        done = set(checkpoint["done"])
+        pending = [url for url in checkpoint["links"] if url not in done]
+        store = self.store or handler.get_history_store()
+        batch = []
+        recorded = 0
+
+        def flush():
+            nonlocal recorded
+            if not batch:
+                return
+            rows = [row for _, fuel_data in batch for row in history_rows(fuel_data)]
+            recorded += store.record_rows(rows)
+            for url, _ in batch:
+                checkpoint["done"].append(url)
+                checkpoint["failed"].pop(url, None)
+            batch.clear()
+            self.save()
+
+        for url, fuel_data, error in self._results(pending):
+            if fuel_data:
+                batch.append((url, fuel_data))
+                if len(batch) >= self.batch_size:
+                    flush()
+            elif url:
+                checkpoint["failed"][url] = error
+        flush()
+        self.save()
+        return recorded
+
+    def _results(self, pending):
+        """(url, fuel_data, error) for each pending announcement, as they complete"""
+        if self.use_async:
+            import async_handler
+            # One event loop pass per slice, so finished batches still get written as we go
+            step = max(self.batch_size, self.workers)
+            for i in range(0, len(pending), step):
+                yield from async_handler.run(async_handler.fetch_announcements_async(
+                    pending[i:i + step], self.workers, self.limiter))
+            return
+
+        if self.processes:
+            yield from self._parsed_in_processes(pending)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(fetch_announcement, url, self.limiter) for url in pending]
+            for future in as_completed(futures):
+                try:
+                    yield future.result()
+                except Exception as e:
+                    yield None, None, str(e)
+
+    def _parsed_in_processes(self, pending):
+        """Fetch on threads and parse on worker processes, a slice at a time"""
+        from concurrent.futures import ProcessPoolExecutor
+        step = max(self.batch_size, self.workers)
+        with ThreadPoolExecutor(max_workers=self.workers) as fetchers, \
+                ProcessPoolExecutor(max_workers=self.processes) as parsers:
+            for i in range(0, len(pending), step):
+                urls = pending[i:i + step]
+                pages = [(html, url) for url, html in zip(urls, fetchers.map(
+                    lambda url: fetch_html(url, self.limiter), urls))]
+                chunksize = max(1, len(pages) // self.processes)
+                for url, fuel_data, error in extract_prices_batch(pages, chunksize=chunksize, executor=parsers):
+                    yield url, fuel_data, "fetch failed" if error == "empty page" else error
+
+    def run(self):
+        """Crawl and fetch; returns a summary of the run"""
+        listing_complete = self.crawl_listing()
+        recorded = self.fetch_announcements()
+        return {
+            "listingComplete": listing_complete and not self.checkpoint["nextPage"],
+            "pages": len(self.checkpoint["pagesVisited"]),
+            "announcements": len(self.checkpoint["links"]),
+            "done": len(self.checkpoint["done"]),
+            "failed": self.checkpoint["failed"],
+            "rowsRecorded": recorded,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill the price history from every BERA announcement")
+    parser.add_argument("--url", help="first press releases page (default: BERA_URL)")
+    parser.add_argument("--stub", action="store_true", help="crawl the bundled fixtures on a local stub server")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="parallel fetches (default %(default)s)")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE,
+                        help="requests per second per host (default %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="announcements per history write (default %(default)s)")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES,
+                        help="listing pages to walk at most (default %(default)s)")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="progress file (default %(default)s)")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="fetch announcements on the asyncio pipeline (needs aiohttp)")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="parse announcements in this many worker processes (default: on the fetch threads)")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        from stub_server import StubBera
+        stub = StubBera().start()
+        args.url = stub.url()
+
+    try:
+        backfill = Backfill(args.url, workers=args.workers, rate=args.rate, batch_size=args.batch_size,
+                            checkpoint_path=args.checkpoint, max_pages=args.max_pages, use_async=args.use_async,
+                            processes=args.processes)
+        print(f"Backfilling from {backfill.listing_url}")
+        print(json.dumps(backfill.run(), indent=2))
+    finally:
+        if stub:
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Extract fuel prices from many announcement pages at once.
+
+Backfills and fixture regression runs parse thousands of pages, which is
+CPU-bound. extract_prices_batch() runs them through the same parser backend
+and compiled scanner as extract_prices(), serially or spread over worker
+processes, and reports a reason for every page it gets nothing from.
+
+    python batch.py fixtures/*.html                 # one process
+    python batch.py --processes 4 pages/*.html      # four worker processes
+"""
+
+import argparse
+import json
+import os
+
+import handler
+
+DEFAULT_CHUNKSIZE = 16
+
+
+def extract_prices_batch(pages, processes=0, chunksize=DEFAULT_CHUNKSIZE, executor=None):
+    """Extract fuel prices from an iterable of (html, url) pairs.
+
+    Yields (url, fuel_data or None, error or None) for each page, in input
+    order. With `processes`, or an `executor` to reuse across calls, pages
+    are parsed in a ProcessPoolExecutor and sent to the workers `chunksize`
+    at a time, so each dispatch carries enough work to be worth the pickling.
+    """
+    if executor is not None:
+        yield from executor.map(extract_one, pages, chunksize=chunksize)
+    elif processes and processes > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            yield from pool.map(extract_one, pages, chunksize=chunksize)
+    else:
+        for page in pages:
+            yield extract_one(page)
+
+
+def extract_one(page):
+    """(url, fuel_data, error) for one (html, url) pair; never raises"""
+    html, url = page
+    if not html:
+        return url, None, "empty page"
+    try:
+        # Memoised like extract_prices(), but parser errors are reported rather than hidden
+        fuel_data = handler.parse_memo.get_or_compute(html, lambda: handler.scan_announcement(html, url), url)
+    except Exception as e:
+        return url, None, f"{type(e).__name__}: {e}"
+    if not fuel_data:
+        return url, None, "no prices found"
+    return url, fuel_data, None
+
+
+def read_pages(paths):
+    """(html, path) for each file"""
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield f.read(), path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract fuel prices from saved announcement pages")
+    parser.add_argument("paths", nargs="+", help="HTML files")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="worker processes, 0 to parse in this one (default %(default)s)")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE,
+                        help="pages sent to a worker at a time (default %(default)s)")
+    args = parser.parse_args()
+
+    results = extract_prices_batch(read_pages(args.paths), args.processes, args.chunksize)
+    print(json.dumps([{"path": os.path.relpath(url), "fuelData": fuel_data, "error": error}
+                      for url, fuel_data, error in results], indent=2))
+
+
+if __name__ == "__main__":
+    main()
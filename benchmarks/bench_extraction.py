@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark: original per-product regexes vs the single-pass scanner on
+announcement text of increasing size
+
+    python benchmarks/bench_extraction.py
+"""
+
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import scan_prices
+
+LEGACY_PATTERNS = [
+    r'petrol\s+93.*?(\d+\.\d+)',
+    r'petrol\s+95.*?(\d+\.\d+)',
+    r'diesel.*?(\d+\.\d+)',
+    r'paraffin.*?(\d+\.\d+)',
+]
+
+PRICE_BLOCK = """
+Fuel prices effective from 1st July 2024:
+Unleaded Petrol 93: 14.50 BWP per litre
+Unleaded Petrol 95: 14.75 BWP per litre
+Diesel 50ppm: 13.80 BWP per litre
+Illuminating Paraffin: 9.50 BWP per litre
+"""
+
+# Text that mentions products without a price before the real price block
+FILLER = ("Petrol and diesel supply to northern depots remains stable while paraffin "
+          "stocks are replenished, see the petroleum section of the website for details")
+
+
+def legacy_scan(text):
+    date_match = re.search(r'effective.*?(\d{1,2}.*?\d{4})', text, re.IGNORECASE)
+    prices = [re.search(pattern, text, re.IGNORECASE) for pattern in LEGACY_PATTERNS]
+    return date_match, prices
+
+
+def make_page(filler_lines):
+    return (FILLER + "\n") * filler_lines + PRICE_BLOCK + (FILLER + "\n") * filler_lines
+
+
+def make_page_without_paraffin_price(mentions):
+    """One long line (get_text of a minified page) that names paraffin many
+    times but never prices it: the lazy pattern rescans to the end from every
+    mention, so the legacy cost grows quadratically"""
+    block = "Unleaded Petrol 93: 14.50 Unleaded Petrol 95: 14.75 Diesel 50ppm: 13.80 "
+    return block + "Illuminating paraffin is now sold at fuel stations in the region. " * mentions
+
+
+def run(title, make, sizes):
+    print(title)
+    print(f"{'text size':>12} {'legacy (ms)':>12} {'single-pass (ms)':>17} {'speedup':>8}")
+    for size in sizes:
+        text = make(size)
+        legacy = min(timeit.repeat(lambda: legacy_scan(text), number=1, repeat=3))
+        single = min(timeit.repeat(lambda: scan_prices(text), number=1, repeat=3))
+        print(f"{len(text):>12,} {legacy * 1000:>12.3f} {single * 1000:>17.3f} {legacy / single:>7.1f}x")
+    print()
+
+
+def main():
+    run("Formatted page, every product priced once", make_page, (10, 100, 1000, 5000, 20000))
+    run("Minified page, a product mentioned but never priced", make_page_without_paraffin_price,
+        (100, 300, 1000, 3000))
+
+
+if __name__ == "__main__":
+    main()
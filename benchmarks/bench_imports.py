@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Cold-start import cost of handler.py, measured with `python -X importtime`
+
+    python benchmarks/bench_imports.py            # print the import time
+    python benchmarks/bench_imports.py --save     # record it as the budget
+    python benchmarks/bench_imports.py --check    # fail if over budget
+
+--check also fails when importing handler loads any of the heavy modules
+listed in the budget file (requests, bs4, ...), which must only be imported
+on first use. Times are per machine: record a budget with --save first.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_FILE = os.path.join(ROOT, "benchmarks", "import_budget.json")
+DEFAULT_THRESHOLD = float(os.environ.get("BENCH_THRESHOLD", "0.25"))
+MODULE = "handler"
+REPEAT = 7
+
+# Modules cold starts should never load before they are needed
+HEAVY_MODULES = ["requests", "urllib3", "bs4", "soupsieve", "charset_normalizer",
+                 "chardet", "idna", "lxml", "selectolax", "boto3", "botocore"]
+
+
+def import_time(module=MODULE):
+    """Cumulative import time of module in microseconds, in a fresh interpreter"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        parts = line.split("|")
+        if len(parts) == 3 and parts[2].strip() == module and not parts[2][1:].startswith(" "):
+            return int(parts[1])
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def best_import_time(module=MODULE, repeat=REPEAT):
+    import_time(module)  # compile the .pyc files first
+    return min(import_time(module) for _ in range(repeat))
+
+
+def loaded_modules(module=MODULE):
+    """Top-level modules that importing module loads, beyond interpreter startup"""
+    code = ("import sys; before = set(sys.modules); import " + module + "; "
+            "print('\\n'.join(sorted({m.split('.')[0] for m in set(sys.modules) - before})))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return set(result.stdout.split())
+
+
+def heavy_imports(module=MODULE, heavy=HEAVY_MODULES):
+    """Heavy modules that importing module loads eagerly"""
+    return sorted(loaded_modules(module) & set(heavy))
+
+
+def load_budget():
+    try:
+        with open(BUDGET_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time of handler.py")
+    parser.add_argument("--save", action="store_true", help="record the result as the new budget")
+    parser.add_argument("--check", action="store_true", help="exit 1 if over budget or a heavy module is imported")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown over the budget, as a fraction (default %(default)s)")
+    args = parser.parse_args()
+
+    budget = load_budget()
+    heavy = budget.get("heavyModules", HEAVY_MODULES)
+    micros = best_import_time()
+    eager = heavy_imports(heavy=heavy)
+    reference = budget.get(MODULE)
+
+    change = f" ({(micros / reference - 1) * 100:+.0f}% vs budget {reference / 1000:.1f} ms)" if reference else ""
+    print(f"import {MODULE}: {micros / 1000:.1f} ms{change}")
+    print(f"heavy modules imported eagerly: {', '.join(eager) or 'none'}")
+
+    if args.save:
+        budget.update({MODULE: micros, "heavyModules": heavy})
+        with open(BUDGET_FILE, "w", encoding="utf-8") as f:
+            json.dump(budget, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBudget saved to {BUDGET_FILE}")
+
+    if args.check:
+        failed = False
+        if reference and micros > reference * (1 + args.threshold):
+            print(f"\nImport time is over budget by more than {args.threshold:.0%}")
+            failed = True
+        if eager:
+            print(f"\nThese must be imported on first use instead: {', '.join(eager)}")
+            failed = True
+        if failed:
+            sys.exit(1)
+        print("\nWithin budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark: time and peak memory of each parser backend's text() on
+announcement pages of increasing size, and the full extraction on top of it,
+against region extraction (locating the price table and scanning only that)
+
+    python benchmarks/bench_parsers.py
+"""
+
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import parsers
+from extraction import scan_prices
+from regions import RegionLocator
+from stub_server import load_fixture
+
+# Depot price table rows and a menu, as on BERA's regional price pages
+ROW = "<tr><td>Depot {i}</td><td>Transport differential</td><td>0.{i:02d}</td></tr>\n"
+MENU = '<nav class="depot-menu"><ul>' + '<li><a href="/depots/{i}">Depot {i}</a></li>' * 5 + "</ul></nav>\n"
+
+
+def make_page(rows):
+    """The announcement fixture with `rows` extra table rows (and a menu every 50) after the prices"""
+    extra = "".join(ROW.format(i=i % 100) + (MENU.format(i=i) if i % 50 == 0 else "") for i in range(rows))
+    extra = '<table class="differentials">\n' + extra + "</table>\n"
+    return load_fixture("announcement.html").replace("</main>", extra + "</main>")
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    installed = [name for name in parsers.BACKENDS if parsers.is_available(name)]
+    print(f"{'page size':>10} {'backend':>12} {'text (ms)':>10} {'text+scan (ms)':>15} {'peak (KiB)':>11}")
+    for rows in (100, 1000, 10000):
+        html = make_page(rows)
+        expected = scan_prices(parsers.BACKENDS["html.parser"].text(html))
+        for name in installed:
+            backend = parsers.BACKENDS[name]
+            assert scan_prices(backend.text(html)) == expected, name
+            text = min(timeit.repeat(lambda: backend.text(html), number=1, repeat=5))
+            full = min(timeit.repeat(lambda: scan_prices(backend.text(html)), number=1, repeat=5))
+            peak = peak_memory(lambda: backend.text(html))
+            print(f"{len(html):>10,} {name:>12} {text * 1000:>10.2f} {full * 1000:>15.2f} {peak / 1024:>11,.0f}")
+
+        # On a fresh locator, then with the strategy remembered for the template
+        assert RegionLocator().scan(html) == expected
+        first = min(timeit.repeat(lambda: RegionLocator().scan(html), number=1, repeat=5))
+        peak = peak_memory(lambda: RegionLocator().scan(html))
+        print(f"{len(html):>10,} {'region':>12} {'':>10} {first * 1000:>15.2f} {peak / 1024:>11,.0f}")
+        locator = RegionLocator()
+        locator.scan(html)
+        full = min(timeit.repeat(lambda: locator.scan(html), number=1, repeat=5))
+        peak = peak_memory(lambda: locator.scan(html))
+        print(f"{len(html):>10,} {'region again':>12} {'':>10} {full * 1000:>15.2f} {peak / 1024:>11,.0f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
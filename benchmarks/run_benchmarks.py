@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks for each stage of the scrape pipeline, run against the saved
+BERA fixtures served from a local stub server
+
+    python benchmarks/run_benchmarks.py            # run and print timings
+    python benchmarks/run_benchmarks.py --save     # record them as the baseline
+    python benchmarks/run_benchmarks.py --check    # fail on regressions
+
+Baselines are per machine: record one with --save before using --check.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import handler
+import responses
+from cache import MemoryBackend, SnapshotCache
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH, StubBera, load_fixture
+
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+DEFAULT_THRESHOLD = float(os.environ.get("BENCH_THRESHOLD", "0.25"))
+TARGET_SECONDS = 0.2
+REPEAT = 5
+SIMULATED_LATENCY = 0.02
+
+
+def reset_handler(stub):
+    """Point the handler at the stub with every cache empty"""
+    handler.BERA_URL = stub.url(LISTING_PATH)
+    handler.SERVE_FROM_STORE = False
+    handler.STREAM_LISTING = False
+    handler.price_cache = SnapshotCache(MemoryBackend(), handler.CACHE_TTL, handler.CACHE_STALE_TTL,
+                                        prepare=responses.prepare)
+    handler.page_validators.clear()
+    handler.parse_memo.clear()
+    handler.last_announcement_url = None
+
+
+def benchmarks(stub):
+    """Name -> zero-argument callable timing one pipeline stage"""
+    listing = load_fixture("press_releases.html")
+    announcement = load_fixture("announcement.html")
+    announcement_url = stub.url(ANNOUNCEMENT_PATH)
+    fuel_data = handler.parse_prices(announcement, announcement_url)
+    snapshot = dict(responses.prepare(fuel_data), data=fuel_data, storedAt=time.time())
+    revalidation = {"headers": {"if-none-match": snapshot["etag"]}}
+    chunks = [listing[i:i + handler.STREAM_CHUNK_SIZE] for i in range(0, len(listing), handler.STREAM_CHUNK_SIZE)]
+
+    def get_prices_cold():
+        reset_handler(stub)
+        handler.get_prices({}, None)
+
+    def get_prices_miss_prefetched():
+        # Cache miss in a warm container: the announcement is fetched alongside the listing
+        announcement = stub.url(ANNOUNCEMENT_PATH)
+        reset_handler(stub)
+        handler.last_announcement_url = announcement
+        handler.get_prices({}, None)
+
+    def with_latency(fn):
+        # The stub answers in well under a millisecond; BERA takes tens of them
+        def run():
+            stub.delay = SIMULATED_LATENCY
+            try:
+                fn()
+            finally:
+                stub.delay = 0
+        return run
+
+    def get_prices_warm():
+        handler.get_prices({}, None)
+
+    return {
+        "find_fuel_announcement": lambda: handler.find_fuel_announcement(listing),
+        "find_fuel_announcement_in_chunks": lambda: handler.find_fuel_announcement_in_chunks(iter(chunks)),
+        "extract_prices": lambda: handler.parse_prices(announcement, announcement_url),
+        "extract_prices_memo_hit": lambda: handler.extract_prices(announcement, announcement_url),
+        "success_response": lambda: handler.success_response(fuel_data),
+        "snapshot_response": lambda: handler.snapshot_response(snapshot, "fresh"),
+        "snapshot_not_modified": lambda: handler.snapshot_response(snapshot, "fresh", revalidation),
+        "error_response": lambda: handler.error_response(503, responses.UNAVAILABLE),
+        "get_prices_cold": get_prices_cold,
+        "get_prices_miss_prefetched": get_prices_miss_prefetched,
+        "get_prices_cold_20ms": with_latency(get_prices_cold),
+        "get_prices_miss_prefetched_20ms": with_latency(get_prices_miss_prefetched),
+        "get_prices_warm": get_prices_warm,
+    }
+
+
+def measure(fn):
+    """Best time per call in seconds, calibrated to about TARGET_SECONDS per repeat"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * TARGET_SECONDS / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=REPEAT, number=number)) / number
+
+
+def run(names=None):
+    with StubBera() as stub:
+        reset_handler(stub)
+        handler.get_prices({}, None)  # warm the session, memo and snapshot cache
+        results = {}
+        for name, fn in benchmarks(stub).items():
+            if names and name not in names:
+                continue
+            results[name] = measure(fn)
+        return results
+
+
+def compare(results, baseline, threshold):
+    """Return [(name, baseline, result)] for every benchmark slower than allowed"""
+    regressions = []
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        if reference and seconds > reference * (1 + threshold):
+            regressions.append((name, reference, seconds))
+    return regressions
+
+
+def load_baseline():
+    try:
+        with open(BASELINE_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    return f"{seconds * 1e3:.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrape pipeline stages")
+    parser.add_argument("names", nargs="*", help="only run these benchmarks")
+    parser.add_argument("--save", action="store_true", help="record results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit 1 if any benchmark regressed")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown over baseline, as a fraction (default %(default)s)")
+    args = parser.parse_args()
+
+    results = run(args.names)
+    baseline = load_baseline()
+
+    print(f"{'benchmark':<36} {'time':>12} {'baseline':>12} {'change':>8}")
+    for name, seconds in results.items():
+        reference = baseline.get(name)
+        change = f"{(seconds / reference - 1) * 100:+.0f}%" if reference else "-"
+        print(f"{name:<36} {format_time(seconds):>12} "
+              f"{format_time(reference) if reference else '-':>12} {change:>8}")
+
+    if args.save:
+        baseline.update(results)
+        with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline saved to {BASELINE_FILE}")
+
+    if args.check:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%}:")
+            for name, reference, seconds in regressions:
+                print(f"  {name}: {format_time(reference)} -> {format_time(seconds)}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+# Circuit breakers for origin fetches, one per host.
+#
+# While BERA is down every fetch would otherwise wait out TIMEOUT (and its
+# retries) before failing. A breaker watches the outcome of the last `window`
+# fetches to a host; once at least `min_calls` of them are in and the share of
+# failures reaches `failure_rate`, it opens and fetches fail immediately.
+# After `open_seconds` it lets a single probe through (half-open): success
+# closes it again, failure re-opens it for another period.
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker for one host"""
+
+    def __init__(self, name, failure_rate=0.5, min_calls=4, window=10, open_seconds=30, clock=time.monotonic):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.opened_at = None
+        self.rejected = 0
+        self._outcomes = deque(maxlen=window)
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a fetch may go out now. Half-open allows one probe at a time"""
+        with self._lock:
+            if self.state == OPEN and self.clock() - self.opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN)
+            if self.state == CLOSED or (self.state == HALF_OPEN and not self._probing):
+                self._probing = self.state == HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success):
+        """Record the outcome of a fetch that allow() let through"""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probing = False
+                self._transition(CLOSED if success else OPEN)
+                return
+            if self.state == OPEN:
+                return  # a fetch started before the breaker opened
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_rate * len(self._outcomes):
+                self._transition(OPEN)
+
+    def cancel(self):
+        """Forget a fetch that allow() let through but that never finished"""
+        with self._lock:
+            self._probing = False
+
+    def status(self):
+        """Current state and counters, for logs and metrics"""
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, self.open_seconds - (self.clock() - self.opened_at))
+            return {
+                "state": self.state,
+                "calls": len(self._outcomes),
+                "failures": self._outcomes.count(False),
+                "rejected": self.rejected,
+                "retryIn": retry_in,
+            }
+
+    def _transition(self, state):
+        if state == OPEN:
+            self.opened_at = self.clock()
+        if state != HALF_OPEN:
+            self._outcomes.clear()
+        print(f"Circuit breaker for {self.name}: {self.state} -> {state}")
+        self.state = state
+
+
+class CircuitBreakers:
+    """CircuitBreaker per host, created on first use with the same settings"""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        """Breaker for the host of url"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(host, **self.settings)
+            return breaker
+
+    def status(self):
+        """{host: status} for every host fetched so far"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.status() for breaker in breakers}
+
+    def clear(self):
+        with self._lock:
+            self._breakers.clear()
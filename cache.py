@@ -0,0 +1,339 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Snapshot cache for the last successful fuel price scrape.
+#
+# A snapshot is a plain dict: {"data": fuel_data, "storedAt": unix_time,
+# "lastModified": unix_time the data last changed}.
+# Backends only store and return snapshots; expiry is decided by SnapshotCache.
+
+DEFAULT_KEY = "latest"
+
+# Cache states reported to clients in the X-Cache-Status header
+FRESH = "fresh"
+STALE = "stale"
+REVALIDATED = "revalidated"
+
+
+class MemoryBackend:
+    """Keep snapshots in process memory (survives warm Lambda invocations)"""
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._items.get(key)
+
+    def set(self, key, snapshot):
+        with self._lock:
+            self._items[key] = snapshot
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class FileBackend:
+    """Store snapshots as JSON files in a local directory (e.g. /tmp on Lambda)"""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, snapshot):
+        os.makedirs(self.directory, exist_ok=True)
+        import tempfile
+        # Write to a temp file first so readers never see a half-written snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+
+class InMemoryKeyValueStore:
+    """Stand-in key-value client for tests and local runs"""
+
+    def __init__(self):
+        self._items = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._items.get(key)
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+
+class KeyValueBackend:
+    """Store snapshots in a key-value client exposing get/put/delete of strings"""
+
+    def __init__(self, client, prefix="fuel-prices:"):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+    def set(self, key, snapshot):
+        self.client.put(self.prefix + key, json.dumps(snapshot))
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class DynamoDBKeyValueStore:
+    """Key-value client backed by a DynamoDB table with a string "key" partition key"""
+
+    def __init__(self, table_name, client=None):
+        if client is None:
+            import boto3  # provided by the Lambda runtime, only needed for this store
+            client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = client
+
+    def get(self, key):
+        response = self.client.get_item(TableName=self.table_name, Key={"key": {"S": key}},
+                                        ConsistentRead=True)
+        item = response.get("Item")
+        return item["value"]["S"] if item else None
+
+    def put(self, key, value):
+        self.client.put_item(TableName=self.table_name,
+                             Item={"key": {"S": key}, "value": {"S": value}})
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={"key": {"S": key}})
+
+
+def create_backend(name, directory=None, client=None, table=None):
+    """Build a cache backend from its configured name"""
+    if name == "memory":
+        return MemoryBackend()
+    if name == "file":
+        import tempfile
+        return FileBackend(directory or os.path.join(tempfile.gettempdir(), "fuel-price-cache"))
+    if name == "kv":
+        return KeyValueBackend(client or InMemoryKeyValueStore())
+    if name == "dynamodb":
+        return KeyValueBackend(client or DynamoDBKeyValueStore(table))
+    raise ValueError(f"Unknown cache backend: {name}")
+
+
+class SnapshotCache:
+    """Serve the last successful fuel_data while fresh, and while stale if allowed
+
+    A snapshot is fresh for `ttl` seconds after it was stored, then stale for a
+    further `stale_ttl` seconds, after which it is treated as missing.
+    Storing the same data again renews `storedAt` but keeps `lastModified`.
+    `prepare(data)`, if given, returns extra fields (such as the serialized
+    response body) stored in the snapshot next to the data, so they are
+    computed once per change rather than once per read.
+    """
+
+    def __init__(self, backend, ttl, stale_ttl=0, clock=time.time, prepare=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.prepare = prepare
+
+    def lookup(self, key=DEFAULT_KEY):
+        """Return (fuel_data, "fresh" | "stale"), or (None, None) if nothing usable"""
+        snapshot, state = self.lookup_snapshot(key)
+        return (snapshot["data"], state) if snapshot else (None, None)
+
+    def lookup_snapshot(self, key=DEFAULT_KEY):
+        """Like lookup(), but return the whole snapshot including prepared fields"""
+        snapshot = self.last_snapshot(key)
+        if not snapshot:
+            return None, None
+        age = self.clock() - snapshot["storedAt"]
+        if age < self.ttl:
+            return snapshot, FRESH
+        if age < self.ttl + self.stale_ttl:
+            return snapshot, STALE
+        return None, None
+
+    def last_snapshot(self, key=DEFAULT_KEY):
+        """The stored snapshot whatever its age, or None"""
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            print(f"Cache read failed: {e}")
+            return None
+
+    def max_age(self, snapshot):
+        """Seconds the snapshot stays fresh for, 0 once it is stale"""
+        return max(0, int(self.ttl - (self.clock() - snapshot["storedAt"])))
+
+    def get(self, key=DEFAULT_KEY):
+        """Return cached fuel_data if it is still fresh, otherwise None"""
+        data, state = self.lookup(key)
+        return data if state == FRESH else None
+
+    def put(self, data, key=DEFAULT_KEY):
+        """Store fuel_data as the latest snapshot, and return the snapshot"""
+        now = self.clock()
+        previous = self.last_snapshot(key)
+        if previous and previous["data"] == data:
+            modified = previous.get("lastModified", previous["storedAt"])
+        else:
+            modified = now
+        snapshot = {"data": data, "storedAt": now, "lastModified": modified}
+        try:
+            if self.prepare:
+                snapshot.update(self.prepare(data))
+            self.backend.set(key, snapshot)
+        except Exception as e:
+            print(f"Cache write failed: {e}")
+        return snapshot
+
+    def clear(self, key=DEFAULT_KEY):
+        self.backend.delete(key)
+
+
+class BackgroundRefresher:
+    """Run refreshes in daemon threads, with at most one in flight per key
+
+    On Lambda the thread is frozen with the container once the response is
+    returned and carries on when the next invocation thaws it.
+    """
+
+    def __init__(self):
+        self._in_flight = set()
+        self._lock = threading.Lock()
+
+    def trigger(self, key, refresh):
+        """Start refresh() unless one is already running for key. Returns True if started"""
+        with self._lock:
+            if key in self._in_flight:
+                return False
+            self._in_flight.add(key)
+        thread = threading.Thread(target=self._run, args=(key, refresh), daemon=True)
+        thread.start()
+        return True
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._in_flight
+
+    def _run(self, key, refresh):
+        try:
+            refresh()
+        except Exception as e:
+            print(f"Background refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(key)
+
+
+class LRUCache:
+    """Small thread-safe mapping that evicts the least recently used entry"""
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DigestMemo:
+    """Memoise results keyed by a digest of the raw page content
+
+    Pages are hashed rather than stored, so memory stays bounded by `maxsize`
+    results. Counts hits and misses so the saved parse work can be observed.
+    """
+
+    def __init__(self, maxsize=32):
+        self._results = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(content, *extra):
+        import hashlib
+        h = hashlib.sha256(content.encode("utf-8", "surrogatepass"))
+        for part in extra:
+            h.update(b"\0" + str(part).encode("utf-8"))
+        return h.hexdigest()
+
+    def get_or_compute(self, content, compute, *extra):
+        """Return the memoised result for content (and extra key parts), or compute() it"""
+        key = self.digest(content, *extra)
+        missing = object()
+        result = self._results.get(key, missing)
+        if result is not missing:
+            with self._lock:
+                self.hits += 1
+            return result
+        with self._lock:
+            self.misses += 1
+        result = compute()
+        self._results.put(key, result)
+        return result
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._results)}
+
+    def clear(self):
+        self._results.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Shared fixtures: handler.py with every per-container global reset, and the
+stub BERA server it is pointed at
+"""
+
+import pytest
+
+import handler
+from breaker import CircuitBreakers
+from cache import DigestMemo, LRUCache, MemoryBackend, SnapshotCache
+from history import NullHistoryStore
+from regions import RegionLocator
+from singleflight import SingleFlight
+from stub_server import LISTING_PATH, StubBera
+
+
+@pytest.fixture
+def fresh_handler(monkeypatch):
+    """handler with empty caches, no history and the default switches, as in a
+    cold container; everything is put back after the test"""
+    monkeypatch.setattr(handler, "price_cache", SnapshotCache(MemoryBackend(), ttl=3600, prepare=handler.prepare))
+    monkeypatch.setattr(handler, "page_validators", LRUCache())
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    monkeypatch.setattr(handler, "region_locator", RegionLocator())
+    monkeypatch.setattr(handler, "last_announcement_url", None)
+    monkeypatch.setattr(handler, "history_store", NullHistoryStore())
+    monkeypatch.setattr(handler, "breakers", CircuitBreakers())
+    monkeypatch.setattr(handler, "scrape_flight", SingleFlight())
+    monkeypatch.setattr(handler, "lease_store", None)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", False)
+    monkeypatch.setattr(handler, "STREAM_LISTING", False)
+    return handler
+
+
+@pytest.fixture
+def stub(fresh_handler, monkeypatch):
+    """StubBera serving the saved fixtures, with BERA_URL pointing at it"""
+    with StubBera() as server:
+        monkeypatch.setattr(handler, "BERA_URL", server.url(LISTING_PATH))
+        yield server
@@ -0,0 +1,142 @@
+import re
+
+# Single-pass price and date scanner for announcement text.
+#
+# Equivalent to running these patterns one at a time with re.search (and
+# re.IGNORECASE), which is what extract_prices used to do:
+#     effective.*?(\d{1,2}.*?\d{4})
+#     petrol\s+93.*?(\d+\.\d+)   petrol\s+95.*?(\d+\.\d+)
+#     diesel.*?(\d+\.\d+)        paraffin.*?(\d+\.\d+)
+# Instead of rescanning the whole text once per pattern, one compiled
+# alternation walks the keywords in order. A keyword's value must start on the
+# same line ('.' never crosses a newline), so for each hit we only need the
+# next newline and the next value after it. Both lookups are cached and only
+# move forward, which keeps the scan linear even on a single huge line where
+# the lazy patterns backtrack from every keyword to the end of the text. When
+# a hit's line has no value, the scan jumps ahead to the line holding the next
+# value, since no keyword before it can be resolved.
+# Keywords are matched on a lower-cased copy, which is much cheaper than
+# re.IGNORECASE; the few characters where the two disagree fall back to it.
+
+FUEL_TYPES = [
+    ("Retail Pump Price - Unleaded Petrol 93", r'petrol\s+93'),
+    ("Retail Pump Price - Unleaded Petrol 95", r'petrol\s+95'),
+    ("Retail Pump Price - Diesel 50ppm", r'diesel'),
+    ("Wholesale Price - Illuminating Paraffin", r'paraffin'),
+]
+
+DATE_GROUP = "date"
+
+_KEYWORDS = ('|'.join(f'(?P<p{i}>{keyword})' for i, (_, keyword) in enumerate(FUEL_TYPES))
+             + f'|(?P<{DATE_GROUP}>effective)')
+KEYWORDS = re.compile(_KEYWORDS)
+KEYWORDS_IGNORECASE = re.compile(_KEYWORDS, re.IGNORECASE)
+PRICE = re.compile(r'\d+\.\d+')
+DATE = re.compile(r'\d{1,2}.*?\d{4}')
+
+# re.IGNORECASE also matches these against 'i' and 's'; str.lower() does not
+_CASE_FOLD_EXCEPTIONS = ('\u0131', '\u017f')
+
+
+class _NextMatch:
+    """Leftmost match of pattern starting at or after a position, for
+    positions that only increase"""
+
+    def __init__(self, pattern, text):
+        self.pattern = pattern
+        self.text = text
+        self._match = None
+        self._searched_from = None
+
+    def at(self, pos):
+        # A cached match starting at or after pos is still the leftmost one,
+        # since nothing matched between where we searched from and its start
+        if self._searched_from is not None and pos >= self._searched_from and (
+                self._match is None or self._match.start() >= pos):
+            return self._match
+        self._match = self.pattern.search(self.text, pos)
+        self._searched_from = pos
+        return self._match
+
+
+def scan_prices(text):
+    """Find the effective date and each product's price in one pass over text.
+    Returns (effective_date or None, [(product, price), ...] in FUEL_TYPES order)"""
+    lowered = text.lower()
+    if len(lowered) == len(text) and not any(c in text for c in _CASE_FOLD_EXCEPTIONS):
+        keywords, target = KEYWORDS, lowered
+    else:
+        keywords, target = KEYWORDS_IGNORECASE, text
+
+    next_price = _NextMatch(PRICE, text)
+    next_date = _NextMatch(DATE, text)
+    line_end = -1
+    found = {}
+    effective_date = None
+    remaining = len(FUEL_TYPES) + 1
+    pos = 0
+
+    while remaining:
+        resume = None
+        for match in keywords.finditer(target, pos):
+            end = match.end()
+            if line_end < end:
+                line_end = text.find('\n', end)
+                if line_end == -1:
+                    line_end = len(text)
+
+            group = match.lastgroup
+            if group == DATE_GROUP:
+                if effective_date is not None:
+                    continue
+                value = next_date.at(end)
+            else:
+                index = int(group[1:])
+                if index in found:
+                    continue
+                value = next_price.at(end)
+
+            if not value or value.start() >= line_end:
+                resume = _resume_point(text, end, found, effective_date, next_price, next_date)
+                if resume is None or resume > end:
+                    break
+                continue
+
+            if group == DATE_GROUP:
+                effective_date = value.group()
+            else:
+                found[index] = float(value.group())
+            remaining -= 1
+            if not remaining:
+                break
+        else:
+            break
+        if resume is None:
+            break
+        pos = resume
+
+    prices = [(FUEL_TYPES[i][0], found[i]) for i in sorted(found)]
+    return effective_date, prices
+
+
+def _resume_point(text, pos, found, effective_date, next_price, next_date):
+    """Earliest position a still-resolvable keyword after pos can start, or
+    None if no pending product or date has a value left in the text"""
+    starts = []
+    if len(found) < len(FUEL_TYPES):
+        value = next_price.at(pos)
+        if value:
+            starts.append(value.start())
+    if effective_date is None:
+        value = next_date.at(pos)
+        if value:
+            starts.append(value.start())
+    if not starts:
+        return None
+
+    # The keyword sits on the value's line, except 'petrol\s+93' which may
+    # start on an earlier line followed only by whitespace
+    i = text.rfind('\n', 0, min(starts))
+    while i >= 0 and text[i].isspace():
+        i -= 1
+    return text.rfind('\n', 0, i + 1) + 1
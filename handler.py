@@ -1,129 +1,578 @@
-import json
-import re
-import requests
-from bs4 import BeautifulSoup
+import codecs
+import contextvars
+import os
+import threading
+import time
+import timing
+from html.parser import HTMLParser
 from urllib.parse import urljoin
 
+from breaker import CLOSED, CircuitBreakers
+from cache import (DEFAULT_KEY, FRESH, REVALIDATED, STALE, BackgroundRefresher,
+                   DigestMemo, LRUCache, SnapshotCache, create_backend)
+from extraction import scan_prices
+from history import DEFAULT_LIMIT, MAX_LIMIT, create_history_store, is_iso_date
+from parsers import get_backend
+from regions import RegionLocator
+from responses import (PARSE_FAILED, UNAVAILABLE, dumps, encode_response, error_response, etag_for,
+                       http_date, if_none_match, json_response, not_modified, prepare)
+from singleflight import SingleFlight, create_lease_store, new_owner
+
 # Configuration
 BERA_URL = "https://www.bera.co.bw/media/press-releases"
 TIMEOUT = 15
+PARSE_MEMO_SIZE = int(os.environ.get("PARSE_MEMO_SIZE", "32"))
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "2"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "10"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", "0.3"))
+CACHE_TTL = int(os.environ.get("CACHE_TTL", "3600"))
+CACHE_STALE_TTL = int(os.environ.get("CACHE_STALE_TTL", "86400"))
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_DIR = os.environ.get("CACHE_DIR")
+CACHE_TABLE = os.environ.get("CACHE_TABLE")
+# Read the listing page in chunks and stop at the first fuel price link
+STREAM_LISTING = os.environ.get("STREAM_LISTING", "false").lower() == "true"
+STREAM_CHUNK_SIZE = 8192
+# selectolax, lxml or html.parser; "auto" picks the fastest one installed
+HTML_PARSER = os.environ.get("HTML_PARSER", "auto")
+# Scan only the table, list or paragraph holding the prices, falling back to the whole page text
+REGION_EXTRACTION = os.environ.get("REGION_EXTRACTION", "true").lower() == "true"
+# One EMF log line per invocation with per-stage durations
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() == "true"
+# Also return the stage durations in a Server-Timing response header
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "false").lower() == "true"
+# When the scheduled poller fills the store, get_prices only reads from it
+SERVE_FROM_STORE = os.environ.get("SERVE_FROM_STORE", "false").lower() == "true"
+# Fetch the announcement the listing pointed to last time while the listing downloads
+SPECULATIVE_PREFETCH = os.environ.get("SPECULATIVE_PREFETCH", "true").lower() == "true"
+# Scheduled polls run on the asyncio pipeline in async_handler.py (needs aiohttp)
+ASYNC_PIPELINE = os.environ.get("ASYNC_PIPELINE", "false").lower() == "true"
+# Every parsed announcement is appended to the history store: sqlite, dynamodb or none
+HISTORY_BACKEND = os.environ.get("HISTORY_BACKEND", "sqlite")
+HISTORY_PATH = os.environ.get("HISTORY_PATH")
+HISTORY_TABLE = os.environ.get("HISTORY_TABLE")
+# Fail fast once this share of the recent fetches to a host failed, then probe again after BREAKER_OPEN_SECONDS
+BREAKER_FAILURE_RATE = float(os.environ.get("BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "4"))
+BREAKER_WINDOW = int(os.environ.get("BREAKER_WINDOW", "10"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("BREAKER_OPEN_SECONDS", "30"))
+# Concurrent cache misses share one scrape in this process; with a lease store (memory
+# or dynamodb, in CACHE_TABLE) also across containers
+SCRAPE_LEASE = os.environ.get("SCRAPE_LEASE", "none")
+SCRAPE_LEASE_TTL = float(os.environ.get("SCRAPE_LEASE_TTL", "30"))
+SCRAPE_LEASE_WAIT = float(os.environ.get("SCRAPE_LEASE_WAIT", "15"))
+LEASE_POLL_INTERVAL = 0.1
+# The scheduled poller skips triggers until the adaptive schedule says a poll is due:
+# every POLL_BASE_INTERVAL seconds around likely changes, backing off to POLL_MAX_INTERVAL otherwise
+ADAPTIVE_POLLING = os.environ.get("ADAPTIVE_POLLING", "false").lower() == "true"
+POLL_BASE_INTERVAL = int(os.environ.get("POLL_BASE_INTERVAL", "900"))
+POLL_MAX_INTERVAL = int(os.environ.get("POLL_MAX_INTERVAL", "21600"))
+# Most a /prices response tells browsers and CDNs to keep it for, whatever the store's TTL
+RESPONSE_MAX_AGE = int(os.environ.get("RESPONSE_MAX_AGE", str(POLL_BASE_INTERVAL)))
+
+# Last successful scrape, reused across warm invocations
+price_cache = SnapshotCache(create_backend(CACHE_BACKEND, directory=CACHE_DIR, table=CACHE_TABLE),
+                            CACHE_TTL, CACHE_STALE_TTL, prepare=prepare)
+refresher = BackgroundRefresher()
+
+parser_backend = get_backend(HTML_PARSER)
+
+# Where the prices were found on each announcement page template
+region_locator = RegionLocator()
+
+FUEL_KEYWORDS = ['fuel price', 'petroleum price', 'petrol price', 'diesel price']
+
+# Pooled keep-alive session, built on first use and reused by warm invocations
+_session = None
+_session_lock = threading.Lock()
+
+# ETag / Last-Modified, body and parsed result of recently fetched pages, per URL
+page_validators = LRUCache(maxsize=64)
+
+# Extracted fuel_data keyed by a hash of the announcement HTML
+parse_memo = DigestMemo(maxsize=PARSE_MEMO_SIZE)
+
+# Announcement the listing resolved to last time, and the threads that prefetch it
+last_announcement_url = None
+_prefetch_pool = None
+_prefetch_lock = threading.Lock()
+
+# Circuit breaker per origin host
+breakers = CircuitBreakers(failure_rate=BREAKER_FAILURE_RATE, min_calls=BREAKER_MIN_CALLS,
+                           window=BREAKER_WINDOW, open_seconds=BREAKER_OPEN_SECONDS)
+
+# One scrape at a time for concurrent cache misses, and the lease that extends it to other containers
+scrape_flight = SingleFlight()
+lease_store = None
+lease_owner = new_owner()
+_lease_lock = threading.Lock()
+
+# Price history, opened on first use
+history_store = None
+_history_lock = threading.Lock()
 
 def get_prices(event, context):
     """Main Lambda function to get Botswana fuel prices"""
+    with timing.trace("get_prices", METRICS_ENABLED) as trace:
+        response = serve_prices(event)
+        if trace:
+            trace.properties["statusCode"] = response["statusCode"]
+            trace.properties["cacheStatus"] = response["headers"].get("X-Cache-Status", "none")
+            trace.properties["originBreaker"] = breakers.get(BERA_URL).state
+            trace.properties["parseMemo"] = parse_memo.stats()
+            if SERVER_TIMING:
+                response["headers"]["Server-Timing"] = trace.server_timing()
+    return response
+
+def serve_prices(event):
+    """Answer a /prices request from the cache or a fresh scrape"""
     try:
-        # 1. Get press releases page
-        html = fetch_page(BERA_URL)
-        if not html:
-            return error_response(503, "Data source (BERA) is currently unavailable.")
+        # Prices change about once a month, so most requests never touch BERA
+        snapshot, cache_status = price_cache.lookup_snapshot()
+        if SERVE_FROM_STORE:
+            if snapshot:
+                return snapshot_response(snapshot, cache_status, event)
+            # The poller has been failing for a while: its last result still beats a 503
+            return fallback_response(error_response(503, UNAVAILABLE), event)
+        if cache_status == STALE:
+            # Answer now and let one background refresh pay BERA's latency
+            refresher.trigger(DEFAULT_KEY, refresh_prices)
+        if snapshot:
+            return snapshot_response(snapshot, cache_status, event)
         
-        # 2. Find fuel price announcement link
-        announcement_url = find_fuel_announcement(html)
-        if not announcement_url:
-            return error_response(500, "Failed to parse data from the source. The scraper may need an update.")
-        
-        # 3. Get announcement page
-        announcement_html = fetch_page(announcement_url)
-        if not announcement_html:
-            return error_response(503, "Data source (BERA) is currently unavailable.")
+        snapshot, error = scrape_snapshot()
+        if error:
+            # Shared by every coalesced caller, so each gets its own headers
+            return fallback_response(dict(error, headers=dict(error["headers"])), event)
         
-        # 4. Extract fuel data
-        fuel_data = extract_prices(announcement_html, announcement_url)
-        if not fuel_data:
-            return error_response(500, "Failed to parse data from the source. The scraper may need an update.")
+        return snapshot_response(snapshot, REVALIDATED, event)
         
-        # 5. Return success response
-        return {
-            "statusCode": 200,
-            "headers": {
-                "Content-Type": "application/json",
-                "Access-Control-Allow-Origin": "*"
-            },
-            "body": json.dumps(fuel_data)
-        }
+    except Exception as e:
+        print(f"Error: {e}")
+        return error_response(500, PARSE_FAILED)
+
+def fallback_response(error, event=None):
+    """When BERA cannot be reached, serve the last good snapshot however old it is"""
+    snapshot = price_cache.last_snapshot() if error["statusCode"] == 503 else None
+    if snapshot:
+        return snapshot_response(snapshot, STALE, event)
+    return error
+
+def refresh_prices(listing_url=None):
+    """Scrape BERA and store the result in the snapshot cache"""
+    snapshot, error = scrape_snapshot(listing_url)
+    return snapshot["data"] if snapshot else None
+
+def scrape_snapshot(listing_url=None):
+    """Scrape and store the latest prices once for all concurrent cache misses.
+    Returns (snapshot, error_response)"""
+    listing_url = listing_url or BERA_URL
+    return scrape_flight.do(listing_url, lambda: scrape_under_lease(listing_url))
+
+def scrape_under_lease(listing_url=None):
+    """Scrape while holding the lease, or wait for the container holding it to store its result"""
+    leases = get_lease_store()
+    deadline = time.monotonic() + SCRAPE_LEASE_WAIT
+    waited = False
+    while not acquire_lease(leases):
+        # Another container is scraping: use its snapshot once it is stored
+        waited = True
+        with timing.span("wait_for_lease"):
+            time.sleep(LEASE_POLL_INTERVAL)
+            snapshot, cache_status = price_cache.lookup_snapshot()
+        if cache_status == FRESH:
+            return snapshot, None
+        if time.monotonic() >= deadline:
+            return None, error_response(503, UNAVAILABLE)
+    
+    try:
+        if waited:
+            # The previous holder may have stored a result just before letting go
+            snapshot, cache_status = price_cache.lookup_snapshot()
+            if cache_status == FRESH:
+                return snapshot, None
+        fuel_data, error = scrape_prices(listing_url)
+        if error:
+            return None, error
+        return price_cache.put(fuel_data), None
+    finally:
+        release_lease(leases)
+
+def acquire_lease(leases):
+    """Take the scrape lease; if the lease store fails, scrape rather than wait"""
+    try:
+        return leases.acquire(DEFAULT_KEY, lease_owner, SCRAPE_LEASE_TTL)
+    except Exception as e:
+        print(f"Lease unavailable: {e}")
+        return True
+
+def release_lease(leases):
+    """Let go of the scrape lease; a failed release just leaves it to expire"""
+    try:
+        leases.release(DEFAULT_KEY, lease_owner)
+    except Exception as e:
+        print(f"Lease release failed: {e}")
+
+def get_lease_store():
+    """Return the shared lease store, creating it on first use"""
+    global lease_store
+    with _lease_lock:
+        if lease_store is None:
+            lease_store = create_lease_store(SCRAPE_LEASE, table=CACHE_TABLE)
+        return lease_store
+
+def scrape_prices(listing_url=None):
+    """Scrape the latest announcement from BERA. Returns (fuel_data, error_response)"""
+    global last_announcement_url
+    listing_url = listing_url or BERA_URL
+    
+    # The announcement rarely changes, so fetch last time's while the listing downloads
+    guess = last_announcement_url if SPECULATIVE_PREFETCH else None
+    if guess and breakers.get(guess).state != CLOSED:
+        guess = None  # a recovering origin gets one probe, and that is the listing
+    speculative = start_prefetch(guess) if guess else None
+    
+    if STREAM_LISTING:
+        # 1-2. Stream the press releases page until the fuel price link shows up
+        with timing.span("stream_listing"):
+            announcement_url, reachable = stream_fuel_announcement(listing_url)
+        if not reachable:
+            return None, error_response(503, UNAVAILABLE)
+    else:
+        # 1. Get press releases page
+        with timing.span("fetch_listing"):
+            html, not_modified = fetch_conditional(listing_url)
+        if not html:
+            return None, error_response(503, UNAVAILABLE)
         
+        # 2. Find fuel price announcement link
+        with timing.span("find_announcement"):
+            announcement_url = parse_once(listing_url, not_modified,
+                                          lambda: find_fuel_announcement(html, listing_url))
+    if not announcement_url:
+        return None, error_response(500, PARSE_FAILED)
+    
+    # 3. Get announcement page, unless the prefetch already has it
+    with timing.span("fetch_announcement"):
+        if speculative and announcement_url == guess:
+            announcement_html, not_modified = speculative.result()
+        else:
+            announcement_html, not_modified = fetch_conditional(announcement_url)
+    if not announcement_html:
+        return None, error_response(503, UNAVAILABLE)
+    last_announcement_url = announcement_url
+    
+    # 4. Extract fuel data
+    with timing.span("extract_prices"):
+        fuel_data = parse_once(announcement_url, not_modified,
+                               lambda: extract_prices(announcement_html, announcement_url))
+    if not fuel_data:
+        return None, error_response(500, PARSE_FAILED)
+    
+    # 5. Append to the price history (a no-op for announcements already there)
+    with timing.span("record_history"):
+        record_history(fuel_data)
+    
+    return fuel_data, None
+
+def start_prefetch(url):
+    """Run fetch_conditional(url) on a worker thread and return its future"""
+    global _prefetch_pool
+    with _prefetch_lock:
+        if _prefetch_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+    # Carry the invocation's trace over, so the bytes it downloads are counted
+    return _prefetch_pool.submit(contextvars.copy_context().run, fetch_conditional, url)
+
+def get_history_store():
+    """Return the shared history store, opening it on first use"""
+    global history_store
+    with _history_lock:
+        if history_store is None:
+            history_store = create_history_store(HISTORY_BACKEND, HISTORY_PATH, HISTORY_TABLE)
+        return history_store
+
+def record_history(fuel_data):
+    """Persist fuel_data in the history store, never failing the scrape"""
+    try:
+        return get_history_store().record(fuel_data)
+    except Exception as e:
+        print(f"History write failed: {e}")
+        return 0
+
+def get_price_history(event, context):
+    """Lambda function for GET /prices/history?from=&to=&product=&limit=&cursor="""
+    with timing.trace("get_price_history", METRICS_ENABLED) as trace:
+        response = serve_price_history(event)
+        if trace:
+            trace.properties["statusCode"] = response["statusCode"]
+    return response
+
+def serve_price_history(event):
+    """Answer a /prices/history request from the history store"""
+    params = (event or {}).get("queryStringParameters") or {}
+    start, end = params.get("from"), params.get("to")
+    for value in (start, end):
+        if value and not is_iso_date(value):
+            return error_response(400, "'from' and 'to' must be dates in YYYY-MM-DD format.")
+    try:
+        limit = int(params.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        return error_response(400, f"'limit' must be between 1 and {MAX_LIMIT}.")
+    
+    try:
+        with timing.span("query_history"):
+            page = get_history_store().query(start, end, params.get("product"), limit, params.get("cursor"))
+    except ValueError as e:
+        return error_response(400, str(e))
     except Exception as e:
         print(f"Error: {e}")
-        return error_response(500, "Failed to parse data from the source. The scraper may need an update.")
+        return error_response(500, "Price history is currently unavailable.")
+    
+    return encode_response(json_response(200, dumps(page)), event)
+
+def get_session():
+    """Return the shared connection-pooled session, creating it on first use"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            # Imported here so cold starts answered from the cache never pay for them
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.retry import Retry
+
+            # Read timeouts are not retried: each one already waited TIMEOUT seconds, and
+            # retrying them would outlast the Lambda's own timeout instead of answering 503
+            retry = Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=0, status=HTTP_RETRIES,
+                          backoff_factor=HTTP_BACKOFF, status_forcelist=(502, 503, 504),
+                          allowed_methods=frozenset(["GET"]))
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS,
+                                  pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; FuelPriceBot/1.0)'
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
 
 def fetch_page(url):
     """Fetch webpage content"""
+    return fetch_conditional(url)[0]
+
+def fetch_conditional(url):
+    """Fetch webpage content, revalidating the copy from the last fetch.
+    Returns (html, not_modified); html is None on failure"""
+    breaker = breakers.get(url)
+    if not breaker.allow():
+        return None, False  # the origin is down: fail now rather than after TIMEOUT
+    response = None
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (compatible; FuelPriceBot/1.0)'}
-        response = requests.get(url, headers=headers, timeout=TIMEOUT)
+        cached = page_validators.get(url)
+        if cached and cached["body"] is None:
+            cached = None  # only the parsed result of a streamed fetch was kept
+        
+        response = get_session().get(url, headers=conditional_headers(cached), timeout=TIMEOUT)
+        breaker.record(response.status_code < 500)
+        if response.status_code == 304 and cached:
+            return cached["body"], True
         response.raise_for_status()
-        return response.text
+        timing.add_bytes(len(response.content))
+        
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            page_validators.put(url, {"etag": etag, "lastModified": last_modified, "body": response.text})
+        else:
+            page_validators.pop(url)
+        return response.text, False
     except:
-        return None
+        if response is None:
+            breaker.record(False)  # connection error, timeout or retries exhausted
+        return None, False
+
+def conditional_headers(cached):
+    """If-None-Match / If-Modified-Since headers for a previously fetched page"""
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers['If-None-Match'] = cached["etag"]
+        if cached["lastModified"]:
+            headers['If-Modified-Since'] = cached["lastModified"]
+    return headers
 
-def find_fuel_announcement(html):
+def stream_fuel_announcement(url):
+    """Find the fuel price link while downloading the listing page, and stop
+    reading as soon as it is found. Returns (announcement_url, reachable)"""
+    breaker = breakers.get(url)
+    if not breaker.allow():
+        return None, False
+    response = None
+    try:
+        cached = page_validators.get(url)
+        with get_session().get(url, headers=conditional_headers(cached), timeout=TIMEOUT,
+                               stream=True) as response:
+            breaker.record(response.status_code < 500)
+            if response.status_code == 304 and cached and "parsed" in cached:
+                return cached["parsed"], True
+            response.raise_for_status()
+            
+            decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+            announcement_url = find_fuel_announcement_in_chunks(
+                (decode_chunk(decoder, chunk) for chunk in response.iter_content(STREAM_CHUNK_SIZE)), url)
+            
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if etag or last_modified:
+                page_validators.put(url, {"etag": etag, "lastModified": last_modified,
+                                          "body": None, "parsed": announcement_url})
+            return announcement_url, True
+    except:
+        if response is None:
+            breaker.record(False)
+        return None, False
+
+def decode_chunk(decoder, chunk):
+    timing.add_bytes(len(chunk))
+    return decoder.decode(chunk)
+
+def parse_once(url, not_modified, parse):
+    """Run parse() on a freshly fetched page, or reuse its result if the page was not modified"""
+    cached = page_validators.get(url)
+    if not_modified and cached and "parsed" in cached:
+        return cached["parsed"]
+    result = parse()
+    if cached is not None:
+        cached["parsed"] = result
+    return result
+
+def find_fuel_announcement(html, base_url=None):
     """Find the latest fuel price announcement link"""
     try:
-        soup = BeautifulSoup(html, 'html.parser')
-        
         # Look for links with fuel-related keywords
-        keywords = ['fuel price', 'petroleum price', 'petrol price', 'diesel price']
-        
-        for link in soup.find_all('a', href=True):
-            text = link.get_text().lower()
-            if any(keyword in text for keyword in keywords):
-                href = link['href']
-                # Convert relative URL to absolute
-                if href.startswith('/'):
-                    return urljoin(BERA_URL, href)
-                return href
+        for href, text in parser_backend.links(html):
+            text = text.lower()
+            if any(keyword in text for keyword in FUEL_KEYWORDS):
+                return absolute_url(href, base_url)
         
         return None
     except:
         return None
 
-def extract_prices(html, source_url):
-    """Extract fuel prices from announcement page"""
+def find_fuel_announcement_in_chunks(chunks, base_url=None):
+    """Find the latest fuel price announcement link in HTML arriving in pieces,
+    without consuming any more chunks once it is found"""
     try:
-        soup = BeautifulSoup(html, 'html.parser')
-        text = soup.get_text()
-        
-        # Extract date
-        date_match = re.search(r'effective.*?(\d{1,2}.*?\d{4})', text, re.IGNORECASE)
-        effective_date = date_match.group(1) if date_match else "Date not specified"
-        
-        # Extract prices for each fuel type
-        fuel_types = [
-            ("Retail Pump Price - Unleaded Petrol 93", r'petrol\s+93.*?(\d+\.\d+)'),
-            ("Retail Pump Price - Unleaded Petrol 95", r'petrol\s+95.*?(\d+\.\d+)'),
-            ("Retail Pump Price - Diesel 50ppm", r'diesel.*?(\d+\.\d+)'),
-            ("Wholesale Price - Illuminating Paraffin", r'paraffin.*?(\d+\.\d+)')
-        ]
-        
-        prices = []
-        for product, pattern in fuel_types:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                try:
-                    price = float(match.group(1))
-                    prices.append({"product": product, "price": price})
-                except:
-                    continue
+        finder = AnchorFinder(FUEL_KEYWORDS)
+        for chunk in chunks:
+            finder.feed(chunk)
+            if finder.href is not None:
+                break
+        else:
+            finder.close()
         
-        if not prices:
+        if finder.href is None:
             return None
-        
-        return {
-            "effectiveDate": effective_date,
-            "currency": "BWP",
-            "prices": prices,
-            "sourceUrl": source_url
-        }
-        
+        return absolute_url(finder.href, base_url)
+    except:
+        return None
+
+def absolute_url(href, base_url=None):
+    """Convert relative URL to absolute"""
+    if href.startswith('/'):
+        return urljoin(base_url or BERA_URL, href)
+    return href
+
+class AnchorFinder(HTMLParser):
+    """Incremental tokenizer that records the href of the first link whose text
+    contains one of the keywords"""
+    
+    def __init__(self, keywords):
+        super().__init__(convert_charrefs=True)
+        self.keywords = keywords
+        self.href = None
+        self._open_href = None
+        self._text = []
+    
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a' and self.href is None:
+            self._check_open_link()
+            self._open_href = dict(attrs).get('href')
+            self._text = []
+    
+    def handle_data(self, data):
+        if self._open_href is not None:
+            self._text.append(data)
+    
+    def handle_endtag(self, tag):
+        if tag == 'a':
+            self._check_open_link()
+    
+    def close(self):
+        super().close()
+        self._check_open_link()
+    
+    def _check_open_link(self):
+        if self._open_href is not None and self.href is None:
+            text = ''.join(self._text).lower()
+            if any(keyword in text for keyword in self.keywords):
+                self.href = self._open_href
+        self._open_href = None
+
+def extract_prices(html, source_url):
+    """Extract fuel prices from announcement page, skipping pages already parsed"""
+    return parse_memo.get_or_compute(html, lambda: parse_prices(html, source_url), source_url)
+
+def parse_prices(html, source_url):
+    """Parse fuel prices out of announcement page HTML"""
+    try:
+        return scan_announcement(html, source_url)
     except:
         return None
 
-def error_response(status_code, message):
-    """Create error response"""
+def scan_announcement(html, source_url):
+    """parse_prices() that lets parser errors propagate. Returns fuel_data, or None without prices"""
+    # Extract date and prices for each fuel type in one pass, over the price region if one is found
+    with timing.span("parse_html"):
+        scanned = region_locator.scan(html, source_url) if REGION_EXTRACTION else None
+        if scanned is None:
+            scanned = scan_prices(parser_backend.text(html))
+        elif scanned[0] is None:
+            # Neither the region nor the text after "effective" had a date: take the whole page's
+            scanned = scan_prices(parser_backend.text(html))[0], scanned[1]
+    effective_date, found = scanned
+    effective_date = effective_date or "Date not specified"
+    prices = [{"product": product, "price": price} for product, price in found]
+    
+    if not prices:
+        return None
+    
     return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        },
-        "body": json.dumps({"error": message})
-    }
\ No newline at end of file
+        "effectiveDate": effective_date,
+        "currency": "BWP",
+        "prices": prices,
+        "sourceUrl": source_url
+    }
+
+def success_response(fuel_data, cache_status=REVALIDATED, body=None):
+    """Create success response, reusing an already serialized body if given"""
+    return json_response(200, dumps(fuel_data) if body is None else body, {"X-Cache-Status": cache_status})
+
+def snapshot_response(snapshot, cache_status, event=None):
+    """Success response for a cached snapshot, using the body, ETag and
+    compressed variants prepared when it was stored. Answers 304 when the
+    client's If-None-Match already has this content"""
+    response = success_response(snapshot["data"], cache_status, snapshot.get("body"))
+    etag = snapshot.get("etag") or etag_for(response["body"])
+    response["headers"].update({
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={min(price_cache.max_age(snapshot), RESPONSE_MAX_AGE)}",
+        "Last-Modified": http_date(snapshot.get("lastModified", snapshot["storedAt"])),
+    })
+    response = encode_response(response, event, snapshot.get("encoded"))
+    if if_none_match(event, etag):
+        return not_modified(response)
+    return response
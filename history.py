@@ -0,0 +1,350 @@
+import base64
+import json
+import os
+import re
+import threading
+import time
+from datetime import date
+
+# Append-only history of every announcement the scraper has parsed.
+#
+# One row per (effective date, product, source announcement). Effective dates
+# are stored as ISO YYYY-MM-DD strings so they sort and range-compare as text,
+# or NULL when the announcement's date could not be read; those rows are kept
+# once per announced text but left out of queries, which are in date order,
+# and both indexes end in the rowid, so a date-range query with or without a
+# product filter walks one index in order and stops after `limit` rows.
+# Pages are keyset cursors (the last row's date and id), never OFFSETs, so
+# deep pages cost the same as the first one.
+
+MONTHS = ["january", "february", "march", "april", "may", "june", "july",
+          "august", "september", "october", "november", "december"]
+
+_DAY_MONTH_YEAR = re.compile(r'(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([a-z]+)\.?,?\s+(\d{4})', re.IGNORECASE)
+_MONTH_DAY_YEAR = re.compile(r'([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?\s+(\d{4})', re.IGNORECASE)
+# Day first, as written in Botswana, unless only month first makes sense
+_NUMERIC_DATE = re.compile(r'\b(\d{1,2})([/.-])(\d{1,2})\2(\d{4})\b')
+_ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def normalize_date(text):
+    """'1st July 2024', 'July 1, 2024' or '01/07/2024' -> '2024-07-01', or
+    None if text holds no recognisable date"""
+    text = text or ""
+    for match in _DAY_MONTH_YEAR.finditer(text):
+        day, month, year = match.groups()
+        found = _iso_date(year, _month_number(month), day)
+        if found:
+            return found
+    for match in _MONTH_DAY_YEAR.finditer(text):
+        month, day, year = match.groups()
+        found = _iso_date(year, _month_number(month), day)
+        if found:
+            return found
+    for match in _NUMERIC_DATE.finditer(text):
+        first, _, second, year = match.groups()
+        found = _iso_date(year, second, first) or _iso_date(year, first, second)
+        if found:
+            return found
+    return None
+
+
+def _month_number(name):
+    # Full names and abbreviations ("Jul", "Sept")
+    return next((i for i, month in enumerate(MONTHS, start=1)
+                 if len(name) >= 3 and month.startswith(name.lower())), None)
+
+
+def _iso_date(year, month, day):
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except (TypeError, ValueError):
+        return None
+
+
+def is_iso_date(value):
+    return bool(_ISO_DATE.match(value))
+
+
+def encode_cursor(effective_date, row_id):
+    raw = json.dumps([effective_date, row_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        effective_date, row_id = json.loads(raw)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(effective_date, str) or not isinstance(row_id, int):
+        raise ValueError("Invalid cursor")
+    return effective_date, row_id
+
+
+def history_rows(fuel_data, recorded_at=None):
+    """Flatten one fuel_data dict into history rows"""
+    recorded_at = time.time() if recorded_at is None else recorded_at
+    effective_text = fuel_data.get("effectiveDate")
+    return [{
+        "effectiveDate": normalize_date(effective_text),
+        "effectiveText": effective_text,
+        "product": price["product"],
+        "price": price["price"],
+        "currency": fuel_data.get("currency", "BWP"),
+        "sourceUrl": fuel_data.get("sourceUrl"),
+        "recordedAt": recorded_at,
+    } for price in fuel_data.get("prices", [])]
+
+
+class HistoryStore:
+    """Interface for history backends
+
+    record(fuel_data) appends one announcement's prices and returns how many
+    rows were new; recording the same announcement again is a no-op.
+    query(...) returns {"items": [...], "nextCursor": str | None} in
+    (effectiveDate, insertion) order.
+    """
+
+    def record(self, fuel_data, recorded_at=None):
+        return self.record_rows(history_rows(fuel_data, recorded_at))
+
+    def record_rows(self, rows):
+        raise NotImplementedError
+
+    def query(self, start=None, end=None, product=None, limit=DEFAULT_LIMIT, cursor=None):
+        raise NotImplementedError
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """History in a SQLite database file (or ":memory:")"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS price_history (
+            id INTEGER PRIMARY KEY,
+            effective_date TEXT,
+            effective_text TEXT,
+            product TEXT NOT NULL,
+            price REAL NOT NULL,
+            currency TEXT NOT NULL,
+            source_url TEXT NOT NULL DEFAULT '',
+            recorded_at REAL NOT NULL,
+            UNIQUE (effective_date, product, source_url)
+        );
+        CREATE INDEX IF NOT EXISTS price_history_by_date ON price_history (effective_date);
+        CREATE INDEX IF NOT EXISTS price_history_by_product ON price_history (product, effective_date);
+        CREATE UNIQUE INDEX IF NOT EXISTS price_history_undated ON price_history (ifnull(effective_text, ''), product, source_url)
+            WHERE effective_date IS NULL;
+    """
+
+    def __init__(self, path):
+        import sqlite3  # only paid for by invocations that touch history
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL" if path != ":memory:" else "PRAGMA journal_mode=MEMORY")
+        self._connection.executescript(self.SCHEMA)
+        self._lock = threading.Lock()
+
+    def record_rows(self, rows):
+        values = [(row["effectiveDate"], row["effectiveText"], row["product"], row["price"],
+                   row["currency"], row["sourceUrl"] or "", row["recordedAt"]) for row in rows]
+        if not values:
+            return 0
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.execute("BEGIN")
+            try:
+                self._connection.executemany(
+                    "INSERT OR IGNORE INTO price_history (effective_date, effective_text, product, price, "
+                    "currency, source_url, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?)", values)
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+            return self._connection.total_changes - before
+
+    def _select(self, start, end, product, cursor, limit):
+        conditions, params = ["effective_date IS NOT NULL"], []
+        if product:
+            conditions.append("product = ?")
+            params.append(product)
+        if start:
+            conditions.append("effective_date >= ?")
+            params.append(start)
+        if end:
+            conditions.append("effective_date <= ?")
+            params.append(end)
+        if cursor:
+            conditions.append("(effective_date, id) > (?, ?)")
+            params.extend(decode_cursor(cursor))
+        where = f"WHERE {' AND '.join(conditions)}"
+        sql = ("SELECT id, effective_date, effective_text, product, price, currency, source_url "
+               f"FROM price_history {where} ORDER BY effective_date, id LIMIT ?")
+        return sql, params + [limit]
+
+    def query(self, start=None, end=None, product=None, limit=DEFAULT_LIMIT, cursor=None):
+        # One extra row tells us whether there is a next page
+        sql, params = self._select(start, end, product, cursor, limit + 1)
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+
+        items = [{
+            "effectiveDate": effective_date,
+            "announcedAs": effective_text,
+            "product": product_name,
+            "price": price,
+            "currency": currency,
+            "sourceUrl": source_url or None,
+        } for _, effective_date, effective_text, product_name, price, currency, source_url in rows[:limit]]
+        next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+        return {"items": items, "nextCursor": next_cursor}
+
+    def explain(self, start=None, end=None, product=None, cursor=None):
+        """SQLite's plan for a query, to check it is answered from an index"""
+        sql, params = self._select(start, end, product, cursor, DEFAULT_LIMIT)
+        with self._lock:
+            return [row[-1] for row in self._connection.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+    def close(self):
+        self._connection.close()
+
+
+class DynamoDBHistoryStore(HistoryStore):
+    """History in a DynamoDB table, shared by every function and container
+
+    Dated rows live in one partition ("series" = "dated") sorted by
+    "effectiveDate#product#sourceUrl", so a date range is one Query in date
+    order (then product, rather than insertion, within a date); the sparse
+    "by-product" index has the same sort key under a "datedProduct"
+    partition. Undated rows go to the "undated" partition and have no
+    "datedProduct", so queries never read them.
+    Rows are written with a condition on their key, so recording the same
+    announcement again writes nothing.
+    """
+
+    INDEX = "by-product"
+
+    def __init__(self, table_name, client=None):
+        if client is None:
+            import boto3  # provided by the Lambda runtime, only needed for this store
+            client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = client
+
+    @staticmethod
+    def _sort_key(row):
+        return "#".join((row["effectiveDate"] or row["effectiveText"] or "", row["product"], row["sourceUrl"] or ""))
+
+    def record_rows(self, rows):
+        added = 0
+        for row in rows:
+            item = {
+                "series": {"S": "dated" if row["effectiveDate"] else "undated"},
+                "sk": {"S": self._sort_key(row)},
+                "product": {"S": row["product"]},
+                "price": {"N": repr(float(row["price"]))},
+                "currency": {"S": row["currency"]},
+                "recordedAt": {"N": repr(float(row["recordedAt"]))},
+            }
+            for name in ("effectiveDate", "effectiveText", "sourceUrl"):
+                if row[name]:
+                    item[name] = {"S": row[name]}
+            if row["effectiveDate"]:
+                item["datedProduct"] = {"S": row["product"]}
+            try:
+                self.client.put_item(TableName=self.table_name, Item=item,
+                                     ConditionExpression="attribute_not_exists(sk)")
+                added += 1
+            except Exception as e:
+                if _error_code(e) != "ConditionalCheckFailedException":
+                    raise
+        return added
+
+    def query(self, start=None, end=None, product=None, limit=DEFAULT_LIMIT, cursor=None):
+        # "#" sorts before every character of a product name, "~" after every digit
+        request = {
+            "TableName": self.table_name,
+            "KeyConditionExpression": "#p = :p AND sk BETWEEN :low AND :high",
+            "ExpressionAttributeValues": {":low": {"S": start or "0"}, ":high": {"S": (end or "9999-12-31") + "#~"}},
+        }
+        if product:
+            request.update(IndexName=self.INDEX, ExpressionAttributeNames={"#p": "datedProduct"})
+            request["ExpressionAttributeValues"][":p"] = {"S": product}
+        else:
+            request["ExpressionAttributeNames"] = {"#p": "series"}
+            request["ExpressionAttributeValues"][":p"] = {"S": "dated"}
+        if cursor:
+            start_key = {"series": {"S": "dated"}, "sk": {"S": _decode_key(cursor)}}
+            if product:
+                start_key["datedProduct"] = {"S": product}
+            request["ExclusiveStartKey"] = start_key
+
+        # One extra item tells us whether there is a next page
+        items = []
+        while len(items) <= limit:
+            response = self.client.query(Limit=limit + 1 - len(items), **request)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                break
+            request["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+        page = [{
+            "effectiveDate": item["effectiveDate"]["S"],
+            "announcedAs": item.get("effectiveText", {}).get("S"),
+            "product": item["product"]["S"],
+            "price": float(item["price"]["N"]),
+            "currency": item["currency"]["S"],
+            "sourceUrl": item.get("sourceUrl", {}).get("S"),
+        } for item in items[:limit]]
+        next_cursor = _encode_key(items[limit - 1]["sk"]["S"]) if len(items) > limit else None
+        return {"items": page, "nextCursor": next_cursor}
+
+
+def _encode_key(sort_key):
+    return base64.urlsafe_b64encode(json.dumps([sort_key]).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_key(cursor):
+    """Inverse of _encode_key; raises ValueError on a malformed cursor"""
+    try:
+        [sort_key] = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(sort_key, str):
+        raise ValueError("Invalid cursor")
+    return sort_key
+
+
+def _error_code(error):
+    # botocore's ClientError, without importing botocore
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+
+class NullHistoryStore(HistoryStore):
+    """Keeps nothing, for deployments with history turned off"""
+
+    def record_rows(self, rows):
+        return 0
+
+    def query(self, start=None, end=None, product=None, limit=DEFAULT_LIMIT, cursor=None):
+        if cursor:
+            decode_cursor(cursor)
+        return {"items": [], "nextCursor": None}
+
+
+def create_history_store(name, path=None, table=None, client=None):
+    """Build a history store from its configured name"""
+    if name == "sqlite":
+        import tempfile
+        return SQLiteHistoryStore(path or os.path.join(tempfile.gettempdir(), "fuel-price-history.sqlite3"))
+    if name == "dynamodb":
+        return DynamoDBHistoryStore(table, client)
+    if name == "none":
+        return NullHistoryStore()
+    raise ValueError(f"Unknown history backend: {name}")
@@ -0,0 +1,159 @@
+import importlib.util
+from html.parser import HTMLParser
+
+# HTML parser backends.
+#
+# The scraper only needs two things from a page: its text (for the price
+# regexes) and its links (to find the announcement). Each backend provides
+# both; all of them leave <script>/<style> contents out of the text, like
+# BeautifulSoup's get_text() does.
+#
+# "stream" never builds a tree: it keeps the visible text as the standard
+# library tokenizer emits it, skipping <nav> menus as well, so memory stays
+# at the size of the text rather than of a DOM. It is the fastest option
+# without compiled wheels.
+
+FALLBACK_ORDER = ["selectolax", "lxml", "stream", "html.parser"]
+
+
+
+class HtmlParserBackend:
+    """BeautifulSoup with Python's built-in html.parser (always available)"""
+
+    name = "html.parser"
+    module = "bs4"
+
+    def text(self, html):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, 'html.parser').get_text()
+
+    def links(self, html):
+        from bs4 import BeautifulSoup
+        for link in BeautifulSoup(html, 'html.parser').find_all('a', href=True):
+            yield link['href'], link.get_text()
+
+
+class LxmlBackend:
+    """lxml's C parser, used directly rather than through BeautifulSoup"""
+
+    name = "lxml"
+    module = "lxml"
+
+    def _document(self, html):
+        import lxml.html
+        return lxml.html.document_fromstring(html)
+
+    def text(self, html):
+        document = self._document(html)
+        for element in document.xpath('//script|//style'):
+            element.drop_tree()
+        return document.text_content()
+
+    def links(self, html):
+        for link in self._document(html).iter('a'):
+            href = link.get('href')
+            if href is not None:
+                yield href, link.text_content()
+
+
+class SelectolaxBackend:
+    """selectolax's Lexbor engine, the fastest option when installed"""
+
+    name = "selectolax"
+    module = "selectolax"
+
+    def _tree(self, html):
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser(html)
+
+    def text(self, html):
+        tree = self._tree(html)
+        tree.strip_tags(['script', 'style'])
+        return tree.root.text(separator='') if tree.root else ''
+
+    def links(self, html):
+        for link in self._tree(html).css('a[href]'):
+            yield link.attributes.get('href') or '', link.text(separator='')
+
+
+class _TextExtractor(HTMLParser):
+    """Collect visible text and links while tokenizing, without building a tree"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.links = []
+        self._in_code = None
+        self._menus = 0
+        self._menu_text = []
+        self._link = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._in_code = tag
+        elif tag == 'nav':
+            self._menus += 1
+        elif tag == 'a':
+            href = dict(attrs).get('href')
+            self._link = (href, []) if href is not None else None
+
+    def handle_endtag(self, tag):
+        if tag == self._in_code:
+            self._in_code = None
+        elif tag == 'nav' and self._menus:
+            self._menus -= 1
+            if not self._menus:
+                self._menu_text.clear()
+        elif tag == 'a' and self._link:
+            self.links.append((self._link[0], ''.join(self._link[1])))
+            self._link = None
+
+    def handle_data(self, data):
+        if self._in_code:
+            return
+        if self._link:
+            self._link[1].append(data)
+        (self._menu_text if self._menus else self.parts).append(data)
+
+    def text(self):
+        # A menu that is never closed would swallow the rest of the page: keep it
+        return ''.join(self.parts + self._menu_text)
+
+
+class StreamBackend:
+    """Python's tokenizer on its own, keeping only text and links"""
+
+    name = "stream"
+    module = "html.parser"
+
+    def _extract(self, html):
+        extractor = _TextExtractor()
+        extractor.feed(html)
+        extractor.close()
+        return extractor
+
+    def text(self, html):
+        return self._extract(html).text()
+
+    def links(self, html):
+        return iter(self._extract(html).links)
+
+
+BACKENDS = {backend.name: backend for backend in (HtmlParserBackend(), LxmlBackend(), SelectolaxBackend(), StreamBackend())}
+
+
+def is_available(name):
+    """Whether the backend's wheel is installed"""
+    return importlib.util.find_spec(BACKENDS[name].module) is not None
+
+
+def get_backend(name="auto"):
+    """Return the named backend, or the fastest installed one if it is missing"""
+    if name in BACKENDS and is_available(name):
+        return BACKENDS[name]
+    if name not in ("auto", None):
+        print(f"HTML parser '{name}' is not available, falling back")
+    for fallback in FALLBACK_ORDER:
+        if is_available(fallback):
+            return BACKENDS[fallback]
+    raise RuntimeError("No HTML parser available, install beautifulsoup4")
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Scheduled poller that scrapes BERA and writes the result into the shared store,
+so get_prices (with SERVE_FROM_STORE=true) never scrapes on a user request.
+
+Run locally against the bundled fixtures and an in-memory store:
+    python poller.py
+or against any listing page:
+    python poller.py --url http://127.0.0.1:8000/media/press-releases
+"""
+
+import argparse
+import json
+
+import handler
+import timing
+
+
+def poll_prices(event, context):
+    """Scheduled Lambda function that refreshes the stored fuel prices.
+    With ADAPTIVE_POLLING, triggers before the next poll is due do nothing;
+    {"force": true} polls regardless"""
+    with timing.trace("poll_prices", handler.METRICS_ENABLED) as trace:
+        result = run_poll(force=bool((event or {}).get("force")))
+        if trace:
+            trace.properties["updated"] = result["updated"]
+            trace.properties["skipped"] = result.get("skipped", False)
+            trace.properties["parseMemo"] = handler.parse_memo.stats()
+    return result
+
+
+def run_poll(force=False):
+    """Scrape BERA once and store the result"""
+    schedule = state = None
+    if handler.ADAPTIVE_POLLING:
+        from adaptive import AdaptiveSchedule
+        schedule = AdaptiveSchedule(handler.POLL_BASE_INTERVAL, handler.POLL_MAX_INTERVAL)
+        state = load_schedule_state()
+        if not force and not schedule.due(state):
+            return {"updated": False, "skipped": True, "nextPollAt": state["nextPollAt"]}
+
+    fuel_data = previous = None
+    try:
+        if handler.ASYNC_PIPELINE:
+            import async_handler
+            fuel_data, error = async_handler.run(async_handler.scrape_prices_async())
+        else:
+            fuel_data, error = handler.scrape_prices()
+        if error:
+            print(f"Poll failed: {error['body']}")
+            result = {"updated": False, "statusCode": error["statusCode"]}
+        else:
+            previous = handler.price_cache.last_snapshot()
+            handler.price_cache.put(fuel_data)
+            result = {"updated": True, "effectiveDate": fuel_data["effectiveDate"],
+                      "sourceUrl": fuel_data["sourceUrl"]}
+
+    except Exception as e:
+        print(f"Error: {e}")
+        fuel_data, result = None, {"updated": False, "statusCode": 500}
+
+    if schedule:
+        changed = bool(fuel_data and previous) and previous["data"] != fuel_data
+        state = schedule_next_poll(schedule, state, changed, fuel_data)
+        result["nextPollAt"] = state["nextPollAt"]
+    return result
+
+
+def schedule_next_poll(schedule, state, changed, fuel_data=None):
+    """Record the poll's outcome in the schedule and store it"""
+    from adaptive import MAX_CHANGE_DATES, Cadence, change_dates
+    from history import normalize_date
+
+    # Any new ETag / Last-Modified on the listing counts as activity, even
+    # before a new announcement (and so a price change) is parsed from it
+    cached = handler.page_validators.get(handler.BERA_URL) or {}
+    listing_version = cached.get("etag") or cached.get("lastModified")
+    known_version = (state or {}).get("listingVersion")
+    listing_changed = bool(listing_version and known_version and listing_version != known_version)
+
+    # Dates remembered in the shared state, plus the history's and this poll's,
+    # so a cold start with an empty local history does not forget the cadence
+    dates = set((state or {}).get("changeDates", []))
+    try:
+        dates.update(change_dates(handler.get_history_store()))
+    except Exception as e:
+        print(f"History unavailable for the poll schedule: {e}")
+    effective_date = normalize_date(fuel_data["effectiveDate"]) if fuel_data else None
+    if effective_date:
+        dates.add(effective_date)
+    dates = sorted(dates)[-MAX_CHANGE_DATES:]
+
+    state = schedule.after_poll(state, Cadence(dates), changed, listing_changed)
+    state["listingVersion"] = listing_version or known_version
+    state["changeDates"] = dates
+    save_schedule_state(state)
+    return state
+
+
+def load_schedule_state():
+    """Adaptive schedule state, kept in the snapshot store next to the prices"""
+    from adaptive import STATE_KEY
+    try:
+        return handler.price_cache.backend.get(STATE_KEY)
+    except Exception as e:
+        print(f"Poll schedule read failed: {e}")
+        return None
+
+
+def save_schedule_state(state):
+    from adaptive import STATE_KEY
+    try:
+        handler.price_cache.backend.set(STATE_KEY, state)
+    except Exception as e:
+        print(f"Poll schedule write failed: {e}")
+
+
+def main():
+    from cache import InMemoryKeyValueStore, KeyValueBackend, SnapshotCache
+    from stub_server import StubBera
+
+    parser = argparse.ArgumentParser(description="Run the price poller once against a local store")
+    parser.add_argument("--url", help="press releases page to poll (default: bundled fixtures)")
+    args = parser.parse_args()
+
+    handler.price_cache = SnapshotCache(KeyValueBackend(InMemoryKeyValueStore()),
+                                        handler.CACHE_TTL, handler.CACHE_STALE_TTL)
+    handler.SERVE_FROM_STORE = True
+
+    stub = None
+    if args.url:
+        handler.BERA_URL = args.url
+    else:
+        stub = StubBera().start()
+        handler.BERA_URL = stub.url()
+
+    try:
+        print(f"Polling {handler.BERA_URL}")
+        print(json.dumps(poll_prices({}, None), indent=2))
+        response = handler.get_prices({}, None)
+        print(f"get_prices -> {response['statusCode']} ({response['headers'].get('X-Cache-Status')})")
+        print(json.dumps(json.loads(response["body"]), indent=2))
+    finally:
+        if stub:
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import re
+from bisect import bisect_left
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from cache import LRUCache
+from extraction import DATE, DATE_GROUP, FUEL_TYPES, KEYWORDS, PRICE, scan_prices
+
+# Region-scoped price extraction.
+#
+# Scanning the whole page text lets a product keyword pick up a number from a
+# menu, a footer or a neighbouring cell: get_text() runs the cells of
+# "<td>14.25</td><td>14.50</td>" together into "14.2514.50". Instead, the
+# locator first finds the block that holds the prices - a <table>, a <dl>, a
+# <ul>/<ol> or a paragraph - as the one naming the most products (the
+# innermost one on a tie). Only that slice of the HTML is tokenized, into rows
+# of cells, and scanned one row per line. When a table header lists an old
+# and a new price, only the new price column is read. Products the page names
+# outside the block, like paraffin in a paragraph below the table, are read
+# from the next blocks naming them. The effective date is taken from the
+# region, or else from the text after the first visible "effective" on the
+# page.
+#
+# Pages built from one template keep their prices in the same place, so the
+# opening tag of the block that worked is remembered per template (host and
+# <body> tag) and looked for first on the next page. A tag as plain as <p> can
+# match an earlier block, so the remembered block is only used when it prices
+# every product the page names; otherwise the page is searched again. When no
+# block has prices scan() returns None and the caller scans the whole page
+# text instead.
+
+_OPEN_BLOCK = re.compile(r'<(table|dl|ul|ol|p)\b[^>]*>')
+_BLOCK_EDGES = {tag: re.compile(rf'<(/?){tag}\b') for tag in ('table', 'dl', 'ul', 'ol')}
+# Paragraphs cannot contain blocks, so the next block ends one left unclosed
+_PARAGRAPH_END = re.compile(r'</p\b|<(?:p|div|table|dl|ul|ol|h[1-6])\b')
+
+# Blocks tried, best first, before falling back to the whole page
+MAX_CANDIDATES = 3
+# Characters after "effective" searched for the date
+DATE_WINDOW = 200
+
+_NEW_PRICE = re.compile(r'\bnew\b')
+_OLD_PRICE = re.compile(r'\b(?:old|previous|current|was)\b')
+
+_ROW_TAGS = {'tr', 'li', 'p', 'br', 'div', 'table', 'thead', 'tbody', 'tfoot', 'caption',
+             'ul', 'ol', 'dl', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+_CELL_TAGS = {'td', 'th', 'dd'}
+
+# Product -> name of its group in KEYWORDS
+_GROUPS = {product: f'p{i}' for i, (product, _) in enumerate(FUEL_TYPES)}
+_ORDER = {product: i for i, (product, _) in enumerate(FUEL_TYPES)}
+# One pattern per product: each search stops at its first hit, where walking
+# every KEYWORDS match costs more than the rest of a reused scan on a big page
+_PRODUCTS = [(_GROUPS[product], re.compile(keyword)) for product, keyword in FUEL_TYPES]
+
+
+class _RowParser(HTMLParser):
+    """Rows of whitespace-normalised cell text from a slice of HTML"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self._cells = []
+        self._text = []
+        self._in_code = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._in_code = tag
+        elif tag in _ROW_TAGS or tag == 'dt':
+            self._end_row()
+        elif tag in _CELL_TAGS:
+            self._end_cell()
+
+    def handle_endtag(self, tag):
+        if tag == self._in_code:
+            self._in_code = None
+        elif tag in _ROW_TAGS:
+            self._end_row()
+        elif tag in _CELL_TAGS or tag == 'dt':
+            # A term and its definitions share a row
+            self._end_cell()
+
+    def handle_data(self, data):
+        if not self._in_code:
+            self._text.append(data)
+
+    def close(self):
+        super().close()
+        self._end_row()
+
+    def _end_cell(self):
+        cell = ' '.join(''.join(self._text).split())
+        self._text.clear()
+        if cell:
+            self._cells.append(cell)
+
+    def _end_row(self):
+        self._end_cell()
+        if self._cells:
+            self.rows.append(self._cells)
+            self._cells = []
+
+
+def parse_rows(html):
+    """Rows of cell text in an HTML fragment"""
+    parser = _RowParser()
+    parser.feed(html)
+    parser.close()
+    return parser.rows
+
+
+def price_column(header):
+    """Index of the column prices are read from, by the header's cell names:
+    the new price when a table lists old and new ones. None to read whole rows"""
+    names = [name.lower() for name in header]
+    for i in range(1, len(names)):
+        if _NEW_PRICE.search(names[i]):
+            return i
+    for i in range(len(names) - 1, 0, -1):
+        if 'price' in names[i] and not _OLD_PRICE.search(names[i]):
+            return i
+    return None
+
+
+def row_lines(rows):
+    """One line of text per row. From the header naming the price column on, a
+    row keeps only its label cells and that column"""
+    column = None
+    for cells in rows:
+        if not any(PRICE.search(cell) for cell in cells):
+            if column is None and len(cells) > 1:
+                column = price_column(cells)
+                if column is not None:
+                    # Other columns may be headed with the dates of other prices
+                    cells = [cell for cell in cells[:column] if not DATE.search(cell)] + [cells[column]]
+        elif column is not None and column < len(cells):
+            cells = [cell for cell in cells[:column] if not PRICE.search(cell)] + [cells[column]]
+        yield ' '.join(cells)
+
+
+def block_end(lowered, tag, pos):
+    """Where the block whose opening tag ends at pos is closed (or the page ends)"""
+    if tag == 'p':
+        match = _PARAGRAPH_END.search(lowered, pos)
+        return match.start() if match else len(lowered)
+    depth = 1
+    for match in _BLOCK_EDGES[tag].finditer(lowered, pos):
+        depth += -1 if match.group(1) else 1
+        if not depth:
+            return match.start()
+    return len(lowered)
+
+
+def product_hits(lowered):
+    """(position, KEYWORDS group) of each product keyword on the page"""
+    return [(match.start(), match.lastgroup) for match in KEYWORDS.finditer(lowered)
+            if match.lastgroup != DATE_GROUP]
+
+
+def locate(lowered, hits):
+    """(tag, start, end of opening tag, groups named) of the blocks naming fuel
+    products, most products first and the smallest block first among equals"""
+    if not hits:
+        return []
+    positions = [pos for pos, _ in hits]
+    ranked = []
+    for match in _OPEN_BLOCK.finditer(lowered):
+        tag = match.group(1)
+        end = block_end(lowered, tag, match.end())
+        first, last = bisect_left(positions, match.end()), bisect_left(positions, end)
+        if first == last:
+            continue
+        groups = frozenset(group for _, group in hits[first:last])
+        ranked.append((-len(groups), end - match.start(), match.start(), tag, match.end(), groups))
+    ranked.sort(key=lambda block: block[:3])
+    return [(tag, start, opening_end, groups) for _, _, start, tag, opening_end, groups in ranked]
+
+
+def named_products(lowered):
+    """KEYWORDS groups of the products named anywhere on the page"""
+    return {group for group, pattern in _PRODUCTS if pattern.search(lowered)}
+
+
+def priced(prices):
+    """KEYWORDS groups of the products in a list of (product, price)"""
+    return {_GROUPS[product] for product, _ in prices}
+
+
+def scan_block(html, lowered, tag, start, opening_end):
+    """(effective_date, prices) from one block, or None if it has no prices"""
+    end = block_end(lowered, tag, opening_end)
+    effective_date, prices = scan_prices('\n'.join(row_lines(parse_rows(html[start:end]))))
+    return (effective_date, prices) if prices else None
+
+
+def effective_date(html, lowered):
+    """Date in the text block starting at the first visible "effective" followed by one"""
+    pos = lowered.find('effective')
+    while pos != -1:
+        if _in_text(lowered, pos):
+            rows = parse_rows(html[pos:pos + DATE_WINDOW])
+            match = DATE.search(' '.join(rows[0])) if rows else None
+            if match:
+                return match.group()
+        pos = lowered.find('effective', pos + 1)
+    return None
+
+
+def _in_text(lowered, pos):
+    """Whether pos is in page text rather than inside a tag, script or style"""
+    if lowered.rfind('<', 0, pos) > lowered.rfind('>', 0, pos):
+        return False
+    return all(lowered.rfind(f'<{tag}', 0, pos) <= lowered.rfind(f'</{tag}', 0, pos)
+               for tag in ('script', 'style'))
+
+
+def template_key(lowered, url=None):
+    """Pages from the same host with the same <body> tag are taken to share a template"""
+    start = lowered.find('<body')
+    body = lowered[start:lowered.find('>', start) + 1] if start != -1 else ''
+    return urlsplit(url).netloc if url else '', body
+
+
+class RegionLocator:
+    """Scan only the block of an announcement page that holds the prices,
+    remembering where it was for each page template"""
+
+    def __init__(self, maxsize=64):
+        # Template key -> (tag, opening tag) of the block prices were found in
+        self.strategies = LRUCache(maxsize)
+        self.located = 0
+        self.reused = 0
+        self.fallbacks = 0
+
+    def scan(self, html, url=None):
+        """(effective_date, [(product, price), ...]) like scan_prices(), or
+        None when no block on the page has prices"""
+        lowered = html.lower()
+        # Offsets into the lower-cased copy must line up with the page
+        if len(lowered) != len(html):
+            self.fallbacks += 1
+            return None
+
+        named = named_products(lowered)
+        template = template_key(lowered, url)
+        found = None
+        strategy = self.strategies.get(template)
+        if strategy is not None:
+            tag, opening = strategy
+            start = html.find(opening)
+            if start != -1:
+                found = scan_block(html, lowered, tag, start, start + len(opening))
+                if found and named <= priced(found[1]):
+                    self.reused += 1
+                else:
+                    found = None
+
+        if not found:
+            found = self._locate(html, lowered, named, template)
+            if not found:
+                self.fallbacks += 1
+                return None
+
+        date, prices = found
+        return date or effective_date(html, lowered), prices
+
+    def _locate(self, html, lowered, named, template):
+        """(effective_date, prices) from the best block with prices, completed
+        from the next blocks naming the products it lacks; None if none has prices"""
+        blocks = locate(lowered, product_hits(lowered))
+        for i, (tag, start, opening_end, _) in enumerate(blocks[:MAX_CANDIDATES]):
+            found = scan_block(html, lowered, tag, start, opening_end)
+            if found:
+                break
+        else:
+            return None
+        self.located += 1
+        self.strategies.put(template, (tag, html[start:opening_end]))
+
+        date, prices = found
+        missing = named - priced(prices)
+        tried = 0
+        for tag, start, opening_end, groups in blocks[i + 1:]:
+            if not missing or tried == MAX_CANDIDATES:
+                break
+            if not groups & missing:
+                continue
+            tried += 1
+            more = scan_block(html, lowered, tag, start, opening_end)
+            if more:
+                added = [(product, price) for product, price in more[1] if _GROUPS[product] in missing]
+                prices = sorted(prices + added, key=lambda item: _ORDER[item[0]])
+                missing -= priced(added)
+                date = date or more[0]
+        return date, prices
+
+    def stats(self):
+        return {"located": self.located, "reused": self.reused, "fallbacks": self.fallbacks,
+                "templates": len(self.strategies)}
@@ -0,0 +1,239 @@
+import base64
+import functools
+import importlib.util
+import json
+import os
+import time
+
+# Lambda proxy responses.
+#
+# A /prices body only changes when BERA publishes new prices, so it is
+# serialized (and compressed) once, by prepare(), when the snapshot is stored.
+# Each invocation then wraps the stored string in a fresh headers dict and
+# does no JSON work at all; encode_response() picks the variant matching the
+# client's Accept-Encoding. The ETag is computed with the body, so a client
+# that already has the content gets a 304 without any hashing either. Error
+# responses never change and are built at import time.
+
+# "auto" uses orjson when it is installed, "json" always uses the standard library
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "auto")
+# Compressed variants built next to each snapshot body; "br" needs the brotli package
+RESPONSE_ENCODINGS = [e.strip() for e in os.environ.get("RESPONSE_ENCODINGS", "gzip,br").split(",") if e.strip()]
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+
+UNAVAILABLE = "Data source (BERA) is currently unavailable."
+PARSE_FAILED = "Failed to parse data from the source. The scraper may need an update."
+
+HEADERS = {
+    "Content-Type": "application/json",
+    "Access-Control-Allow-Origin": "*"
+}
+
+_dumps = None
+
+
+def dumps(obj):
+    """Serialize obj to a JSON string, with orjson when it is available"""
+    global _dumps
+    if _dumps is None:
+        _dumps = json_encoder(JSON_BACKEND)
+    return _dumps(obj)
+
+
+def json_encoder(name="auto"):
+    """Return a function serializing to a JSON string with the named backend"""
+    if name in ("auto", "orjson") and importlib.util.find_spec("orjson") is not None:
+        # Imported on first use: it pulls in datetime, uuid and zoneinfo
+        import orjson
+        return lambda obj: orjson.dumps(obj).decode("utf-8")
+    if name not in ("auto", "json"):
+        print(f"JSON backend '{name}' is not available, falling back to json")
+    return json.dumps
+
+
+def compress(body, encoding):
+    """Compress a body string with gzip or br, or return None if unsupported"""
+    data = body.encode("utf-8")
+    if encoding == "gzip":
+        import gzip
+        # A fixed mtime keeps the output identical for identical bodies
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == "br" and importlib.util.find_spec("brotli") is not None:
+        import brotli
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def prepare(data, encodings=None):
+    """Serialize data once, with its ETag and compressed variants for large
+    enough bodies. Returns the fields SnapshotCache stores next to the data"""
+    body = dumps(data)
+    return {"body": body, "etag": etag_for(body), "encoded": prepare_encoded(body, encodings)}
+
+
+def etag_for(body):
+    """Strong ETag for a serialized body"""
+    import hashlib
+    return '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _etag_base(tag):
+    # Compressed representations carry the same tag with a -gzip/-br suffix
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for encoding in ("gzip", "br"):
+        if tag.endswith("-" + encoding):
+            return tag[:-len(encoding) - 1]
+    return tag
+
+
+def if_none_match(event, etag):
+    """Whether the request's If-None-Match already names this content"""
+    header = request_header(event, "If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    base = _etag_base(etag)
+    return any(_etag_base(tag) == base for tag in header.split(","))
+
+
+@functools.lru_cache(maxsize=16)
+def http_date(timestamp):
+    """RFC 7231 date, e.g. 'Fri, 28 Jun 2024 10:00:00 GMT'"""
+    days = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+    months = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+    t = time.gmtime(timestamp)
+    return f"{days[t.tm_wday]}, {t.tm_mday:02d} {months[t.tm_mon - 1]} {t.tm_year} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d} GMT"
+
+
+def not_modified(response):
+    """304 for a response whose content the client already has: same caching
+    headers, no body"""
+    headers = {name: value for name, value in response["headers"].items()
+               if name not in ("Content-Type", "Content-Encoding")}
+    return {"statusCode": 304, "headers": headers, "body": ""}
+
+
+def request_header(event, name):
+    """Header value from an API Gateway event (REST or HTTP API), matched case-insensitively"""
+    headers = (event or {}).get("headers") or {}
+    value = headers.get(name.lower())
+    if value is None:
+        name = name.lower()
+        value = next((v for k, v in headers.items() if k.lower() == name), None)
+    return value
+
+
+def accepted_encodings(accept_encoding):
+    """Parse an Accept-Encoding header into {coding: q}"""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding, available):
+    """Pick the best of the available encodings the client accepts, or None for
+    identity. Preference order is that of `available` when q-values tie"""
+    accepted = accepted_encodings(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in available:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def encode_response(response, event, encoded=None):
+    """Compress response's body for the client's Accept-Encoding.
+
+    `encoded` holds variants prepared ahead of time ({encoding: base64 body});
+    without it, the body is compressed now, in the chosen encoding only. Adds
+    Vary either way, so caches keep the variants apart."""
+    response["headers"]["Vary"] = "Accept-Encoding"
+    accept_encoding = request_header(event, "Accept-Encoding")
+    if encoded is None:
+        encoded = {}
+        if accept_encoding and len(response["body"]) >= COMPRESS_MIN_SIZE:
+            encoding = negotiate(accept_encoding, sorted(supported_encodings(), key=_preference))
+            if encoding:
+                encoded = prepare_encoded(response["body"], [encoding])
+    encoding = negotiate(accept_encoding, sorted(encoded, key=_preference)) if encoded else None
+    if encoding:
+        response["headers"]["Content-Encoding"] = encoding
+        response["body"] = encoded[encoding]
+        response["isBase64Encoded"] = True
+        etag = response["headers"].get("ETag")
+        if etag:
+            # Each representation needs its own strong tag
+            response["headers"]["ETag"] = f'"{_etag_base(etag)}-{encoding}"'
+    return response
+
+
+def supported_encodings():
+    """Configured encodings whose compressor is installed"""
+    return [e for e in RESPONSE_ENCODINGS
+            if e == "gzip" or (e == "br" and importlib.util.find_spec("brotli") is not None)]
+
+
+def _preference(encoding):
+    # Brotli first: smaller than gzip for JSON
+    return ("br", "gzip").index(encoding) if encoding in ("br", "gzip") else 2
+
+
+def prepare_encoded(body, encodings=None):
+    """{encoding: base64 compressed body} for bodies large enough to be worth it"""
+    encoded = {}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        for encoding in RESPONSE_ENCODINGS if encodings is None else encodings:
+            compressed = compress(body, encoding)
+            # Stored base64-encoded, which is also what API Gateway expects
+            if compressed is not None and len(compressed) < len(body):
+                encoded[encoding] = base64.b64encode(compressed).decode("ascii")
+    return encoded
+
+
+def json_response(status_code, body, headers=None):
+    """Proxy response around an already serialized JSON body"""
+    response_headers = dict(HEADERS)
+    if headers:
+        response_headers.update(headers)
+    return {"statusCode": status_code, "headers": response_headers, "body": body}
+
+
+def _canned(status_code, message):
+    return json_response(status_code, json.dumps({"error": message}))
+
+
+_CANNED_ERRORS = {(status_code, message): _canned(status_code, message) for status_code, message in [
+    (503, UNAVAILABLE),
+    (500, PARSE_FAILED),
+    (500, "Price history is currently unavailable."),
+    (400, "'from' and 'to' must be dates in YYYY-MM-DD format."),
+    (400, "Invalid cursor"),
+]}
+
+
+def error_response(status_code, message):
+    """Error response, copied from the canned ones built at import when possible"""
+    canned = _CANNED_ERRORS.get((status_code, message))
+    if canned is None:
+        return _canned(status_code, message)
+    # Callers may add headers, so each one gets its own headers dict
+    return {"statusCode": status_code, "headers": dict(canned["headers"]), "body": canned["body"]}
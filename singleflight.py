@@ -0,0 +1,158 @@
+import os
+import threading
+import time
+
+# Request coalescing for cache misses.
+#
+# SingleFlight makes concurrent callers in one process share a single call:
+# the first caller for a key runs it, the others block until it finishes and
+# get the same result (or exception). Across containers, a lease in the shared
+# store plays the same role: whoever acquires it scrapes, the others wait for
+# the snapshot it writes. Leases expire after `ttl` seconds, so a container
+# that dies mid-scrape cannot hold up the rest for longer than that.
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run one call per key at a time and hand its result to every concurrent caller"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """Return fn(), or the result of the fn() already running for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared}
+
+
+def new_owner():
+    """Lease owner id, unique per container"""
+    return os.urandom(8).hex()
+
+
+class NullLeaseStore:
+    """Every acquire succeeds: coalescing stays within the process"""
+
+    def acquire(self, name, owner, ttl):
+        return True
+
+    def release(self, name, owner):
+        pass
+
+
+class InMemoryLeaseStore:
+    """Stand-in lease store for tests and local runs, shared by whoever holds the instance"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, name, owner, ttl):
+        with self._lock:
+            held = self._leases.get(name)
+            if held and held[0] != owner and held[1] > self.clock():
+                return False
+            self._leases[name] = (owner, self.clock() + ttl)
+            return True
+
+    def release(self, name, owner):
+        with self._lock:
+            held = self._leases.get(name)
+            if held and held[0] == owner:
+                del self._leases[name]
+
+    def holder(self, name):
+        with self._lock:
+            held = self._leases.get(name)
+            return held[0] if held and held[1] > self.clock() else None
+
+
+class DynamoDBLeaseStore:
+    """Leases as conditionally written items in the cache's DynamoDB table"""
+
+    def __init__(self, table_name, client=None, prefix="lease:", clock=time.time):
+        if client is None:
+            import boto3  # provided by the Lambda runtime, only needed for this store
+            client = boto3.client("dynamodb")
+        self.table_name = table_name
+        self.client = client
+        self.prefix = prefix
+        self.clock = clock
+
+    def acquire(self, name, owner, ttl):
+        now = self.clock()
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={"key": {"S": self.prefix + name}, "owner": {"S": owner},
+                      "expiresAt": {"N": str(now + ttl)}},
+                ConditionExpression="attribute_not_exists(#k) OR expiresAt < :now OR #o = :owner",
+                ExpressionAttributeNames={"#k": "key", "#o": "owner"},
+                ExpressionAttributeValues={":now": {"N": str(now)}, ":owner": {"S": owner}})
+            return True
+        except Exception as e:
+            if _error_code(e) == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    def release(self, name, owner):
+        try:
+            self.client.delete_item(
+                TableName=self.table_name, Key={"key": {"S": self.prefix + name}},
+                ConditionExpression="#o = :owner",
+                ExpressionAttributeNames={"#o": "owner"},
+                ExpressionAttributeValues={":owner": {"S": owner}})
+        except Exception as e:
+            if _error_code(e) != "ConditionalCheckFailedException":
+                raise
+
+
+def _error_code(error):
+    # botocore's ClientError, without importing botocore
+    return getattr(error, "response", {}).get("Error", {}).get("Code")
+
+
+def create_lease_store(name, client=None, table=None):
+    """Build a lease store from its configured name"""
+    if name == "none":
+        return NullLeaseStore()
+    if name == "memory":
+        return InMemoryLeaseStore()
+    if name == "dynamodb":
+        return DynamoDBLeaseStore(table, client)
+    raise ValueError(f"Unknown lease store: {name}")
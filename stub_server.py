@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stub of the BERA website, used by tests and local runs
+"""
+
+import hashlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+LISTING_PATH = "/media/press-releases"
+ANNOUNCEMENT_PATH = "/media/press-releases/fuel-price-adjustment-july-2024"
+LAST_MODIFIED = "Fri, 28 Jun 2024 10:00:00 GMT"
+
+
+def load_fixture(name):
+    """Read a saved BERA page from the fixtures directory"""
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def default_pages():
+    """Listing page and the announcement it links to first"""
+    return {
+        LISTING_PATH: load_fixture("press_releases.html"),
+        ANNOUNCEMENT_PATH: load_fixture("announcement.html"),
+    }
+
+
+class StubBera:
+    """Serve pages from a dict of path -> html on a random local port
+
+    Every page gets a strong ETag and a fixed Last-Modified, and conditional
+    requests are answered with 304. `requests` records (path, headers) for
+    each request. Set `status` to force an error code for every request, or
+    `delay` to make every response slow. `clients` records the client
+    address of each request, to tell reused connections from new ones.
+    """
+
+    def __init__(self, pages=None):
+        self.pages = pages if pages is not None else default_pages()
+        self.requests = []
+        self.clients = []
+        self.status = None
+        self.delay = 0
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, path=LISTING_PATH):
+        return self.base_url + path
+
+    def hits(self, path):
+        """Number of requests made for path"""
+        return sum(1 for p, _ in self.requests if p == path)
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this the
+            # client's delayed ACK adds ~40ms to every keep-alive response
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                stub.requests.append((self.path, dict(self.headers)))
+                stub.clients.append(self.client_address)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.status:
+                    return self._send(stub.status, b"Service Unavailable")
+
+                html = stub.pages.get(self.path)
+                if html is None:
+                    return self._send(404, b"Not found")
+
+                body = html.encode("utf-8")
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                headers = {"ETag": etag, "Last-Modified": LAST_MODIFIED}
+                if self.headers.get("If-None-Match") == etag:
+                    return self._send(304, b"", headers)
+                self._send(200, body, headers)
+
+            def _send(self, status, body, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if body:
+                    try:
+                        self.wfile.write(body)
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    with StubBera() as stub:
+        print(f"Serving BERA fixtures at {stub.url()} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
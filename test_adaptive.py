@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Tests for the adaptive polling schedule and the poller skipping triggers
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+
+import handler
+from adaptive import AdaptiveSchedule, Cadence, change_dates
+from cache import InMemoryKeyValueStore, KeyValueBackend, SnapshotCache
+from history import SQLiteHistoryStore
+from poller import load_schedule_state, poll_prices
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH, load_fixture
+
+BASE = 900
+MAX = 6 * 3600
+
+
+def at(year, month, day, hour=0):
+    return datetime(year, month, day, hour, tzinfo=timezone.utc).timestamp()
+
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def schedule(clock):
+    return AdaptiveSchedule(BASE, MAX, clock=clock)
+
+
+def test_cadence_learns_the_typical_gap_and_usual_days():
+    cadence = Cadence(["2024-01-03", "2024-01-31", "2024-02-28", "2024-04-03", "2024-05-01"])
+    assert cadence.typical_gap == 28
+    assert str(cadence.expected_change()) == "2024-05-29"
+    assert cadence.days_of_month == [3]
+    assert Cadence().expected_change() is None
+
+
+def test_change_dates_reads_the_history(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    for date in ("2nd May 2024", "1st July 2024", "3rd June 2024", "1st July 2024", "Date not specified"):
+        store.record({"effectiveDate": date, "currency": "BWP", "sourceUrl": f"https://b/{date}",
+                      "prices": [{"product": "Diesel", "price": 13.8}]})
+    assert change_dates(store) == ["2024-05-02", "2024-06-03", "2024-07-01"]
+    store.close()
+
+
+@pytest.mark.parametrize("now, state, reason", [
+    (at(2024, 6, 30, 12), {}, "month-boundary"),
+    (at(2024, 7, 2, 12), {}, "month-boundary"),
+    (at(2024, 7, 12), {}, "expected-change"),   # 28 days after 2024-06-17
+    (at(2024, 7, 20), {}, "usual-day"),         # changes took effect on the 22nd twice
+    (at(2024, 7, 8), {"listingChangedAt": at(2024, 7, 8) - 3600}, "recent-change"),
+    (at(2024, 7, 8), {}, None),
+])
+def test_hot_windows(now, state, reason):
+    cadence = Cadence(["2024-03-22", "2024-04-22", "2024-05-20", "2024-06-17"])
+    assert schedule(Clock(now)).hot_reason(now, state, cadence) == reason
+
+
+def test_quiet_polls_back_off_exponentially():
+    clock = Clock(at(2024, 7, 8))
+    plan = schedule(clock)
+    state, intervals = None, []
+    for _ in range(7):
+        state = plan.after_poll(state, Cadence())
+        intervals.append(state["nextPollAt"] - clock.now)
+        clock.now = state["nextPollAt"]
+    assert intervals == [1800, 3600, 7200, 14400, MAX, MAX, MAX]
+    assert state["reason"] == "backoff"
+
+    # A change resets the backoff
+    state = plan.after_poll(state, Cadence(), changed=True)
+    assert state["nextPollAt"] - clock.now == BASE
+    assert state["reason"] == "recent-change"
+
+
+def test_backoff_never_sleeps_through_a_window():
+    clock = Clock(at(2024, 7, 28, 22))  # month boundary starts on the 30th
+    state = {"misses": 20}
+    state = schedule(clock).after_poll(state, Cadence())
+    assert state["nextPollAt"] == at(2024, 7, 29, 4)  # MAX, well before the window
+
+    clock.now = at(2024, 7, 29, 23)
+    state = schedule(clock).after_poll(state, Cadence())
+    assert state["nextPollAt"] == at(2024, 7, 30)
+
+
+def test_same_freshness_with_far_fewer_polls():
+    """Two months of 15-minute triggers, with BERA publishing each change on
+    the day before it takes effect on the 1st"""
+    published = [at(2024, 7, 31, 9), at(2024, 8, 31, 14)]
+    start, end = at(2024, 7, 1), at(2024, 9, 1) + 86400
+    clock = Clock(start)
+    plan = schedule(clock)
+    state, polls, seen, delays = None, 0, 0, []
+    cadence = Cadence(["2024-05-01", "2024-06-01", "2024-07-01"])
+
+    while clock.now < end:
+        if plan.due(state):
+            polls += 1
+            visible = sum(1 for t in published if t <= clock.now)
+            changed = visible > seen
+            if changed:
+                delays.append(clock.now - published[visible - 1])
+                seen = visible
+            state = plan.after_poll(state, cadence, changed)
+        clock.now += BASE
+
+    fixed_polls = (end - start) // BASE
+    assert len(delays) == 2
+    assert max(delays) <= BASE
+    assert polls < fixed_polls / 4
+
+
+@pytest.fixture
+def store(fresh_handler, monkeypatch):
+    cache = SnapshotCache(KeyValueBackend(InMemoryKeyValueStore()), ttl=3600, stale_ttl=86400)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "ADAPTIVE_POLLING", True)
+    return cache
+
+
+def test_poller_skips_triggers_until_a_poll_is_due(store, stub):
+    first = poll_prices({}, None)
+    assert first["updated"]
+    assert load_schedule_state()["nextPollAt"] == first["nextPollAt"]
+
+    requests_before = len(stub.requests)
+    skipped = poll_prices({}, None)
+    assert skipped == {"updated": False, "skipped": True, "nextPollAt": first["nextPollAt"]}
+    assert len(stub.requests) == requests_before
+
+    assert poll_prices({"force": True}, None)["updated"]
+    assert len(stub.requests) > requests_before
+
+
+def test_listing_change_makes_polls_frequent(store, stub):
+    poll_prices({}, None)
+    state = load_schedule_state()
+    assert state["listingVersion"]
+
+    stub.pages[LISTING_PATH] = load_fixture("press_releases.html").replace("</body>", "<p>new</p></body>")
+    poll_prices({"force": True}, None)
+    state = load_schedule_state()
+    assert state["reason"] == "recent-change"
+    assert state["misses"] == 0
+
+
+def test_price_change_is_detected(store, stub):
+    poll_prices({}, None)
+    stub.pages[ANNOUNCEMENT_PATH] = load_fixture("announcement.html").replace("14.50", "15.10")
+    handler.parse_memo.clear()
+    poll_prices({"force": True}, None)
+    state = load_schedule_state()
+    assert state["lastChangeAt"] == state["lastPollAt"]
+
+
+def test_cadence_survives_an_empty_local_history(store, stub):
+    # Another container polled before, on 2024-05-02 and 2024-06-03
+    store.backend.set("poll-schedule", {"nextPollAt": 0, "changeDates": ["2024-05-02", "2024-06-03"]})
+    poll_prices({}, None)
+    state = load_schedule_state()
+    assert state["changeDates"] == ["2024-05-02", "2024-06-03", "2024-07-01"]
+    assert Cadence(state["changeDates"]).typical_gap == 32
+
+
+def test_undated_announcements_are_not_changes(store, stub, tmp_path, monkeypatch):
+    history = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    monkeypatch.setattr(handler, "history_store", history)
+    stub.pages[ANNOUNCEMENT_PATH] = load_fixture("announcement.html").replace("Effective", "Starting").replace(
+        "effective", "starting")
+    handler.parse_memo.clear()
+    for day in range(3):
+        history.record(handler.scrape_prices()[0], recorded_at=at(2024, 7, 8 + day))
+        poll_prices({"force": True}, None)
+    # Filed under the days they were seen, they used to make a one-day "typical gap"
+    assert load_schedule_state()["changeDates"] == []
+    history.close()
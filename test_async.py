@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Tests for the asyncio pipeline, against an in-process aiohttp server
+"""
+
+import asyncio
+import hashlib
+import json
+import time
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import async_handler
+import handler
+from backfill import Backfill
+from breaker import OPEN, CircuitBreakers
+from cache import MemoryBackend, SnapshotCache
+from history import SQLiteHistoryStore
+from poller import poll_prices
+from singleflight import InMemoryLeaseStore
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH, StubBera, default_pages, load_fixture
+
+OTHER_PATH = "/media/press-releases/fuel-price-review-june-2024"
+
+
+class Origin:
+    """aiohttp app serving BERA pages, like stub_server.StubBera"""
+
+    def __init__(self, pages=None):
+        self.pages = pages if pages is not None else default_pages()
+        self.requests = []
+        self.delay = 0
+        self.fail_next = 0
+        self.active = 0
+        self.max_active = 0
+        self.server = None
+
+    async def handle(self, request):
+        self.requests.append(request.path_qs)
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            if self.fail_next:
+                self.fail_next -= 1
+                return web.Response(status=503, text="Service Unavailable")
+            html = self.pages.get(request.path_qs)
+            if html is None:
+                return web.Response(status=404, text="Not found")
+            etag = '"' + hashlib.sha1(html.encode("utf-8")).hexdigest() + '"'
+            if request.headers.get("If-None-Match") == etag:
+                return web.Response(status=304, headers={"ETag": etag})
+            return web.Response(text=html, content_type="text/html", headers={"ETag": etag})
+        finally:
+            self.active -= 1
+
+    def url(self, path=LISTING_PATH):
+        return str(self.server.make_url(path))
+
+    def hits(self, path):
+        return self.requests.count(path)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/{tail:.*}", self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    async def __aexit__(self, *exc):
+        await async_handler.close_session()
+        await self.server.close()
+
+
+@pytest.fixture(autouse=True)
+def isolated(fresh_handler, monkeypatch):
+    monkeypatch.setattr(handler, "HTTP_BACKOFF", 0)
+    monkeypatch.setattr(handler, "_session", None)  # built with the patched settings, dropped afterwards
+    monkeypatch.setattr(handler, "lease_store", InMemoryLeaseStore())
+    monkeypatch.setattr(handler, "LEASE_POLL_INTERVAL", 0.01)
+
+
+def run_against_origin(monkeypatch, test, pages=None):
+    async def main():
+        async with Origin(pages) as origin:
+            monkeypatch.setattr(handler, "BERA_URL", origin.url())
+            return await test(origin)
+    return async_handler.run(main())
+
+
+def prices(response):
+    return [p["price"] for p in json.loads(response["body"])["prices"]]
+
+
+def test_async_pipeline_matches_the_sync_one(monkeypatch):
+    async def test(origin):
+        response = await async_handler.get_prices_async({}, None)
+        assert response["statusCode"] == 200
+        assert response["headers"]["X-Cache-Status"] == "revalidated"
+        assert json.loads(response["body"])["sourceUrl"] == origin.url(ANNOUNCEMENT_PATH)
+        return response
+
+    response = run_against_origin(monkeypatch, test)
+    assert prices(response) == [14.50, 14.75, 13.80, 9.50]
+    assert handler.price_cache.get()["effectiveDate"] == "1st July 2024"
+
+
+def test_last_announcement_is_fetched_alongside_the_listing(monkeypatch):
+    async def test(origin):
+        await async_handler.scrape_prices_async()
+        assert handler.last_announcement_url == origin.url(ANNOUNCEMENT_PATH)
+
+        origin.delay = 0.2
+        started = time.perf_counter()
+        fuel_data, error = await async_handler.scrape_prices_async()
+        elapsed = time.perf_counter() - started
+
+        assert error is None
+        assert origin.max_active == 2
+        assert origin.hits(ANNOUNCEMENT_PATH) == 2
+        # Both pages in one round trip, not two
+        assert elapsed < 0.35
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_wrong_guess_falls_back_to_the_listed_announcement(monkeypatch):
+    pages = default_pages()
+    pages[OTHER_PATH] = load_fixture("announcement_list.html")
+
+    async def test(origin):
+        handler.last_announcement_url = origin.url(OTHER_PATH)
+        fuel_data, error = await async_handler.scrape_prices_async()
+        assert fuel_data["sourceUrl"] == origin.url(ANNOUNCEMENT_PATH)
+        assert fuel_data["effectiveDate"] == "1st July 2024"
+        assert handler.last_announcement_url == origin.url(ANNOUNCEMENT_PATH)
+
+    run_against_origin(monkeypatch, test, pages)
+
+
+def test_unreachable_origin_is_a_503(monkeypatch):
+    async def test(origin):
+        origin.fail_next = 100
+        return await async_handler.get_prices_async({}, None)
+
+    assert run_against_origin(monkeypatch, test)["statusCode"] == 503
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    async def test(origin):
+        origin.fail_next = 1
+        fuel_data, error = await async_handler.scrape_prices_async()
+        assert error is None
+        assert origin.hits(LISTING_PATH) == 2
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_burst_of_misses_scrapes_once(monkeypatch):
+    async def test(origin):
+        origin.delay = 0.1
+        responses = await asyncio.gather(*(async_handler.get_prices_async({}, None) for _ in range(10)))
+        assert {response["statusCode"] for response in responses} == {200}
+        assert origin.hits(LISTING_PATH) == 1
+        assert origin.hits(ANNOUNCEMENT_PATH) == 1
+        assert handler.lease_store.holder("latest") is None
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_miss_waits_for_the_container_holding_the_lease(monkeypatch):
+    async def test(origin):
+        handler.lease_store.acquire("latest", "other-container", ttl=30)
+
+        async def other_container():
+            await asyncio.sleep(0.1)
+            handler.price_cache.put({"effectiveDate": "1st July 2024", "currency": "BWP", "prices": [],
+                                     "sourceUrl": origin.url(ANNOUNCEMENT_PATH)})
+            handler.lease_store.release("latest", "other-container")
+
+        response, _ = await asyncio.gather(async_handler.get_prices_async({}, None), other_container())
+        assert response["statusCode"] == 200
+        assert json.loads(response["body"])["effectiveDate"] == "1st July 2024"
+        assert origin.requests == []
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_miss_gives_up_after_the_lease_wait(monkeypatch):
+    monkeypatch.setattr(handler, "SCRAPE_LEASE_WAIT", 0.1)
+
+    async def test(origin):
+        handler.lease_store.acquire("latest", "slow-container", ttl=30)
+        response = await async_handler.get_prices_async({}, None)
+        assert response["statusCode"] == 503
+        assert origin.requests == []
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_timeouts_are_not_retried(monkeypatch):
+    monkeypatch.setattr(handler, "TIMEOUT", 0.2)
+
+    async def test(origin):
+        origin.delay = 0.5
+        fuel_data, error = await async_handler.scrape_prices_async()
+        assert fuel_data is None
+        assert origin.hits(LISTING_PATH) == 1
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_open_breaker_fails_fast_and_serves_the_last_snapshot(monkeypatch):
+    monkeypatch.setattr(handler, "breakers", CircuitBreakers(min_calls=2))
+    monkeypatch.setattr(handler, "price_cache", SnapshotCache(MemoryBackend(), ttl=0, stale_ttl=0))
+
+    async def test(origin):
+        assert (await async_handler.get_prices_async({}, None))["statusCode"] == 200
+        origin.fail_next = 100
+        for _ in range(2):
+            await async_handler.get_prices_async({}, None)
+        assert handler.breakers.get(origin.url()).state == OPEN
+
+        requests_before = len(origin.requests)
+        response = await async_handler.get_prices_async({}, None)
+        assert len(origin.requests) == requests_before
+        assert response["statusCode"] == 200
+        assert response["headers"]["X-Cache-Status"] == "stale"
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_store_past_its_stale_ttl_is_still_served(monkeypatch):
+    monkeypatch.setattr(handler, "price_cache", SnapshotCache(MemoryBackend(), ttl=0, stale_ttl=0))
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+    handler.price_cache.put({"effectiveDate": "1st July 2024", "prices": []})
+
+    response = async_handler.get_prices_aio({}, None)
+    assert response["statusCode"] == 200
+    assert response["headers"]["X-Cache-Status"] == "stale"
+
+
+def test_revalidation_reuses_cached_pages(monkeypatch):
+    async def test(origin):
+        session = await async_handler.get_session_async()
+        first = await async_handler.fetch_conditional_async(session, origin.url(ANNOUNCEMENT_PATH))
+        second = await async_handler.fetch_conditional_async(session, origin.url(ANNOUNCEMENT_PATH))
+        assert first[1] is False
+        assert second == (first[0], True)
+
+    run_against_origin(monkeypatch, test)
+
+
+def test_fetch_many_is_bounded_and_keeps_order(monkeypatch):
+    pages = {f"/page/{i}": f"<p>{i}</p>" for i in range(12)}
+
+    async def test(origin):
+        origin.delay = 0.02
+        urls = [origin.url(f"/page/{i}") for i in range(12)] + [origin.url("/missing")]
+        results = await async_handler.fetch_many(urls, concurrency=4)
+        assert results == [f"<p>{i}</p>" for i in range(12)] + [None]
+        assert origin.max_active == 4
+
+    run_against_origin(monkeypatch, test, pages)
+
+
+def test_sync_entry_point_reuses_its_loop_and_session(stub):
+    assert async_handler.get_prices_aio({}, None)["statusCode"] == 200
+    handler.price_cache.clear()
+    assert async_handler.get_prices_aio({}, None)["statusCode"] == 200
+    async_handler.run(async_handler.close_session())
+
+    # The second invocation reuses the first one's connection, opening at
+    # most one more for the speculative fetch that runs alongside the listing
+    first, second = stub.clients[:2], stub.clients[2:]
+    assert len(set(first)) == 1
+    assert set(first) & set(second)
+    assert len(set(second) - set(first)) <= 1
+
+
+def test_poller_on_the_async_pipeline(stub, monkeypatch):
+    monkeypatch.setattr(handler, "ASYNC_PIPELINE", True)
+    result = poll_prices({}, None)
+    async_handler.run(async_handler.close_session())
+    assert result["updated"]
+    assert handler.price_cache.get()["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+
+
+def test_backfill_on_the_async_pipeline(monkeypatch, tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    pages = default_pages()
+    pages["/media/press-releases/fuel-price-review-june-2024"] = load_fixture("announcement_list.html")
+    with StubBera(pages) as stub:
+        summary = Backfill(stub.url(LISTING_PATH), store=store, rate=0, use_async=True,
+                           checkpoint_path=str(tmp_path / "checkpoint.json")).run()
+        async_handler.run(async_handler.close_session())
+    assert summary["done"] == 2
+    assert summary["rowsRecorded"] == 8
+    store.close()
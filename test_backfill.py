@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for the history backfill crawler
+"""
+
+import pytest
+
+from backfill import Backfill, RateLimiter, load_checkpoint, parse_listing
+from history import SQLiteHistoryStore
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH, StubBera, load_fixture
+
+JUNE_PATH = "/media/press-releases/fuel-price-review-june-2024"
+APRIL_PATH = "/media/press-releases/fuel-price-adjustment-april-2024"
+MARCH_PATH = "/media/press-releases/fuel-price-adjustment-march-2024"
+
+LAST_LISTING_PAGE = """<html><body>
+<a href="/media/press-releases/fuel-price-adjustment-march-2024">Fuel Price Adjustment - March 2024</a>
+<a href="/media/press-releases/board-appointments">Board Appointments</a>
+<a href="?page=0">Previous</a>
+</body></html>"""
+
+
+def crawl_pages():
+    april = load_fixture("announcement.html").replace("1st July 2024", "1st April 2024")
+    march = load_fixture("announcement_list.html").replace("3rd June 2024", "1st March 2024")
+    return {
+        LISTING_PATH: load_fixture("press_releases.html"),
+        LISTING_PATH + "?page=1": LAST_LISTING_PAGE,
+        ANNOUNCEMENT_PATH: load_fixture("announcement.html"),
+        JUNE_PATH: load_fixture("announcement_list.html"),
+        APRIL_PATH: april,
+        MARCH_PATH: march,
+    }
+
+
+@pytest.fixture
+def store(tmp_path, fresh_handler):
+    history = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    yield history
+    history.close()
+
+
+def backfill(stub, store, tmp_path, **kwargs):
+    return Backfill(stub.url(LISTING_PATH), store=store, rate=0, batch_size=2,
+                    checkpoint_path=str(tmp_path / "checkpoint.json"), **kwargs)
+
+
+def test_parse_listing_finds_every_fuel_link_and_the_next_page():
+    links, next_url = parse_listing(load_fixture("press_releases.html"), "https://www.bera.co.bw/media/press-releases")
+    assert links == ["https://www.bera.co.bw" + path for path in (ANNOUNCEMENT_PATH, JUNE_PATH, APRIL_PATH)]
+    assert next_url == "https://www.bera.co.bw/media/press-releases?page=1"
+
+    links, next_url = parse_listing(LAST_LISTING_PAGE, "https://www.bera.co.bw/media/press-releases?page=1")
+    assert links == ["https://www.bera.co.bw" + MARCH_PATH]
+    assert next_url is None
+
+
+def test_backfill_records_every_announcement(store, tmp_path):
+    with StubBera(crawl_pages()) as stub:
+        summary = backfill(stub, store, tmp_path).run()
+
+    assert summary["listingComplete"]
+    assert summary["pages"] == 2
+    assert summary["done"] == 4
+    assert summary["failed"] == {}
+    assert summary["rowsRecorded"] == 16
+    dates = sorted({item["effectiveDate"] for item in store.query()["items"]})
+    assert dates == ["2024-03-01", "2024-04-01", "2024-06-03", "2024-07-01"]
+
+
+def test_backfill_resumes_from_the_checkpoint(store, tmp_path):
+    pages = crawl_pages()
+    march = pages.pop(MARCH_PATH)
+    with StubBera(pages) as stub:
+        first = backfill(stub, store, tmp_path).run()
+        assert first["done"] == 3
+        assert list(first["failed"]) == [stub.url(MARCH_PATH)]
+
+        requests_before = len(stub.requests)
+        pages[MARCH_PATH] = march
+        second = backfill(stub, store, tmp_path).run()
+        # Only the failed announcement is fetched again, the listing is not re-walked
+        assert [path for path, _ in stub.requests[requests_before:]] == [MARCH_PATH]
+
+    assert second["done"] == 4
+    assert second["failed"] == {}
+    assert load_checkpoint(str(tmp_path / "checkpoint.json"))["nextPage"] is None
+
+
+def test_failed_listing_page_is_retried_on_resume(store, tmp_path):
+    pages = crawl_pages()
+    last_page = pages.pop(LISTING_PATH + "?page=1")
+    with StubBera(pages) as stub:
+        first = backfill(stub, store, tmp_path).run()
+        assert not first["listingComplete"]
+        assert first["done"] == 3
+
+        pages[LISTING_PATH + "?page=1"] = last_page
+        second = backfill(stub, store, tmp_path).run()
+    assert second["listingComplete"]
+    assert second["done"] == 4
+
+
+def test_pager_that_loops_back_stops(store, tmp_path):
+    pages = crawl_pages()
+    pages[LISTING_PATH + "?page=1"] = LAST_LISTING_PAGE.replace(
+        '<a href="?page=0">Previous</a>', '<a href="/media/press-releases" rel="next">Next</a>')
+    with StubBera(pages) as stub:
+        summary = backfill(stub, store, tmp_path).run()
+    assert summary["pages"] == 2
+    assert summary["done"] == 4
+
+
+def test_rate_limiter_spaces_requests_per_host():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(round(seconds, 3))
+
+    limiter = RateLimiter(rate=4, clock=lambda: now[0], sleep=sleep)
+    for _ in range(3):
+        limiter.wait("https://www.bera.co.bw/a")
+    limiter.wait("https://other.example/a")
+    assert slept == [0.25, 0.5]
+
+
+def test_backfill_parsing_in_worker_processes(store, tmp_path):
+    with StubBera(crawl_pages()) as stub:
+        summary = backfill(stub, store, tmp_path, processes=2).run()
+    assert summary["done"] == 4
+    assert summary["rowsRecorded"] == 16
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Tests for batch extraction over many announcement pages
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import handler
+from batch import extract_prices_batch, read_pages
+from stub_server import FIXTURES_DIR, load_fixture
+
+URL = "https://www.bera.co.bw/media/press-releases/fuel-price-adjustment-july-2024"
+
+
+def pages(count):
+    """Announcements with distinct prices, so each one parses to something different"""
+    template = load_fixture("announcement.html")
+    return [(template.replace("14.50", f"{14 + i / 100:.2f}"), f"{URL}?{i}") for i in range(count)]
+
+
+def test_results_match_extract_prices_in_input_order():
+    batch = pages(10)
+    results = list(extract_prices_batch(batch))
+    assert [url for url, _, _ in results] == [url for _, url in batch]
+    for (html, url), (_, fuel_data, error) in zip(batch, results):
+        assert error is None
+        assert fuel_data == handler.parse_prices(html, url)
+
+
+def test_each_failure_gets_its_reason(monkeypatch):
+    text = handler.parser_backend.text
+
+    class Backend:
+        def text(self, html):
+            if "<broken" in html:
+                raise ValueError("unparseable")
+            return text(html)
+
+    monkeypatch.setattr(handler, "parser_backend", Backend())
+    results = list(extract_prices_batch([
+        (load_fixture("announcement.html"), "a"),
+        ("<p>Board appointments</p>", "b"),
+        ("", "c"),
+        ("<broken", "d"),
+        (load_fixture("announcement_list.html"), "e"),
+    ]))
+    assert [(url, error) for url, _, error in results] == [
+        ("a", None), ("b", "no prices found"), ("c", "empty page"), ("d", "ValueError: unparseable"), ("e", None)]
+    assert results[4][1]["effectiveDate"] == "3rd June 2024"
+
+
+@pytest.mark.parametrize("chunksize", [1, 4, 64])
+def test_worker_processes_give_the_same_results(chunksize):
+    batch = pages(24) + [("<p>nothing</p>", "none")]
+    serial = list(extract_prices_batch(batch))
+    assert list(extract_prices_batch(batch, processes=2, chunksize=chunksize)) == serial
+
+
+def test_executor_is_reused_across_batches():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        first = list(extract_prices_batch(pages(4), executor=pool, chunksize=2))
+        second = list(extract_prices_batch(pages(4)[::-1], executor=pool, chunksize=2))
+    assert second == first[::-1]
+
+
+def test_fixture_files():
+    paths = [f"{FIXTURES_DIR}/announcement.html", f"{FIXTURES_DIR}/press_releases.html"]
+    results = list(extract_prices_batch(read_pages(paths)))
+    assert results[0][1]["effectiveDate"] == "1st July 2024"
+    assert results[1] == (paths[1], None, "no prices found")
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark harness (not the timings themselves)
+"""
+
+import subprocess
+import sys
+
+import handler
+from benchmarks import bench_imports, run_benchmarks
+
+
+def test_compare_flags_only_regressions_beyond_threshold():
+    baseline = {"extract_prices": 1.0, "get_prices_warm": 1.0}
+    results = {"extract_prices": 1.3, "get_prices_warm": 1.1, "new_benchmark": 5.0}
+
+    assert run_benchmarks.compare(results, baseline, 0.25) == [("extract_prices", 1.0, 1.3)]
+    assert run_benchmarks.compare(results, baseline, 0.5) == []
+
+
+def test_every_stage_runs_against_the_stub(monkeypatch):
+    for name in ("BERA_URL", "SERVE_FROM_STORE", "STREAM_LISTING", "price_cache", "last_announcement_url"):
+        monkeypatch.setattr(handler, name, getattr(handler, name))
+
+    with run_benchmarks.StubBera() as stub:
+        run_benchmarks.reset_handler(stub)
+        for name, fn in run_benchmarks.benchmarks(stub).items():
+            fn()
+        assert stub.hits(run_benchmarks.LISTING_PATH) >= 1
+
+
+def test_importing_handler_loads_no_heavy_modules():
+    assert bench_imports.heavy_imports() == []
+
+
+def test_cold_start_served_from_cache_never_imports_requests():
+    code = ("import sys, handler; "
+            "handler.price_cache.put({'effectiveDate': '1st July 2024', 'prices': []}); "
+            "assert handler.get_prices({}, None)['statusCode'] == 200; "
+            "print(sorted(m for m in ('requests', 'urllib3', 'bs4') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=bench_imports.ROOT,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "[]"
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for the origin circuit breaker, with outages simulated by the local stub server
+"""
+
+import json
+import time
+
+import pytest
+
+import handler
+from breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakers
+from cache import MemoryBackend, SnapshotCache
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_once_the_failure_rate_is_reached():
+    breaker = CircuitBreaker("bera", failure_rate=0.5, min_calls=4, window=4, clock=Clock())
+    for success in (True, False, True):
+        assert breaker.allow()
+        breaker.record(success)
+    # 1 failure in 3 calls: below min_calls anyway
+    assert breaker.state == CLOSED
+    breaker.record(False)
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.status()["rejected"] == 1
+
+
+def test_occasional_failures_keep_it_closed():
+    breaker = CircuitBreaker("bera", failure_rate=0.5, min_calls=4, window=10, clock=Clock())
+    for i in range(30):
+        breaker.record(i % 4 != 0)
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    clock = Clock()
+    breaker = CircuitBreaker("bera", min_calls=1, open_seconds=30, clock=clock)
+    breaker.record(False)
+    assert breaker.status()["retryIn"] == 30
+
+    clock.now += 30
+    assert breaker.allow()
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allow()  # the probe is still out
+
+    breaker.record(False)
+    assert breaker.state == OPEN
+    clock.now += 29
+    assert not breaker.allow()
+
+    clock.now += 1
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED
+    assert breaker.allow()
+
+
+def test_cancelled_probe_frees_the_slot():
+    clock = Clock()
+    breaker = CircuitBreaker("bera", min_calls=1, open_seconds=0, clock=clock)
+    breaker.record(False)
+    assert breaker.allow()
+    breaker.cancel()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+
+
+def test_breakers_are_per_host():
+    breakers = CircuitBreakers(min_calls=1)
+    breakers.get("https://www.bera.co.bw/a").record(False)
+    assert breakers.get("https://www.bera.co.bw/b").state == OPEN
+    assert breakers.get("https://other.example/a").state == CLOSED
+    assert set(breakers.status()) == {"www.bera.co.bw", "other.example"}
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def stub(stub, monkeypatch, clock):
+    monkeypatch.setattr(handler, "breakers", CircuitBreakers(min_calls=2, open_seconds=30, clock=clock))
+    monkeypatch.setattr(handler, "HTTP_RETRIES", 0)
+    monkeypatch.setattr(handler, "_session", None)
+    return stub
+
+
+def origin_breaker():
+    return handler.breakers.get(handler.BERA_URL)
+
+
+def test_outage_opens_the_breaker_and_fetches_fail_fast(stub):
+    stub.status = 503
+    assert handler.get_prices({}, None)["statusCode"] == 503
+    assert handler.get_prices({}, None)["statusCode"] == 503
+    assert origin_breaker().state == OPEN
+
+    stub.delay = 1
+    requests_before = len(stub.requests)
+    started = time.perf_counter()
+    assert handler.get_prices({}, None)["statusCode"] == 503
+    assert time.perf_counter() - started < 0.5
+    assert len(stub.requests) == requests_before
+
+
+def test_timeouts_count_as_failures(stub, monkeypatch):
+    monkeypatch.setattr(handler, "TIMEOUT", 0.05)
+    stub.delay = 0.3
+    handler.fetch_page(stub.url(LISTING_PATH))
+    handler.fetch_page(stub.url(LISTING_PATH))
+    assert origin_breaker().state == OPEN
+    assert origin_breaker().status()["failures"] == 0  # the window restarts when it opens
+
+
+def test_missing_pages_do_not_open_it(stub):
+    for _ in range(5):
+        assert handler.fetch_page(stub.url("/missing")) is None
+    assert origin_breaker().state == CLOSED
+
+
+def test_last_good_snapshot_is_served_while_open(stub, clock):
+    handler.price_cache = SnapshotCache(MemoryBackend(), ttl=60, clock=clock)
+    assert handler.get_prices({}, None)["headers"]["X-Cache-Status"] == "revalidated"
+
+    clock.now += 120  # expired: get_prices has to go to BERA
+    stub.status = 503
+    for _ in range(3):
+        response = handler.get_prices({}, None)
+        assert response["statusCode"] == 200
+        assert response["headers"]["X-Cache-Status"] == "stale"
+        assert response["headers"]["Cache-Control"] == "public, max-age=0"
+        assert json.loads(response["body"])["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+    assert origin_breaker().state == OPEN
+
+
+def test_recovers_through_a_half_open_probe(stub, clock):
+    stub.status = 503
+    handler.get_prices({}, None)
+    handler.get_prices({}, None)
+    assert origin_breaker().state == OPEN
+
+    stub.status = None
+    assert handler.get_prices({}, None)["statusCode"] == 503  # still open
+    clock.now += 30
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 200
+    assert origin_breaker().state == CLOSED
+
+
+def test_state_is_reported_in_the_metrics(stub, monkeypatch, capsys):
+    monkeypatch.setattr(handler, "METRICS_ENABLED", True)
+    stub.status = 503
+    handler.get_prices({}, None)
+    handler.get_prices({}, None)
+    logs = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith("{")]
+    assert [log["originBreaker"] for log in logs] == [CLOSED, OPEN]
+    host = stub.base_url.split("//")[1]
+    assert handler.breakers.status()[host]["state"] == OPEN
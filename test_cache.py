@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Tests for the price snapshot cache and cached get_prices responses
+"""
+
+import json
+import threading
+import time
+
+import pytest
+
+import handler
+from cache import (BackgroundRefresher, DigestMemo, FileBackend,
+                   InMemoryKeyValueStore, KeyValueBackend, MemoryBackend,
+                   SnapshotCache)
+
+PRESS_RELEASES = '''
+<html><body>
+<a href="/news/general-update">General Update</a>
+<a href="/announcement/fuel-price-adjustment-jan-2024">Fuel Price Adjustment - January 2024</a>
+</body></html>
+'''
+
+ANNOUNCEMENT = '''
+<html><body>
+<h1>Fuel Price Adjustment - Effective 15th January 2024</h1>
+<ul>
+<li>Unleaded Petrol 93: 14.50 BWP per litre</li>
+<li>Unleaded Petrol 95: 14.75 BWP per litre</li>
+<li>Diesel 50ppm: 13.80 BWP per litre</li>
+<li>Illuminating Paraffin: 9.50 BWP per litre</li>
+</ul>
+</body></html>
+'''
+
+SAMPLE_DATA = {
+    "effectiveDate": "15th January 2024",
+    "currency": "BWP",
+    "prices": [{"product": "Retail Pump Price - Diesel 50ppm", "price": 13.80}],
+    "sourceUrl": "https://www.bera.co.bw/announcement/fuel-price-adjustment-jan-2024"
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "file", "kv"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    if request.param == "file":
+        return FileBackend(str(tmp_path / "cache"))
+    return KeyValueBackend(InMemoryKeyValueStore())
+
+
+def test_backend_round_trip(backend):
+    assert backend.get("latest") is None
+    backend.set("latest", {"data": SAMPLE_DATA, "storedAt": 1.0})
+    assert backend.get("latest") == {"data": SAMPLE_DATA, "storedAt": 1.0}
+    backend.delete("latest")
+    assert backend.get("latest") is None
+
+
+def test_snapshot_expires_after_ttl(backend):
+    clock = FakeClock()
+    cache = SnapshotCache(backend, ttl=60, clock=clock)
+    cache.put(SAMPLE_DATA)
+    assert cache.get() == SAMPLE_DATA
+
+    clock.now += 59
+    assert cache.get() == SAMPLE_DATA
+
+    clock.now += 1
+    assert cache.get() is None
+
+
+def test_lookup_reports_fresh_then_stale_then_missing():
+    clock = FakeClock()
+    cache = SnapshotCache(MemoryBackend(), ttl=60, stale_ttl=600, clock=clock)
+    assert cache.lookup() == (None, None)
+
+    cache.put(SAMPLE_DATA)
+    assert cache.lookup() == (SAMPLE_DATA, "fresh")
+
+    clock.now += 60
+    assert cache.lookup() == (SAMPLE_DATA, "stale")
+    assert cache.get() is None
+
+    clock.now += 600
+    assert cache.lookup() == (None, None)
+
+
+def test_last_modified_only_moves_when_the_data_changes(backend):
+    clock = FakeClock()
+    cache = SnapshotCache(backend, ttl=60, clock=clock)
+    cache.put(SAMPLE_DATA)
+    clock.now += 900
+    snapshot = cache.put(dict(SAMPLE_DATA))
+    assert (snapshot["storedAt"], snapshot["lastModified"]) == (1900.0, 1000.0)
+    assert cache.lookup_snapshot()[0]["lastModified"] == 1000.0
+
+    clock.now += 900
+    snapshot = cache.put(dict(SAMPLE_DATA, effectiveDate="1st February 2024"))
+    assert snapshot["lastModified"] == 2800.0
+
+
+def test_refresher_runs_one_refresh_per_key():
+    release = threading.Event()
+    calls = []
+
+    def refresh():
+        calls.append(1)
+        release.wait(5)
+
+    refresher = BackgroundRefresher()
+    assert refresher.trigger("latest", refresh)
+    assert not refresher.trigger("latest", refresh)
+    assert refresher.in_flight("latest")
+
+    release.set()
+    for _ in range(100):
+        if not refresher.in_flight("latest"):
+            break
+        time.sleep(0.01)
+    assert not refresher.in_flight("latest")
+    assert len(calls) == 1
+
+
+def test_digest_memo_counts_hits_and_evicts_least_recent():
+    memo = DigestMemo(maxsize=2)
+    calls = []
+
+    def compute(value):
+        return lambda: calls.append(value) or value.upper()
+
+    assert memo.get_or_compute("<p>a</p>", compute("a")) == "A"
+    assert memo.get_or_compute("<p>a</p>", compute("a")) == "A"
+    assert memo.get_or_compute("<p>b</p>", compute("b")) == "B"
+    assert memo.get_or_compute("<p>c</p>", compute("c")) == "C"
+    assert memo.get_or_compute("<p>a</p>", compute("a")) == "A"
+    assert calls == ["a", "b", "c", "a"]
+    assert memo.stats() == {"hits": 1, "misses": 4, "size": 2}
+
+
+def test_digest_memo_keys_on_extra_parts():
+    memo = DigestMemo()
+    assert memo.get_or_compute("same", lambda: 1, "url-1") == 1
+    assert memo.get_or_compute("same", lambda: 2, "url-2") == 2
+    assert memo.stats()["misses"] == 2
+
+
+def test_extract_prices_skips_parsing_identical_page(monkeypatch):
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    parsed = []
+    parse = handler.parse_prices
+    monkeypatch.setattr(handler, "parse_prices", lambda html, url: parsed.append(url) or parse(html, url))
+
+    url = "https://www.bera.co.bw/announcement/fuel-price-adjustment-jan-2024"
+    first = handler.extract_prices(ANNOUNCEMENT, url)
+    second = handler.extract_prices(ANNOUNCEMENT, url)
+    assert second == first
+    assert len(first["prices"]) == 4
+    assert parsed == [url]
+    assert handler.parse_memo.stats()["hits"] == 1
+
+    handler.extract_prices(ANNOUNCEMENT.replace("14.50", "14.60"), url)
+    assert len(parsed) == 2
+
+
+@pytest.fixture
+def fake_bera(fresh_handler, monkeypatch):
+    """Serve canned BERA pages and count how often the origin is hit"""
+    fetched = []
+    pages = {
+        handler.BERA_URL: PRESS_RELEASES,
+        "https://www.bera.co.bw/announcement/fuel-price-adjustment-jan-2024": ANNOUNCEMENT,
+    }
+
+    def fetch_conditional(url):
+        fetched.append(url)
+        return pages.get(url), False
+
+    monkeypatch.setattr(handler, "fetch_conditional", fetch_conditional)
+    monkeypatch.setattr(handler, "price_cache", SnapshotCache(MemoryBackend(), ttl=3600, stale_ttl=86400))
+    monkeypatch.setattr(handler, "refresher", BackgroundRefresher())
+    return fetched
+
+
+def test_get_prices_served_from_cache_when_warm(fake_bera):
+    first = handler.get_prices({}, {})
+    assert first["statusCode"] == 200
+    assert first["headers"]["X-Cache-Status"] == "revalidated"
+    assert len(fake_bera) == 2
+
+    second = handler.get_prices({}, {})
+    assert second["statusCode"] == 200
+    assert second["headers"]["X-Cache-Status"] == "fresh"
+    assert json.loads(second["body"]) == json.loads(first["body"])
+    assert len(fake_bera) == 2
+
+
+def test_failed_scrape_is_not_cached(fake_bera, monkeypatch):
+    monkeypatch.setattr(handler, "fetch_conditional", lambda url: (fake_bera.append(url), False))
+
+    assert handler.get_prices({}, {})["statusCode"] == 503
+    assert handler.price_cache.get() is None
+
+
+def test_stale_snapshot_served_while_refreshing_in_background(fake_bera, monkeypatch):
+    clock = FakeClock()
+    cache = SnapshotCache(MemoryBackend(), ttl=60, stale_ttl=600, clock=clock)
+    cache.put(SAMPLE_DATA)
+    clock.now += 120
+    monkeypatch.setattr(handler, "price_cache", cache)
+
+    refreshes = []
+    monkeypatch.setattr(handler.refresher, "trigger", lambda key, refresh: refreshes.append(refresh))
+
+    response = handler.get_prices({}, {})
+    assert response["headers"]["X-Cache-Status"] == "stale"
+    assert json.loads(response["body"]) == SAMPLE_DATA
+    assert fake_bera == []
+
+    # Run the refresh the request scheduled and check it replaced the snapshot
+    assert refreshes == [handler.refresh_prices]
+    refreshes[0]()
+    data, state = cache.lookup()
+    assert state == "fresh"
+    assert data["effectiveDate"] == "15th January 2024"
+    assert len(data["prices"]) == 4
+
+
+def test_expired_beyond_stale_window_scrapes_on_request(fake_bera, monkeypatch):
+    clock = FakeClock()
+    cache = SnapshotCache(MemoryBackend(), ttl=60, stale_ttl=600, clock=clock)
+    cache.put(SAMPLE_DATA)
+    clock.now += 700
+    monkeypatch.setattr(handler, "price_cache", cache)
+
+    response = handler.get_prices({}, {})
+    assert response["headers"]["X-Cache-Status"] == "revalidated"
+    assert len(fake_bera) == 2
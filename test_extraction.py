@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+The single-pass scanner must give exactly what the original per-product
+regexes gave on the test_core / test_comprehensive samples and fixtures
+"""
+
+import random
+import re
+
+import pytest
+
+from extraction import FUEL_TYPES, scan_prices
+from parsers import BACKENDS
+from stub_server import load_fixture
+
+LEGACY_PATTERNS = [
+    ("Retail Pump Price - Unleaded Petrol 93", r'petrol\s+93.*?(\d+\.\d+)'),
+    ("Retail Pump Price - Unleaded Petrol 95", r'petrol\s+95.*?(\d+\.\d+)'),
+    ("Retail Pump Price - Diesel 50ppm", r'diesel.*?(\d+\.\d+)'),
+    ("Wholesale Price - Illuminating Paraffin", r'paraffin.*?(\d+\.\d+)'),
+]
+
+
+def legacy_scan(text):
+    """The original extract_prices regexes, one re.search per pattern"""
+    date_match = re.search(r'effective.*?(\d{1,2}.*?\d{4})', text, re.IGNORECASE)
+    prices = []
+    for product, pattern in LEGACY_PATTERNS:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            prices.append((product, float(match.group(1))))
+    return (date_match.group(1) if date_match else None), prices
+
+
+SAMPLES = [
+    # test_core.py
+    """
+    FUEL PRICE ADJUSTMENT - EFFECTIVE 15TH JANUARY 2024
+
+    The following retail pump prices are effective from 15th January 2024:
+
+    Unleaded Petrol 93: 14.50 BWP per litre
+    Unleaded Petrol 95: 14.75 BWP per litre
+    Diesel 50ppm: 13.80 BWP per litre
+    Illuminating Paraffin: 9.50 BWP per litre
+    """,
+    # test_comprehensive.py
+    """
+    FUEL PRICE ADJUSTMENT - EFFECTIVE 15TH JANUARY 2024
+
+    The Botswana Energy Regulatory Authority (BERA) announces the following
+    fuel prices effective from 15th January 2024:
+
+    Retail Pump Prices:
+    - Unleaded Petrol 93: 14.50 BWP per litre
+    - Unleaded Petrol 95: 14.75 BWP per litre
+    - Diesel 50ppm: 13.80 BWP per litre
+
+    Wholesale Prices:
+    - Illuminating Paraffin: 9.50 BWP per litre
+    """,
+    # test_comprehensive.py edge cases
+    "Petrol 93: P14.50",
+    "Petrol 93 - BWP 14.50",
+    "Petrol 93 costs 14.50 pula",
+    "effective 1st January 2024",
+    "effective from January 1, 2024",
+    "effective 01/01/2024",
+    # Keywords whose value is on a later line, or missing entirely
+    "Diesel prices rise\nDiesel 50ppm 13.80\nPetrol\n93 14.50",
+    "Effective soon\nEffective 3 March 2024\nParaffin 9.",
+    "Petrol 9314.50Petrol 95 14.75 diesel 1. 2.5",
+    "",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_matches_legacy_regexes_on_samples(text):
+    assert scan_prices(text) == legacy_scan(text)
+
+
+@pytest.mark.parametrize("fixture", ["announcement.html", "announcement_list.html", "press_releases.html"])
+def test_matches_legacy_regexes_on_fixtures(fixture):
+    text = BACKENDS["html.parser"].text(load_fixture(fixture))
+    assert scan_prices(text) == legacy_scan(text)
+
+
+def test_matches_legacy_regexes_on_random_text():
+    rng = random.Random(1234)
+    words = ["petrol", "Petrol", "93", "95", "diesel", "DIESEL", "paraffin", "effective",
+             "14.50", "9.", ".5", "2024", "1st", "7", "x", " ", "  ", "\n", "\t", "P13.80",
+             "DIE\u017fEL", "d\u0131esel", "\u0130", "\u00e9"]
+    for _ in range(2000):
+        text = "".join(rng.choice(words) + rng.choice(["", " ", "\n"]) for _ in range(rng.randint(0, 30)))
+        assert scan_prices(text) == legacy_scan(text), repr(text)
+
+
+def test_matches_legacy_regexes_on_single_long_line():
+    text = "Petrol and diesel supply update " * 2000 + "Diesel 13.80 Paraffin 9.50 effective 1 July 2024"
+    assert scan_prices(text) == legacy_scan(text)
+    assert scan_prices(text)[1] == [("Retail Pump Price - Diesel 50ppm", 13.80),
+                                    ("Wholesale Price - Illuminating Paraffin", 9.50)]
+
+
+def test_products_reported_in_declared_order():
+    _, prices = scan_prices("Paraffin 9.50\nDiesel 13.80\nPetrol 95 14.75\nPetrol 93 14.50")
+    assert [product for product, _ in prices] == [product for product, _ in FUEL_TYPES]
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for fetching BERA pages, run against a local HTTP stub server
+"""
+
+import time
+
+import pytest
+
+import handler
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH, load_fixture
+
+
+def test_fetch_page_returns_html(stub):
+    html = handler.fetch_page(stub.url(LISTING_PATH))
+    assert "Press Releases" in html
+
+
+def test_session_is_shared_and_keeps_connections_alive(stub):
+    session = handler.get_session()
+    assert handler.get_session() is session
+
+    handler.fetch_page(stub.url(LISTING_PATH))
+    handler.fetch_page(stub.url(ANNOUNCEMENT_PATH))
+    assert len(stub.clients) == 2
+    assert stub.clients[0] == stub.clients[1]
+
+
+def test_session_uses_configured_pool_and_retries():
+    adapter = handler.get_session().get_adapter("https://www.bera.co.bw/")
+    assert adapter._pool_maxsize == handler.HTTP_POOL_MAXSIZE
+    assert adapter.max_retries.total == handler.HTTP_RETRIES
+    assert adapter.max_retries.backoff_factor == handler.HTTP_BACKOFF
+
+
+def test_read_timeouts_are_not_retried(stub, monkeypatch):
+    monkeypatch.setattr(handler, "TIMEOUT", 0.2)
+    stub.delay = 0.5
+    assert handler.fetch_page(stub.url(LISTING_PATH)) is None
+    assert stub.hits(LISTING_PATH) == 1
+
+
+def test_fetch_page_returns_none_on_http_error(stub):
+    assert handler.fetch_page(stub.url("/missing")) is None
+
+
+def test_second_fetch_sends_validators_and_reuses_body(stub):
+    html, not_modified = handler.fetch_conditional(stub.url(LISTING_PATH))
+    assert not not_modified
+
+    again, not_modified = handler.fetch_conditional(stub.url(LISTING_PATH))
+    assert not_modified
+    assert again == html
+
+    _, headers = stub.requests[-1]
+    assert headers["If-None-Match"].startswith('"')
+    assert headers["If-Modified-Since"] == "Fri, 28 Jun 2024 10:00:00 GMT"
+
+
+def test_changed_page_is_downloaded_again(stub):
+    handler.fetch_conditional(stub.url(LISTING_PATH))
+    stub.pages[LISTING_PATH] = stub.pages[LISTING_PATH].replace("Press Releases", "Media Releases")
+
+    html, not_modified = handler.fetch_conditional(stub.url(LISTING_PATH))
+    assert not not_modified
+    assert "Media Releases" in html
+
+
+def test_unchanged_pages_skip_parsing(stub, monkeypatch):
+    calls = []
+    find = handler.find_fuel_announcement
+    extract = handler.extract_prices
+    monkeypatch.setattr(handler, "find_fuel_announcement", lambda html, base_url=None: calls.append("find") or find(html, base_url))
+    monkeypatch.setattr(handler, "extract_prices", lambda html, url: calls.append("extract") or extract(html, url))
+
+    first, error = handler.scrape_prices()
+    assert error is None
+    assert first["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+    assert calls == ["find", "extract"]
+
+    second, error = handler.scrape_prices()
+    assert error is None
+    assert second == first
+    assert calls == ["find", "extract"]
+    assert stub.hits(LISTING_PATH) == 2
+    assert stub.hits(ANNOUNCEMENT_PATH) == 2
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 7, 256, 100000])
+def test_streamed_link_matches_full_parse(size):
+    html = load_fixture("press_releases.html")
+    expected = handler.find_fuel_announcement(html, "https://www.bera.co.bw/media/press-releases")
+    found = handler.find_fuel_announcement_in_chunks(chunked(html, size), "https://www.bera.co.bw/media/press-releases")
+    assert found == expected
+
+
+def test_streaming_stops_reading_after_first_match():
+    html = load_fixture("press_releases.html") + "<p>padding</p>" * 100000
+    consumed = []
+
+    def chunks():
+        for chunk in chunked(html, 512):
+            consumed.append(chunk)
+            yield chunk
+
+    assert handler.find_fuel_announcement_in_chunks(chunks()).endswith("fuel-price-adjustment-july-2024")
+    assert sum(len(c) for c in consumed) < 4096
+
+
+def test_streaming_handles_missing_and_unclosed_links():
+    assert handler.find_fuel_announcement_in_chunks(chunked("<a href='/news'>Other News</a>", 10)) is None
+
+    unclosed = "<html><body><a href='/news'>Other News</a><a href='/fuel'>Fuel price"
+    assert handler.find_fuel_announcement(unclosed) == "https://www.bera.co.bw/fuel"
+    assert handler.find_fuel_announcement_in_chunks(chunked(unclosed, 10)) == "https://www.bera.co.bw/fuel"
+
+
+def test_streaming_scrape_against_stub(stub, monkeypatch):
+    monkeypatch.setattr(handler, "STREAM_LISTING", True)
+    stub.pages[LISTING_PATH] += "<p>padding</p>" * 100000
+
+    fuel_data, error = handler.scrape_prices()
+    assert error is None
+    assert fuel_data["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+
+    # The second poll revalidates the listing and reuses the streamed result
+    fuel_data, error = handler.scrape_prices()
+    assert error is None
+    assert stub.hits(LISTING_PATH) == 2
+    _, headers = [r for r in stub.requests if r[0] == LISTING_PATH][-1]
+    assert "If-None-Match" in headers
+
+
+def test_streaming_scrape_reports_unreachable_origin(stub, monkeypatch):
+    monkeypatch.setattr(handler, "STREAM_LISTING", True)
+    stub.status = 404
+
+    fuel_data, error = handler.scrape_prices()
+    assert fuel_data is None
+    assert error["statusCode"] == 503
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_last_announcement_is_prefetched_alongside_the_listing(stub, monkeypatch, stream):
+    monkeypatch.setattr(handler, "STREAM_LISTING", stream)
+    handler.scrape_prices()
+    assert handler.last_announcement_url == stub.url(ANNOUNCEMENT_PATH)
+
+    stub.delay = 0.2
+    started = time.perf_counter()
+    fuel_data, error = handler.scrape_prices()
+    elapsed = time.perf_counter() - started
+
+    assert error is None
+    assert stub.hits(ANNOUNCEMENT_PATH) == 2
+    # Listing and announcement overlap: one slow round trip, not two
+    assert elapsed < 0.35
+
+
+def test_prefetch_falls_back_when_the_listing_moves_on(stub):
+    other = "/media/press-releases/fuel-price-review-june-2024"
+    stub.pages[other] = load_fixture("announcement_list.html")
+    handler.last_announcement_url = stub.url(other)
+
+    fuel_data, error = handler.scrape_prices()
+    assert fuel_data["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+    assert fuel_data["effectiveDate"] == "1st July 2024"
+    assert handler.last_announcement_url == stub.url(ANNOUNCEMENT_PATH)
+
+
+def test_prefetch_can_be_turned_off(stub, monkeypatch):
+    monkeypatch.setattr(handler, "SPECULATIVE_PREFETCH", False)
+    handler.last_announcement_url = stub.url("/media/press-releases/old")
+
+    handler.scrape_prices()
+    assert stub.hits("/media/press-releases/old") == 0
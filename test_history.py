@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Tests for the price history store and the /prices/history endpoint
+"""
+
+import json
+
+import pytest
+
+import handler
+from history import (DynamoDBHistoryStore, NullHistoryStore, SQLiteHistoryStore, create_history_store,
+                     decode_cursor, normalize_date)
+from stub_server import ANNOUNCEMENT_PATH
+
+PRODUCTS = ["Retail Pump Price - Unleaded Petrol 93", "Retail Pump Price - Diesel 50ppm"]
+
+
+def announcement(date, petrol, diesel, url="https://www.bera.co.bw/a"):
+    return {
+        "effectiveDate": date,
+        "currency": "BWP",
+        "prices": [{"product": PRODUCTS[0], "price": petrol}, {"product": PRODUCTS[1], "price": diesel}],
+        "sourceUrl": url,
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    history = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    yield history
+    history.close()
+
+
+@pytest.fixture
+def months(store):
+    for month, name in enumerate(["January", "February", "March", "April", "May", "June"], start=1):
+        store.record(announcement(f"2nd {name} 2024", 14 + month / 10, 13 + month / 10, f"https://b/{month}"))
+    return store
+
+
+def test_normalize_date():
+    assert normalize_date("1st July 2024") == "2024-07-01"
+    assert normalize_date("with effect from 22nd of March, 2023") == "2023-03-22"
+    assert normalize_date("15 Sept 2025") == "2025-09-15"
+    # Month first and numeric, as in the test_comprehensive samples
+    assert normalize_date("January 1, 2024") == "2024-01-01"
+    assert normalize_date("effective from Jan 15th 2024") == "2024-01-15"
+    assert normalize_date("01/07/2024") == "2024-07-01"
+    assert normalize_date("07/31/2024") == "2024-07-31"
+    assert normalize_date("31.07.2024") == "2024-07-31"
+    assert normalize_date("31 February 2024") is None
+    assert normalize_date("Date not specified") is None
+    assert normalize_date("12 Foo 2024") is None
+
+
+def test_recording_the_same_announcement_twice_appends_nothing(store):
+    assert store.record(announcement("1st July 2024", 14.5, 13.8)) == 2
+    assert store.record(announcement("1st July 2024", 14.5, 13.8)) == 0
+    assert len(store.query()["items"]) == 2
+
+
+def test_undated_announcements_are_kept_once_but_not_listed(store):
+    # Scraped again on later days, the same announcement is still one set of rows
+    assert store.record(announcement("Date not specified", 14.5, 13.8), recorded_at=1719792000) == 2
+    assert store.record(announcement("Date not specified", 14.5, 13.8), recorded_at=1720051200) == 0
+    assert store.record(announcement(None, 14.5, 13.8), recorded_at=1720051200) == 2
+    assert store.record(announcement(None, 14.5, 13.8), recorded_at=1720137600) == 0
+    assert store.query()["items"] == []
+
+
+def test_month_first_dates_are_recorded_once(store):
+    assert store.record(announcement("January 1, 2024", 14.5, 13.8), recorded_at=1699920000) == 2
+    assert store.record(announcement("January 1, 2024", 14.5, 13.8), recorded_at=1700179200) == 0
+    assert {item["effectiveDate"] for item in store.query()["items"]} == {"2024-01-01"}
+
+
+def test_range_and_product_filters(months):
+    items = months.query(start="2024-02-01", end="2024-04-30", product=PRODUCTS[1])["items"]
+    assert [(i["effectiveDate"], i["price"]) for i in items] == [
+        ("2024-02-02", 13.2), ("2024-03-02", 13.3), ("2024-04-02", 13.4)]
+
+
+def test_pages_follow_the_cursor_without_gaps_or_repeats(months):
+    seen, cursor = [], None
+    while True:
+        page = months.query(start="2024-02-01", limit=3, cursor=cursor)
+        seen.extend((i["effectiveDate"], i["product"]) for i in page["items"])
+        cursor = page["nextCursor"]
+        if not cursor:
+            break
+    assert len(seen) == 10
+    assert len(set(seen)) == 10
+    assert seen == sorted(seen, key=lambda item: item[0])
+
+
+def test_range_queries_are_answered_from_an_index(months):
+    cursor = months.query(limit=1)["nextCursor"]
+    for plan in (months.explain("2024-01-01", "2024-03-31"),
+                 months.explain("2024-01-01", "2024-03-31", PRODUCTS[0], cursor)):
+        assert any("USING INDEX" in step for step in plan)
+        assert not any(step.startswith("SCAN") or "TEMP B-TREE" in step for step in plan)
+
+
+def test_invalid_cursor_is_rejected(store):
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+    with pytest.raises(ValueError):
+        store.query(cursor="bm9wZQ")
+
+
+class ConditionalCheckFailed(Exception):
+    response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+
+
+class FakeDynamoDB:
+    """The put_item and query calls DynamoDBHistoryStore makes, on a dict"""
+
+    def __init__(self, page_size=3):
+        self.items = {}
+        self.page_size = page_size  # like DynamoDB's 1 MB pages, stop early sometimes
+        self.queries = 0
+
+    def put_item(self, TableName, Item, ConditionExpression):
+        key = (Item["series"]["S"], Item["sk"]["S"])
+        if key in self.items:
+            raise ConditionalCheckFailed()
+        self.items[key] = Item
+
+    def query(self, TableName, KeyConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+              Limit, IndexName=None, ExclusiveStartKey=None):
+        self.queries += 1
+        values = {name: value["S"] for name, value in ExpressionAttributeValues.items()}
+        partition = ExpressionAttributeNames["#p"]
+        after = ExclusiveStartKey["sk"]["S"] if ExclusiveStartKey else ""
+        matching = sorted((item for item in self.items.values()
+                           if partition in item and item[partition]["S"] == values[":p"]
+                           and values[":low"] <= item["sk"]["S"] <= values[":high"] and item["sk"]["S"] > after),
+                          key=lambda item: item["sk"]["S"])
+        page = matching[:min(Limit, self.page_size)]
+        response = {"Items": page}
+        if len(page) < len(matching):
+            response["LastEvaluatedKey"] = {"series": page[-1]["series"], "sk": page[-1]["sk"]}
+        return response
+
+
+def test_dynamodb_store_records_once_and_pages_in_date_order():
+    store = DynamoDBHistoryStore("history", client=FakeDynamoDB())
+    for month, name in enumerate(["January", "February", "March", "April", "May", "June"], start=1):
+        assert store.record(announcement(f"2nd {name} 2024", 14 + month / 10, 13 + month / 10)) == 2
+    assert store.record(announcement("2nd March 2024", 14.3, 13.3)) == 0
+    # Undated, even when the text looks like the start of a date range
+    assert store.record(announcement("1, 2024", 14.5, 13.8)) == 2
+    assert store.record(announcement("1, 2024", 14.5, 13.8)) == 0
+
+    seen, cursor = [], None
+    while True:
+        page = store.query(start="2024-02-01", limit=4, cursor=cursor)
+        seen.extend((i["effectiveDate"], i["product"], i["price"]) for i in page["items"])
+        cursor = page["nextCursor"]
+        if not cursor:
+            break
+    assert len(seen) == 10
+    assert seen == sorted(seen)
+
+    items = store.query(start="2024-02-01", end="2024-04-30", product=PRODUCTS[1])["items"]
+    assert [(i["effectiveDate"], i["price"], i["announcedAs"]) for i in items] == [
+        ("2024-02-02", 13.2, "2nd February 2024"), ("2024-03-02", 13.3, "2nd March 2024"),
+        ("2024-04-02", 13.4, "2nd April 2024")]
+    cursor = store.query(product=PRODUCTS[0], limit=2)["nextCursor"]
+    assert store.query(product=PRODUCTS[0], limit=2, cursor=cursor)["items"][0]["effectiveDate"] == "2024-03-02"
+    with pytest.raises(ValueError):
+        store.query(cursor="bm9wZQ")
+
+
+def test_create_history_store(tmp_path):
+    assert isinstance(create_history_store("sqlite", str(tmp_path / "h.sqlite3")), SQLiteHistoryStore)
+    assert isinstance(create_history_store("dynamodb", table="history", client=FakeDynamoDB()), DynamoDBHistoryStore)
+    assert isinstance(create_history_store("none"), NullHistoryStore)
+    with pytest.raises(ValueError):
+        create_history_store("postgres")
+
+
+@pytest.fixture
+def isolated_handler(fresh_handler, monkeypatch, store):
+    monkeypatch.setattr(handler, "history_store", store)
+    return store
+
+
+def history(params=None):
+    return handler.get_price_history({"queryStringParameters": params}, None)
+
+
+def test_scrape_records_history_once(isolated_handler, stub):
+    handler.scrape_prices()
+    handler.scrape_prices()
+
+    response = history()
+    assert response["statusCode"] == 200
+    body = json.loads(response["body"])
+    assert [i["price"] for i in body["items"]] == [14.50, 14.75, 13.80, 9.50]
+    assert {i["effectiveDate"] for i in body["items"]} == {"2024-07-01"}
+    assert body["items"][0]["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+    assert body["nextCursor"] is None
+
+
+def test_history_endpoint_paginates(isolated_handler, months):
+    first = json.loads(history({"from": "2024-01-01", "to": "2024-06-30", "limit": "4"})["body"])
+    second = json.loads(history({"limit": "4", "cursor": first["nextCursor"]})["body"])
+    assert len(first["items"]) == 4
+    assert second["items"][0]["effectiveDate"] == "2024-03-02"
+
+
+def test_history_endpoint_rejects_bad_parameters(isolated_handler):
+    assert history({"from": "July 2024"})["statusCode"] == 400
+    assert history({"limit": "0"})["statusCode"] == 400
+    assert history({"limit": "lots"})["statusCode"] == 400
+    assert history({"cursor": "garbage!"})["statusCode"] == 400
+    assert history(None)["statusCode"] == 200
+
+
+def test_history_failure_does_not_fail_the_scrape(isolated_handler, stub, monkeypatch):
+    class BrokenStore(NullHistoryStore):
+        def record_rows(self, rows):
+            raise OSError("disk full")
+
+    monkeypatch.setattr(handler, "history_store", BrokenStore())
+    fuel_data, error = handler.scrape_prices()
+    assert error is None
+    assert fuel_data["effectiveDate"] == "1st July 2024"
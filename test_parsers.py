@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Parity tests: every installed HTML parser backend must give the same results
+on the saved BERA fixtures
+"""
+
+import pytest
+
+import handler
+import parsers
+from cache import DigestMemo
+from extraction import scan_prices
+from stub_server import load_fixture
+
+ANNOUNCEMENTS = ["announcement.html", "announcement_list.html"]
+SOURCE_URL = "https://www.bera.co.bw/media/press-releases/fuel-price-adjustment-july-2024"
+
+installed = [name for name in parsers.BACKENDS if parsers.is_available(name)]
+
+
+@pytest.fixture(params=installed)
+def backend(request, monkeypatch):
+    backend = parsers.BACKENDS[request.param]
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    # Region extraction does not go through the backend's text()
+    monkeypatch.setattr(handler, "REGION_EXTRACTION", False)
+    return backend
+
+
+def reference(fn, *args):
+    """Result of fn with the pure-Python backend"""
+    original = handler.parser_backend
+    handler.parser_backend = parsers.BACKENDS["html.parser"]
+    try:
+        return fn(*args)
+    finally:
+        handler.parser_backend = original
+
+
+@pytest.mark.parametrize("fixture", ANNOUNCEMENTS)
+def test_backends_extract_identical_fuel_data(backend, fixture, monkeypatch):
+    html = load_fixture(fixture)
+    expected = reference(handler.parse_prices, html, SOURCE_URL)
+    assert expected and len(expected["prices"]) == 4
+
+    monkeypatch.setattr(handler, "parser_backend", backend)
+    assert handler.parse_prices(html, SOURCE_URL) == expected
+
+
+def test_backends_find_identical_announcement(backend, monkeypatch):
+    html = load_fixture("press_releases.html")
+    expected = reference(handler.find_fuel_announcement, html)
+
+    monkeypatch.setattr(handler, "parser_backend", backend)
+    assert handler.find_fuel_announcement(html) == expected
+
+
+def test_backends_return_identical_links(backend):
+    html = load_fixture("press_releases.html")
+    expected = list(parsers.BACKENDS["html.parser"].links(html))
+    assert [(href, text.strip()) for href, text in backend.links(html)] == \
+        [(href, text.strip()) for href, text in expected]
+
+
+def test_backends_skip_script_and_style_text(backend):
+    html = "<html><head><style>p { x: 1.5 }</style><script>var diesel = 9.99;</script></head><body><p>Diesel 13.80</p></body></html>"
+    text = backend.text(html)
+    assert "13.80" in text
+    assert "9.99" not in text
+    assert "x: 1.5" not in text
+
+
+def test_missing_backend_falls_back(monkeypatch):
+    monkeypatch.setattr(parsers, "is_available", lambda name: name == "html.parser")
+    assert parsers.get_backend("selectolax").name == "html.parser"
+    assert parsers.get_backend("auto").name == "html.parser"
+
+
+def test_auto_prefers_fastest_installed(monkeypatch):
+    monkeypatch.setattr(parsers, "is_available", lambda name: name != "selectolax")
+    assert parsers.get_backend("auto").name == "lxml"
+    assert parsers.get_backend("html.parser").name == "html.parser"
+
+
+def test_stream_is_the_fallback_without_compiled_parsers(monkeypatch):
+    monkeypatch.setattr(parsers, "is_available", lambda name: name in ("stream", "html.parser"))
+    assert parsers.get_backend("auto").name == "stream"
+
+
+def test_stream_skips_menus_and_decodes_entities():
+    stream = parsers.BACKENDS["stream"]
+    html = ("<nav><a href='/'>Diesel 1.00</a></nav><p>Diesel &amp; petrol: 13.80</p>"
+            "<nav><nav>Paraffin 2.00</nav> 3.00</nav><p>Paraffin&nbsp;9.50</p>")
+    assert stream.text(html) == "Diesel & petrol: 13.80Paraffin\xa09.50"
+    assert list(stream.links(html)) == [("/", "Diesel 1.00")]
+
+
+def test_stream_keeps_the_text_of_a_menu_that_never_closes():
+    text = parsers.BACKENDS["stream"].text("<p>Effective 1st July 2024</p><nav><p>Diesel 13.80</p>")
+    assert text == "Effective 1st July 2024Diesel 13.80"
+
+
+@pytest.mark.parametrize("fixture", ANNOUNCEMENTS + ["press_releases.html"])
+def test_stream_text_scans_like_get_text(fixture):
+    html = load_fixture(fixture)
+    assert scan_prices(parsers.BACKENDS["stream"].text(html)) == \
+        scan_prices(parsers.BACKENDS["html.parser"].text(html))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tests for the scheduled poller and store-only get_prices
+"""
+
+import json
+
+import pytest
+
+import handler
+from cache import (DynamoDBKeyValueStore, InMemoryKeyValueStore,
+                   KeyValueBackend, SnapshotCache)
+from poller import poll_prices
+from stub_server import ANNOUNCEMENT_PATH
+
+
+@pytest.fixture
+def store(fresh_handler, monkeypatch):
+    cache = SnapshotCache(KeyValueBackend(InMemoryKeyValueStore()), ttl=3600, stale_ttl=86400)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+    return cache
+
+
+def test_poll_writes_prices_into_store(store, stub):
+    result = poll_prices({}, None)
+    assert result["updated"]
+    assert result["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+
+    data, state = store.lookup()
+    assert state == "fresh"
+    assert [p["price"] for p in data["prices"]] == [14.50, 14.75, 13.80, 9.50]
+
+
+def test_get_prices_reads_store_without_scraping(store, stub):
+    poll_prices({}, None)
+    requests_after_poll = len(stub.requests)
+
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["effectiveDate"] == "1st July 2024"
+    assert len(stub.requests) == requests_after_poll
+
+
+def test_get_prices_with_empty_store_does_not_scrape(store, stub):
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 503
+    assert stub.requests == []
+
+
+def test_failed_poll_keeps_previous_prices(store, stub):
+    poll_prices({}, None)
+    stub.status = 404
+
+    result = poll_prices({}, None)
+    assert not result["updated"]
+    assert result["statusCode"] == 503
+    assert handler.get_prices({}, None)["statusCode"] == 200
+
+
+def test_dynamodb_store_round_trip():
+    class FakeDynamoDB:
+        def __init__(self):
+            self.items = {}
+
+        def get_item(self, TableName, Key, ConsistentRead):
+            item = self.items.get((TableName, Key["key"]["S"]))
+            return {"Item": item} if item else {}
+
+        def put_item(self, TableName, Item):
+            self.items[(TableName, Item["key"]["S"])] = Item
+
+        def delete_item(self, TableName, Key):
+            self.items.pop((TableName, Key["key"]["S"]), None)
+
+    store = DynamoDBKeyValueStore("prices", client=FakeDynamoDB())
+    assert store.get("latest") is None
+    store.put("latest", "{}")
+    assert store.get("latest") == "{}"
+    store.delete("latest")
+    assert store.get("latest") is None
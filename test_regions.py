@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Tests for locating the block that holds the prices before scanning it
+"""
+
+import pytest
+
+import handler
+import parsers
+from cache import DigestMemo
+from extraction import scan_prices
+from regions import RegionLocator, parse_rows, price_column, row_lines
+from stub_server import load_fixture
+
+URL = "https://www.bera.co.bw/media/press-releases/fuel-price-adjustment-july-2024"
+P93, P95, DIESEL, PARAFFIN = (
+    "Retail Pump Price - Unleaded Petrol 93",
+    "Retail Pump Price - Unleaded Petrol 95",
+    "Retail Pump Price - Diesel 50ppm",
+    "Wholesale Price - Illuminating Paraffin",
+)
+
+PAGE = """<html><head><title>Fuel Price Adjustment</title></head>
+<body class="node-press-release">
+<nav><a href="/petroleum">Petroleum</a> <a href="/diesel-levy">Diesel levy 0.25</a></nav>
+<h1>Fuel Price Adjustment</h1>
+<p>The following prices are effective from <strong>1st July 2024</strong>.</p>
+{body}
+<footer>Petrol 93 stations open 24 hours. Version 2.10</footer>
+</body></html>"""
+
+TWO_COLUMNS = """<table class="prices">
+<tr><th>Product</th><th>Old Price</th><th>New Price</th></tr>
+<tr><td>Unleaded Petrol 93</td><td>14.25</td><td>14.50</td></tr>
+<tr><td>Unleaded Petrol 95</td><td>14.48</td><td>14.75</td></tr>
+<tr><td>Diesel 50ppm</td><td>13.52</td><td>13.80</td></tr>
+<tr><td>Illuminating Paraffin</td><td>9.32</td><td>9.50</td></tr>
+</table>"""
+
+NEW_PRICES = [(P93, 14.50), (P95, 14.75), (DIESEL, 13.80), (PARAFFIN, 9.50)]
+
+
+def whole_page(html):
+    return scan_prices(parsers.BACKENDS["stream"].text(html))
+
+
+@pytest.mark.parametrize("fixture", ["announcement.html", "announcement_list.html"])
+def test_same_result_as_the_whole_page_on_fixtures(fixture):
+    html = load_fixture(fixture)
+    assert RegionLocator().scan(html, URL) == whole_page(html)
+
+
+def test_reads_the_new_price_column():
+    html = PAGE.format(body=TWO_COLUMNS)
+    assert RegionLocator().scan(html, URL) == ("1st July 2024", NEW_PRICES)
+    # The whole page text runs the old and new price cells together
+    date, prices = whole_page(html)
+    assert dict(prices)[P93] == 14.2514
+    assert dict(prices)[DIESEL] == 13.5213
+
+
+def test_date_comes_from_the_price_column():
+    html = PAGE.format(body="""<table>
+<tr><th>Product</th><th>Price effective 1 June 2024</th><th>Price effective 1 July 2024</th></tr>
+<tr><td>Diesel 50ppm</td><td>13.52</td><td>13.80</td></tr>
+</table>""")
+    assert RegionLocator().scan(html, URL) == ("1 July 2024", [(DIESEL, 13.80)])
+
+
+def test_definition_list():
+    html = PAGE.format(body="""<dl class="prices">
+<dt>Unleaded Petrol 93</dt><dd>P14.50 per litre</dd>
+<dt>Unleaded Petrol 95</dt><dd>P14.75 per litre</dd>
+<dt>Diesel 50ppm</dt><dd>P13.80 per litre</dd>
+<dt>Illuminating Paraffin</dt><dd>P9.50 per litre</dd>
+</dl>""")
+    assert RegionLocator().scan(html, URL) == ("1st July 2024", NEW_PRICES)
+
+
+PARAGRAPH = """<p>Unleaded Petrol 93: 14.50<br>Unleaded Petrol 95: 14.75<br>
+Diesel 50ppm: 13.80<br/>Illuminating Paraffin: 9.50</p>"""
+
+
+def test_paragraph_with_line_breaks():
+    html = PAGE.format(body=PARAGRAPH)
+    assert RegionLocator().scan(html, URL) == ("1st July 2024", NEW_PRICES)
+
+
+def test_innermost_block_wins_over_a_layout_table():
+    html = PAGE.format(body=f"""<table class="layout"><tr><td>
+<p>Diesel 50ppm deliveries resume on 2.5 July.</p>{TWO_COLUMNS}
+</td></tr></table>""")
+    assert RegionLocator().scan(html, URL)[1] == NEW_PRICES
+
+
+def test_products_outside_the_table_come_from_the_next_block():
+    table = "\n".join(line for line in TWO_COLUMNS.splitlines() if "Paraffin" not in line)
+    html = PAGE.format(body=f"""{table}
+<p>Illuminating Paraffin: 9.50 per litre</p>""")
+    assert RegionLocator().scan(html, URL) == ("1st July 2024", NEW_PRICES)
+
+
+def test_date_inside_the_region_is_preferred():
+    html = PAGE.format(body="""<table><caption>Prices effective 3rd June 2024</caption>
+<tr><td>Diesel 50ppm</td><td>13.52</td></tr></table>""")
+    assert RegionLocator().scan(html, URL) == ("3rd June 2024", [(DIESEL, 13.52)])
+
+
+def test_strategy_is_reused_for_the_same_template():
+    locator = RegionLocator()
+    locator.scan(PAGE.format(body=TWO_COLUMNS), URL)
+    assert locator.stats() == {"located": 1, "reused": 0, "fallbacks": 0, "templates": 1}
+
+    later = PAGE.format(body=TWO_COLUMNS.replace("14.50", "15.00"))
+    assert locator.scan(later, URL)[1][0] == (P93, 15.00)
+    assert locator.stats()["reused"] == 1
+
+    # The remembered block is gone: the page is searched again
+    listed = PAGE.format(body="<ul><li>Diesel 50ppm - P13.52</li></ul>")
+    assert locator.scan(listed, URL)[1] == [(DIESEL, 13.52)]
+    assert locator.stats()["located"] == 2
+
+    locator.scan(listed, "https://mirror.example/fuel-prices")
+    assert locator.stats() == {"located": 3, "reused": 1, "fallbacks": 0, "templates": 2}
+
+
+def test_remembered_block_is_only_used_when_it_prices_every_product():
+    locator = RegionLocator()
+    locator.scan(PAGE.format(body=PARAGRAPH), URL)
+    # The remembered opening tag is a bare <p>, and the first one on this page is not the prices
+    later = PAGE.format(body=PARAGRAPH).replace("<h1>", "<p>Diesel demand rose 2.5 percent</p>\n<h1>")
+    assert locator.scan(later, URL) == ("1st July 2024", NEW_PRICES)
+    assert locator.stats() == {"located": 2, "reused": 0, "fallbacks": 0, "templates": 1}
+
+
+def test_no_block_with_prices_falls_back_to_the_whole_page(monkeypatch):
+    html = "<html><body><div>Effective 1st July 2024\nDiesel 50ppm: 13.80</div></body></html>"
+    locator = RegionLocator()
+    assert locator.scan(html, URL) is None
+    assert locator.stats()["fallbacks"] == 1
+
+    monkeypatch.setattr(handler, "region_locator", locator)
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    fuel_data = handler.extract_prices(html, URL)
+    assert fuel_data["effectiveDate"] == "1st July 2024"
+    assert fuel_data["prices"] == [{"product": DIESEL, "price": 13.80}]
+
+
+@pytest.mark.parametrize("notice", [
+    "<p>Effective:<br>1st July 2024</p>",
+    "<p>Prices effective <span style='" + "font-family: Arial, Helvetica, sans-serif; " * 5 + "'>1st July 2024</span></p>",
+])
+def test_date_the_region_misses_comes_from_the_whole_page(notice, monkeypatch):
+    html = f"<html><body>{notice}{TWO_COLUMNS}</body></html>"
+    assert RegionLocator().scan(html, URL) == (None, NEW_PRICES)
+
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    fuel_data = handler.extract_prices(html, URL)
+    assert fuel_data["effectiveDate"] == "1st July 2024"
+    assert fuel_data["prices"][0] == {"product": P93, "price": 14.50}
+
+
+def test_handler_can_scan_the_whole_page(monkeypatch):
+    html = PAGE.format(body=TWO_COLUMNS)
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    assert handler.extract_prices(html, URL)["prices"][0] == {"product": P93, "price": 14.50}
+
+    monkeypatch.setattr(handler, "REGION_EXTRACTION", False)
+    monkeypatch.setattr(handler, "parse_memo", DigestMemo())
+    assert handler.extract_prices(html, URL)["prices"][0] == {"product": P93, "price": 14.2514}
+
+
+def test_rows_and_price_column():
+    rows = parse_rows("<tr><th>Product</th><th>Price</th></tr><tr><td>Diesel\n  50ppm</td><td>13.80</td></tr>"
+                      "<script>var diesel = 1.5;</script>")
+    assert rows == [["Product", "Price"], ["Diesel 50ppm", "13.80"]]
+    assert price_column(["Product", "Current Price", "Change"]) is None
+    assert price_column(["No.", "Product", "Previous price", "Price (BWP/litre)"]) == 3
+    assert list(row_lines([["No.", "Product", "Old", "New"], ["1.0", "Diesel", "13.52", "13.80"]])) == [
+        "No. Product Old New", "Diesel 13.80"]
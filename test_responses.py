@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Tests for pre-serialized and canned Lambda responses
+"""
+
+import base64
+import gzip
+import json
+
+import pytest
+
+import handler
+import responses
+from cache import FileBackend, MemoryBackend, SnapshotCache
+from history import SQLiteHistoryStore
+
+FUEL_DATA = {
+    "effectiveDate": "1st July 2024",
+    "currency": "BWP",
+    "prices": [{"product": "Retail Pump Price - Diesel 50ppm", "price": 13.8}],
+    "sourceUrl": "https://www.bera.co.bw/a",
+}
+LARGE_DATA = {"items": [dict(FUEL_DATA, price=i / 100) for i in range(100)]}
+
+
+def test_prepare_serializes_once_with_compressed_variants():
+    prepared = responses.prepare(LARGE_DATA, encodings=["gzip"])
+    assert json.loads(prepared["body"]) == LARGE_DATA
+    gzipped = base64.b64decode(prepared["encoded"]["gzip"])
+    assert gzip.decompress(gzipped).decode("utf-8") == prepared["body"]
+    # Same body, same bytes: gzip's timestamp is fixed
+    assert responses.prepare(LARGE_DATA, encodings=["gzip"]) == prepared
+
+
+def test_small_bodies_are_not_compressed():
+    assert responses.prepare(FUEL_DATA)["encoded"] == {}
+
+
+def test_brotli_variant_when_available():
+    brotli = pytest.importorskip("brotli")
+    prepared = responses.prepare(LARGE_DATA, encodings=["br"])
+    assert brotli.decompress(base64.b64decode(prepared["encoded"]["br"])).decode("utf-8") == prepared["body"]
+
+
+def test_json_backends_agree():
+    assert responses.json_encoder("json") is json.dumps
+    assert json.loads(responses.json_encoder("auto")(LARGE_DATA)) == LARGE_DATA
+    assert responses.json_encoder("missing-backend") is json.dumps
+
+
+def test_orjson_backend():
+    pytest.importorskip("orjson")
+    assert responses.json_encoder("orjson")(FUEL_DATA) == json.dumps(FUEL_DATA, separators=(",", ":"))
+
+
+def test_canned_errors_are_built_once():
+    first = responses.error_response(503, responses.UNAVAILABLE)
+    second = responses.error_response(503, responses.UNAVAILABLE)
+    assert json.loads(first["body"]) == {"error": responses.UNAVAILABLE}
+    assert first["body"] is second["body"]
+    # Headers are per response, so adding one never leaks into the next
+    first["headers"]["Server-Timing"] = "total;dur=1"
+    assert "Server-Timing" not in second["headers"]
+
+
+def test_uncanned_errors_are_built_on_demand():
+    response = responses.error_response(418, "Teapot")
+    assert response["statusCode"] == 418
+    assert json.loads(response["body"]) == {"error": "Teapot"}
+
+
+@pytest.mark.parametrize("backend", ["memory", "file"])
+def test_snapshot_keeps_the_prepared_body(backend, tmp_path):
+    store = MemoryBackend() if backend == "memory" else FileBackend(str(tmp_path))
+    cache = SnapshotCache(store, ttl=3600, prepare=responses.prepare)
+    cache.put(FUEL_DATA)
+    snapshot, state = cache.lookup_snapshot()
+    assert state == "fresh"
+    assert snapshot["body"] == responses.dumps(FUEL_DATA)
+    assert cache.lookup() == (FUEL_DATA, "fresh")
+
+
+def test_cached_responses_do_no_serialization(monkeypatch):
+    cache = SnapshotCache(MemoryBackend(), ttl=3600, prepare=responses.prepare)
+    cache.put(FUEL_DATA)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+
+    def no_dumps(obj):
+        raise AssertionError("serialized on a cache hit")
+
+    monkeypatch.setattr(handler, "dumps", no_dumps)
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 200
+    assert response["headers"]["X-Cache-Status"] == "fresh"
+    assert json.loads(response["body"]) == FUEL_DATA
+
+
+def test_snapshots_without_a_prepared_body_still_work(monkeypatch):
+    cache = SnapshotCache(MemoryBackend(), ttl=3600)
+    cache.put(FUEL_DATA)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+    assert json.loads(handler.get_prices({}, None)["body"]) == FUEL_DATA
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, deflate, br", "br"),
+    ("gzip", "gzip"),
+    ("br;q=0.5, gzip;q=0.8", "gzip"),
+    ("br;q=0, gzip;q=0", None),
+    ("*", "br"),
+    ("identity", None),
+    ("", None),
+    (None, None),
+])
+def test_negotiate(accept, expected):
+    assert responses.negotiate(accept, ["br", "gzip"]) == expected
+
+
+def test_request_header_handles_rest_and_http_api_events():
+    assert responses.request_header({"headers": {"accept-encoding": "gzip"}}, "Accept-Encoding") == "gzip"
+    assert responses.request_header({"headers": {"Accept-Encoding": "br"}}, "Accept-Encoding") == "br"
+    assert responses.request_header({"headers": None}, "Accept-Encoding") is None
+    assert responses.request_header(None, "Accept-Encoding") is None
+
+
+def gzip_event():
+    return {"headers": {"accept-encoding": "gzip"}}
+
+
+def test_prices_served_from_the_prepared_variant(monkeypatch):
+    monkeypatch.setattr(responses, "COMPRESS_MIN_SIZE", 0)
+    cache = SnapshotCache(MemoryBackend(), ttl=3600, prepare=lambda data: responses.prepare(data, ["gzip"]))
+    cache.put(FUEL_DATA)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+    monkeypatch.setattr(responses, "compress", lambda *args: pytest.fail("compressed per request"))
+
+    response = handler.get_prices(gzip_event(), None)
+    assert response["isBase64Encoded"] is True
+    assert response["headers"]["Content-Encoding"] == "gzip"
+    assert response["headers"]["Vary"] == "Accept-Encoding"
+    assert json.loads(gzip.decompress(base64.b64decode(response["body"]))) == FUEL_DATA
+
+    plain = handler.get_prices({}, None)
+    assert "Content-Encoding" not in plain["headers"]
+    assert plain["headers"]["Vary"] == "Accept-Encoding"
+    assert json.loads(plain["body"]) == FUEL_DATA
+
+
+def test_small_prices_body_is_sent_uncompressed(monkeypatch):
+    cache = SnapshotCache(MemoryBackend(), ttl=3600, prepare=responses.prepare)
+    cache.put(FUEL_DATA)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+    response = handler.get_prices(gzip_event(), None)
+    assert "isBase64Encoded" not in response
+    assert json.loads(response["body"]) == FUEL_DATA
+
+
+def test_large_history_pages_are_compressed_on_the_fly(monkeypatch, tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+    for day in range(1, 29):
+        store.record(dict(FUEL_DATA, effectiveDate=f"{day} July 2024", sourceUrl=f"https://b/{day}"))
+    monkeypatch.setattr(handler, "history_store", store)
+
+    event = dict(gzip_event(), queryStringParameters=None)
+    response = handler.get_price_history(event, None)
+    assert response["headers"]["Content-Encoding"] == "gzip"
+    page = json.loads(gzip.decompress(base64.b64decode(response["body"])))
+    assert len(page["items"]) == 28
+    store.close()
+
+
+@pytest.fixture
+def cached_prices(monkeypatch):
+    now = [1719828000.0]  # 2024-07-01 10:00:00 GMT
+    cache = SnapshotCache(MemoryBackend(), ttl=3600, stale_ttl=86400, clock=lambda: now[0],
+                          prepare=responses.prepare)
+    cache.put(FUEL_DATA)
+    monkeypatch.setattr(handler, "price_cache", cache)
+    monkeypatch.setattr(handler, "SERVE_FROM_STORE", True)
+    monkeypatch.setattr(handler, "RESPONSE_MAX_AGE", 3600)
+    return now
+
+
+def test_etag_follows_the_price_data():
+    etag = responses.prepare(FUEL_DATA)["etag"]
+    assert etag.startswith('"') and etag.endswith('"')
+    assert responses.prepare(dict(FUEL_DATA))["etag"] == etag
+    assert responses.prepare(dict(FUEL_DATA, currency="ZAR"))["etag"] != etag
+
+
+def test_caching_headers_track_the_snapshot_age(cached_prices):
+    headers = handler.get_prices({}, None)["headers"]
+    assert headers["ETag"] == handler.price_cache.lookup_snapshot()[0]["etag"]
+    assert headers["Cache-Control"] == "public, max-age=3600"
+    assert headers["Last-Modified"] == "Mon, 01 Jul 2024 10:00:00 GMT"
+
+    cached_prices[0] += 600
+    assert handler.get_prices({}, None)["headers"]["Cache-Control"] == "public, max-age=3000"
+    cached_prices[0] += 3600
+    assert handler.get_prices({}, None)["headers"]["Cache-Control"] == "public, max-age=0"
+
+
+def test_last_modified_survives_polls_that_find_the_same_prices(cached_prices):
+    cached_prices[0] += 900
+    handler.price_cache.put(dict(FUEL_DATA))
+    headers = handler.get_prices({}, None)["headers"]
+    assert headers["Last-Modified"] == "Mon, 01 Jul 2024 10:00:00 GMT"
+    # The re-stored snapshot is fresh again
+    assert headers["Cache-Control"] == "public, max-age=3600"
+
+
+def test_max_age_is_capped_below_a_long_store_ttl(cached_prices, monkeypatch):
+    # The poller re-stores the snapshot every poll, so it always looks nearly new
+    monkeypatch.setattr(handler.price_cache, "ttl", 21600)
+    monkeypatch.setattr(handler, "RESPONSE_MAX_AGE", 900)
+    assert handler.get_prices({}, None)["headers"]["Cache-Control"] == "public, max-age=900"
+    cached_prices[0] += 21000
+    assert handler.get_prices({}, None)["headers"]["Cache-Control"] == "public, max-age=600"
+
+
+def test_store_older_than_the_stale_ttl_is_served_stale(cached_prices):
+    cached_prices[0] += 3600 + 86400 + 1
+    assert handler.price_cache.lookup_snapshot() == (None, None)
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 200
+    assert response["headers"]["X-Cache-Status"] == "stale"
+    assert response["headers"]["Cache-Control"] == "public, max-age=0"
+    assert json.loads(response["body"]) == FUEL_DATA
+
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", 'W/{etag}', '"other", {etag}', "*"])
+def test_if_none_match_gets_a_304(cached_prices, if_none_match):
+    etag = handler.get_prices({}, None)["headers"]["ETag"]
+    response = handler.get_prices({"headers": {"if-none-match": if_none_match.format(etag=etag)}}, None)
+    assert response["statusCode"] == 304
+    assert response["body"] == ""
+    assert response["headers"]["ETag"] == etag
+    assert response["headers"]["Cache-Control"] == "public, max-age=3600"
+    assert "Content-Type" not in response["headers"]
+
+
+def test_stale_etag_gets_the_full_response(cached_prices):
+    response = handler.get_prices({"headers": {"If-None-Match": '"0123456789abcdef"'}}, None)
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"]) == FUEL_DATA
+
+
+def test_compressed_representations_have_their_own_etag(cached_prices, monkeypatch):
+    monkeypatch.setattr(responses, "COMPRESS_MIN_SIZE", 0)
+    handler.price_cache.put(FUEL_DATA)
+    plain = handler.get_prices({}, None)["headers"]["ETag"]
+    gzipped = handler.get_prices(gzip_event(), None)["headers"]["ETag"]
+    assert gzipped == plain[:-1] + '-gzip"'
+
+    # Either tag revalidates: the content behind both is the same
+    for etag in (plain, gzipped):
+        event = {"headers": {"accept-encoding": "gzip", "if-none-match": etag}}
+        response = handler.get_prices(event, None)
+        assert response["statusCode"] == 304
+        assert response["headers"]["ETag"] == gzipped
+        assert "Content-Encoding" not in response["headers"]
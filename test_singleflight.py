@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tests for coalescing concurrent cache misses into one scrape, within a
+process and across containers sharing a lease store
+"""
+
+import importlib.util
+import json
+import sys
+import threading
+import time
+import urllib
+import urllib.parse
+
+import pytest
+import requests
+
+import handler
+from breaker import CircuitBreakers
+from cache import InMemoryKeyValueStore, KeyValueBackend, LRUCache, SnapshotCache
+from history import NullHistoryStore
+from singleflight import InMemoryLeaseStore, SingleFlight, create_lease_store
+from stub_server import ANNOUNCEMENT_PATH, LISTING_PATH
+
+BURST = 20
+
+
+def burst(fn, count=BURST):
+    """Call fn(i) from `count` threads released at the same moment; return the results"""
+    start = threading.Barrier(count)
+    results = [None] * count
+
+    def run(i):
+        start.wait()
+        results[i] = fn(i)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"prices": []}
+
+    results = burst(lambda i: flight.do("latest", slow))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"calls": 1, "shared": BURST - 1}
+
+    # Nothing is cached once the call is over
+    flight.do("latest", slow)
+    assert len(calls) == 2
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight()
+
+    def failing():
+        time.sleep(0.1)
+        raise OSError("origin down")
+
+    def call():
+        try:
+            flight.do("latest", failing)
+        except OSError as e:
+            return str(e)
+
+    assert burst(lambda i: call(), 5) == ["origin down"] * 5
+    assert flight.stats()["calls"] == 1
+
+
+def test_leases_are_exclusive_until_released_or_expired():
+    now = [1000.0]
+    leases = InMemoryLeaseStore(clock=lambda: now[0])
+    assert leases.acquire("latest", "a", ttl=30)
+    assert not leases.acquire("latest", "b", ttl=30)
+    assert leases.acquire("latest", "a", ttl=30)  # re-entrant for the holder
+
+    leases.release("latest", "b")  # not the holder: no effect
+    assert leases.holder("latest") == "a"
+    leases.release("latest", "a")
+    assert leases.acquire("latest", "b", ttl=30)
+
+    now[0] += 30
+    assert leases.holder("latest") is None
+    assert leases.acquire("latest", "c", ttl=30)
+
+
+def test_create_lease_store():
+    assert create_lease_store("none").acquire("latest", "a", 30)
+    assert isinstance(create_lease_store("memory"), InMemoryLeaseStore)
+    with pytest.raises(ValueError):
+        create_lease_store("redis")
+
+
+def isolate(module, server, backend, leases):
+    """Point a handler module at the stub, with a shared cache backend and lease store"""
+    module.BERA_URL = server.url(LISTING_PATH)
+    module.price_cache = SnapshotCache(backend, ttl=3600, prepare=module.prepare)
+    module.page_validators = LRUCache()
+    module.history_store = NullHistoryStore()
+    module.breakers = CircuitBreakers()
+    module.scrape_flight = SingleFlight()
+    module.lease_store = leases
+    module.last_announcement_url = None
+    module.SERVE_FROM_STORE = False
+    module.STREAM_LISTING = False
+    module.LEASE_POLL_INTERVAL = 0.01
+    module._session = None
+
+
+@pytest.fixture
+def stub(stub, monkeypatch):
+    # test_simple.py leaves mocks of these in sys.modules; handler copies below re-import them
+    for module in (requests, urllib, urllib.parse):
+        monkeypatch.setitem(sys.modules, module.__name__, module)
+    monkeypatch.setattr(handler, "lease_store", InMemoryLeaseStore())
+    monkeypatch.setattr(handler, "LEASE_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(handler, "_session", None)
+    stub.delay = 0.1
+    return stub
+
+
+def test_burst_of_misses_fetches_the_origin_once(stub):
+    responses = burst(lambda i: handler.get_prices({}, None))
+    assert {response["statusCode"] for response in responses} == {200}
+    assert stub.hits(LISTING_PATH) == 1
+    assert stub.hits(ANNOUNCEMENT_PATH) == 1
+    assert json.loads(responses[-1]["body"])["sourceUrl"] == stub.url(ANNOUNCEMENT_PATH)
+    assert handler.scrape_flight.stats() == {"calls": 1, "shared": BURST - 1}
+
+
+def test_burst_during_an_outage_makes_one_attempt(stub, monkeypatch):
+    monkeypatch.setattr(handler, "HTTP_RETRIES", 0)
+    stub.status = 503
+    responses = burst(lambda i: handler.get_prices({}, None))
+    assert {response["statusCode"] for response in responses} == {503}
+    assert stub.hits(LISTING_PATH) == 1
+    # The error is shared, its headers are not
+    assert len({id(response["headers"]) for response in responses}) == BURST
+
+
+def load_container(name):
+    """A second copy of handler.py with its own globals, like another Lambda container"""
+    spec = importlib.util.spec_from_file_location(name, handler.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_containers_sharing_a_lease_fetch_the_origin_once(stub):
+    backend = KeyValueBackend(InMemoryKeyValueStore())
+    leases = InMemoryLeaseStore()
+    containers = [load_container(f"container_{i}") for i in range(4)]
+    for container in containers:
+        isolate(container, stub, backend, leases)
+
+    responses = burst(lambda i: containers[i % len(containers)].get_prices({}, None))
+    assert {response["statusCode"] for response in responses} == {200}
+    assert stub.hits(LISTING_PATH) == 1
+    assert stub.hits(ANNOUNCEMENT_PATH) == 1
+    assert leases.holder("latest") is None
+
+
+def test_expired_lease_of_a_dead_container_is_taken_over(stub):
+    handler.lease_store.acquire("latest", "dead-container", ttl=0.2)
+    started = time.perf_counter()
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 200
+    assert time.perf_counter() - started >= 0.2
+    assert stub.hits(LISTING_PATH) == 1
+
+
+def test_waiting_gives_up_after_the_lease_wait(stub, monkeypatch):
+    monkeypatch.setattr(handler, "SCRAPE_LEASE_WAIT", 0.1)
+    handler.lease_store.acquire("latest", "slow-container", ttl=30)
+    assert handler.get_prices({}, None)["statusCode"] == 503
+    assert stub.hits(LISTING_PATH) == 0
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for per-stage latency spans and the EMF log line
+"""
+
+import json
+import time
+
+import pytest
+
+import handler
+import timing
+from cache import LRUCache, MemoryBackend, SnapshotCache
+
+
+def emf_lines(output):
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+
+def test_trace_accumulates_spans_and_logs_emf(capsys):
+    with timing.trace("get_prices") as trace:
+        with timing.span("fetch_listing"):
+            time.sleep(0.01)
+        with timing.span("fetch_listing"):
+            pass
+        timing.add_bytes(1024)
+        timing.annotate("cacheStatus", "fresh")
+
+    assert trace.durations["fetch_listing"] >= 10
+    [line] = emf_lines(capsys.readouterr().out)
+    assert line["function"] == "get_prices"
+    assert line["bytesDownloaded"] == 1024
+    assert line["cacheStatus"] == "fresh"
+    assert line["fetch_listing"] >= 10
+    names = [m["Name"] for m in line["_aws"]["CloudWatchMetrics"][0]["Metrics"]]
+    assert names == ["fetch_listing", "total", "bytesDownloaded"]
+
+
+def test_disabled_trace_is_silent_and_cheap(capsys):
+    with timing.trace("get_prices", enabled=False) as trace:
+        assert trace is None
+        start = time.perf_counter()
+        for _ in range(100000):
+            with timing.span("fetch_listing"):
+                pass
+        elapsed = time.perf_counter() - start
+        timing.add_bytes(10)
+
+    assert capsys.readouterr().out == ""
+    assert elapsed < 0.5
+
+
+def test_server_timing_header_format():
+    trace = timing.Trace("get_prices")
+    trace.durations = {"fetch_listing": 12.34, "extract_prices": 1.0}
+    header = trace.server_timing()
+    assert header.startswith("fetch_listing;dur=12.3, extract_prices;dur=1.0, total;dur=")
+
+
+@pytest.fixture
+def stub(stub, monkeypatch):
+    monkeypatch.setattr(handler, "METRICS_ENABLED", True)
+    return stub
+
+
+def test_get_prices_logs_every_stage(stub, capsys, monkeypatch):
+    monkeypatch.setattr(handler, "SERVER_TIMING", True)
+    response = handler.get_prices({}, None)
+    assert response["statusCode"] == 200
+
+    [line] = emf_lines(capsys.readouterr().out)
+    for stage in ("fetch_listing", "find_announcement", "fetch_announcement", "extract_prices", "total"):
+        assert stage in line
+    assert line["bytesDownloaded"] > 1000
+    assert line["cacheStatus"] == "revalidated"
+    assert line["statusCode"] == 200
+    assert "fetch_listing;dur=" in response["headers"]["Server-Timing"]
+
+    handler.get_prices({}, None)
+    [line] = emf_lines(capsys.readouterr().out)
+    assert line["cacheStatus"] == "fresh"
+    assert "fetch_listing" not in line
+
+
+def test_parse_memo_counters_are_logged(stub, capsys, monkeypatch):
+    handler.get_prices({}, None)
+    [line] = emf_lines(capsys.readouterr().out)
+    assert line["parseMemo"] == {"hits": 0, "misses": 1, "size": 1}
+
+    # The same announcement scraped again is not parsed again
+    monkeypatch.setattr(handler, "page_validators", LRUCache())
+    monkeypatch.setattr(handler, "price_cache", SnapshotCache(MemoryBackend(), ttl=3600))
+    handler.get_prices({}, None)
+    [line] = emf_lines(capsys.readouterr().out)
+    assert line["parseMemo"] == {"hits": 1, "misses": 1, "size": 1}
+
+
+def test_server_timing_header_is_optional(stub, capsys):
+    response = handler.get_prices({}, None)
+    assert "Server-Timing" not in response["headers"]
@@ -0,0 +1,100 @@
+import contextlib
+import contextvars
+import json
+import time
+
+# Per-invocation latency spans, logged as one CloudWatch Embedded Metric
+# Format (EMF) line per invocation.
+#
+# Pipeline code calls span(), add_bytes() and annotate() unconditionally.
+# They look up the invocation's trace in a context variable and do nothing
+# when there is none, so with metrics disabled the cost is one lookup.
+
+NAMESPACE = "BotswanaFuelApi"
+
+_current = contextvars.ContextVar("trace", default=None)
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Trace:
+    """Durations, downloaded bytes and properties collected for one invocation"""
+
+    def __init__(self, function):
+        self.function = function
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.bytes_downloaded = 0
+        self.properties = {}
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def total(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def emf(self):
+        """The EMF document for this invocation"""
+        metrics = {name: round(ms, 3) for name, ms in self.durations.items()}
+        metrics["total"] = round(self.total(), 3)
+        definitions = [{"Name": name, "Unit": "Milliseconds"} for name in metrics]
+        definitions.append({"Name": "bytesDownloaded", "Unit": "Bytes"})
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": NAMESPACE,
+                    "Dimensions": [["function"]],
+                    "Metrics": definitions,
+                }],
+            },
+            "function": self.function,
+            **metrics,
+            "bytesDownloaded": self.bytes_downloaded,
+            **self.properties,
+        }
+
+    def server_timing(self):
+        """Server-Timing header value, e.g. 'fetch_listing;dur=120.5, total;dur=130.2'"""
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.durations.items()]
+        entries.append(f"total;dur={self.total():.1f}")
+        return ", ".join(entries)
+
+
+@contextlib.contextmanager
+def trace(function, enabled=True):
+    """Collect spans for the code inside the block, then log them as EMF"""
+    if not enabled:
+        yield None
+        return
+    current = Trace(function)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        _current.reset(token)
+        print(json.dumps(current.emf()))
+
+
+def span(name):
+    """Time a pipeline stage in the current invocation's trace"""
+    current = _current.get()
+    return current.span(name) if current else _NULL_SPAN
+
+
+def add_bytes(count):
+    current = _current.get()
+    if current:
+        current.bytes_downloaded += count
+
+
+def annotate(key, value):
+    """Attach a property (e.g. cache status) to the current invocation's log line"""
+    current = _current.get()
+    if current:
+        current.properties[key] = value